@@ -0,0 +1,48 @@
+"""
+Micro-benchmark for the per-request overhead of the CheckAuth dependency.
+
+Usage: python benchmarks/bench_auth.py
+"""
+
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+import jwt  # noqa: E402
+
+from app.auth.service import _ALGORITHMS, _SIGNING_KEY, create_access_token, token_cache, verify_token  # noqa: E402
+from app.core.config import get_settings  # noqa: E402
+
+settings = get_settings()
+ROUNDS = 20000
+
+
+def _report(label: str, func) -> float:
+    seconds = min(timeit.repeat(func, number=ROUNDS, repeat=3)) / ROUNDS
+    print(f"{label:<40} {seconds * 1e6:8.2f} us/request")
+    return seconds
+
+
+def main():
+    token = create_access_token(data={"sub": "user"})
+
+    try:
+        from jose import jwt as jose_jwt
+
+        _report(
+            "before: python-jose decode", lambda: jose_jwt.decode(token, settings.SECRET_KEY, algorithms=_ALGORITHMS)
+        )
+    except ImportError:
+        print("before: python-jose not installed, skipped")
+
+    uncached = _report("pyjwt decode, no cache", lambda: jwt.decode(token, _SIGNING_KEY, algorithms=_ALGORITHMS))
+
+    token_cache.clear()
+    cached = _report("after: verify_token (LRU hit)", lambda: verify_token(token))
+    print(f"speedup vs. uncached pyjwt: {uncached / cached:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
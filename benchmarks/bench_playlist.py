@@ -0,0 +1,101 @@
+"""
+Benchmark of the IPTV channel index and EPG cache: streaming download and indexing of a large
+playlist and XMLTV guide from a local HTTP stand-in, then latency of searches and now/next queries.
+
+Usage:
+    python benchmarks/bench_playlist.py [--channels 100000] [--guide-channels 1000] [--rounds 50]
+                                        [--output results.json]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import ExitStack
+from pathlib import Path
+from unittest import mock
+
+from harness import PlaylistServer, measure, metadata, print_results
+
+from app.iptv import epg, playlist  # noqa: E402
+
+PORT = 9000
+
+
+def _build(build) -> dict:
+    tracemalloc.start()
+    started_at = time.perf_counter()
+    count = asyncio.run(build)
+    seconds = time.perf_counter() - started_at
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"channels": count, "seconds": round(seconds, 2), "alloc_peak_kib": round(peak / 1024, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--channels", type=int, default=100_000, help="entries of the generated playlist")
+    parser.add_argument("--guide-channels", type=int, default=1000, help="channels with 48 programmes in the EPG")
+    parser.add_argument("--rounds", type=int, default=50)
+    parser.add_argument("--output", type=Path, help="write results as JSON")
+    args = parser.parse_args()
+
+    logging.getLogger("app").setLevel(logging.WARNING)
+
+    with (
+        tempfile.TemporaryDirectory() as tmp,
+        ExitStack() as stack,
+        PlaylistServer(args.channels, args.guide_channels) as server,
+    ):
+        stack.enter_context(mock.patch.object(playlist, "INDEX_DIR", Path(tmp)))
+
+        print(f"indexing {args.channels} channels...", file=sys.stderr)
+        build = _build(playlist.build_index(PORT, server.url))
+        build.update(
+            playlist_mib=round(server.bytes_sent / 2**20, 1),
+            index_mib=round(playlist.index_path(PORT).stat().st_size / 2**20, 1),
+        )
+        print(
+            f"indexed {build['channels']} channels ({build['playlist_mib']} MiB) in {build['seconds']}s, "
+            f"index {build['index_mib']} MiB, peak allocations {build['alloc_peak_kib']} KiB"
+        )
+
+        print(f"caching the EPG of {args.guide_channels} channels...", file=sys.stderr)
+        guide = _build(epg.build_guide(PORT, server.guide_url, epg.DISK_BUDGET))
+        guide.update(
+            guide_mib=round(epg.guide_path(PORT).stat().st_size / 2**20, 1),
+            index_mib=round(epg.epg_index_path(PORT).stat().st_size / 2**20, 1),
+        )
+        print(
+            f"indexed {guide['channels']} programmes in {guide['seconds']}s, gzipped guide {guide['guide_mib']} MiB, "
+            f"index {guide['index_mib']} MiB, peak allocations {guide['alloc_peak_kib']} KiB"
+        )
+
+        index = playlist.channel_indexes.get(PORT)
+        guide_index = epg.guide_indexes.get(PORT)
+        benchmarks = {
+            "channels.first_page": lambda: index.search(),
+            "channels.prefix": lambda: index.search("sports channel 4"),
+            "channels.group": lambda: index.search(group="Movies", offset=5000),
+            "channels.group_prefix": lambda: index.search("kids channel 12", group="Kids"),
+            "channels.groups": index.groups,
+            "channels.reopen": lambda: playlist.channel_indexes.get(PORT),
+            "epg.now_next": lambda: guide_index.now_next(f"ch{args.guide_channels // 2}.example", time.time()),
+            "epg.channels": guide_index.channels,
+        }
+        results = [measure(name, func, rounds=args.rounds) for name, func in benchmarks.items()]
+
+    print_results(results)
+
+    if args.output:
+        report = {"meta": metadata(channels=args.channels, build=build, guide=guide), "results": results}
+        args.output.write_text(json.dumps(report, indent=2))
+        print(f"results written to {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""
+Latency and allocation benchmarks for the service layer, run against fake system backends.
+
+Usage:
+    python benchmarks/bench_services.py [--latency-ms 5] [--rounds 20] [--only clients,iptv]
+                                        [--output results.json] [--baseline previous.json]
+
+--latency-ms is the simulated cost of one command (fork + exec of iw/ip on the device),
+--dbus-latency-ms the cost of one call to the systemd manager,
+--output writes machine-readable results that can be passed as --baseline to a later run.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import tempfile
+from contextlib import ExitStack
+from pathlib import Path
+from unittest import mock
+
+from harness import (
+    FakeBackend,
+    FakePiholeApi,
+    FakeSystemdBus,
+    gluetun_servers_json,
+    ip_address,
+    iw_station_dump,
+    mac_address,
+    measure,
+    metadata,
+    nft_counters,
+    print_results,
+    recording,
+    tracker_history,
+    write_iptv_proxies,
+    write_proxy_cgroups,
+)
+
+from app.clients import service as clients_service  # noqa: E402
+from app.clients.bandwidth import BandwidthMonitor  # noqa: E402
+from app.core.request_cache import request_scope  # noqa: E402
+from app.dashboard.router import get_dashboard_aggregation  # noqa: E402
+from app.device import service as device_service  # noqa: E402
+from app.iptv import service as iptv_service  # noqa: E402
+from app.iptv.resources import ResourceMonitor  # noqa: E402
+from app.vpn.openvpn.service import OpenVPNService  # noqa: E402
+from app.vpn.providers.cyberghost import service as cyberghost_service  # noqa: E402
+
+
+def _build_backend(args) -> FakeBackend:
+    wifi_clients = args.clients // 2
+    backend = FakeBackend(latency=args.latency_ms / 1000)
+    backend.add("iw dev wlan0 station dump", iw_station_dump([mac_address(i) for i in range(wifi_clients)]))
+    backend.add("nft -j list table", nft_counters([ip_address(i) for i in range(args.clients)]))
+    backend.add("ip link show tun0", recording("ip_link_show_tun0.txt"))
+    backend.add("curl", "203.0.113.7")
+    return backend
+
+
+def _build_systemd_bus(args) -> FakeSystemdBus:
+    bus = FakeSystemdBus(latency=args.dbus_latency_ms / 1000)
+    for unit in ("openvpn@client.service", "hostapd.service"):
+        bus.add_unit(unit)
+    for index in range(args.proxies):
+        bus.add_unit(f"iptv-proxy@{9000 + index}.service")
+    return bus
+
+
+def _prepare_fixtures(args, workdir: Path, stack: ExitStack) -> None:
+    tracker_file = workdir / "client_history.json"
+    tracker_file.write_text(json.dumps(tracker_history(args.clients)))
+    stack.enter_context(mock.patch.object(clients_service, "TRACKER_FILE", tracker_file))
+    # Own monitor instance, its sample interval applies across rounds just like across requests
+    stack.enter_context(mock.patch.object(clients_service, "bandwidth_monitor", BandwidthMonitor()))
+
+    service_dir, script_dir = workdir / "systemd", workdir / "bin"
+    service_dir.mkdir()
+    script_dir.mkdir()
+    write_iptv_proxies(args.proxies, service_dir, script_dir)
+    stack.enter_context(mock.patch.object(iptv_service, "SERVICE_DIR", str(service_dir)))
+    stack.enter_context(mock.patch.object(iptv_service, "SCRIPT_DIR", str(script_dir)))
+    cgroup_root = workdir / "cgroup"
+    write_proxy_cgroups(args.proxies, cgroup_root)
+    stack.enter_context(mock.patch.object(iptv_service, "resource_monitor", ResourceMonitor(cgroup_root)))
+
+    servers_file = workdir / "servers.json"
+    servers_file.write_text(json.dumps(gluetun_servers_json(args.servers), indent=2))
+    stack.enter_context(mock.patch.object(cyberghost_service, "SERVER_FILE_PATH", servers_file))
+
+    conf_file = workdir / "client.conf"
+    conf_file.write_text("client\ndev tun\nproto udp\nremote 87-1-de.cg-dialup.net 443\nresolv-retry infinite\n")
+    original_init = OpenVPNService.__init__
+
+    def _init(service):
+        original_init(service)
+        service.conf_path = str(conf_file)
+
+    stack.enter_context(mock.patch.object(OpenVPNService, "__init__", _init))
+
+    # The proxy system user only exists on the device
+    stack.enter_context(mock.patch.object(device_service.pwd, "getpwnam", lambda name: None))
+
+
+async def _in_request(endpoint):
+    # Same request-scoped cache as RequestCacheMiddleware gives every HTTP request
+    with request_scope():
+        return await endpoint()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="simulated latency per command")
+    parser.add_argument("--dbus-latency-ms", type=float, default=0.5, help="simulated latency per systemd call")
+    parser.add_argument("--pihole-latency-ms", type=float, default=20.0, help="simulated latency per FTL API call")
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--clients", type=int, default=1000, help="tracked clients, half of them on WiFi")
+    parser.add_argument("--proxies", type=int, default=100, help="IPTV proxy services")
+    parser.add_argument("--servers", type=int, default=2000, help="entries in the cyberghost servers.json")
+    parser.add_argument("--only", help="comma separated benchmark names")
+    parser.add_argument("--output", type=Path, help="write results as JSON")
+    parser.add_argument("--baseline", type=Path, help="compare against a previous --output file")
+    args = parser.parse_args()
+
+    # run_command logs every call, which would dominate the measurement
+    logging.getLogger("app").setLevel(logging.WARNING)
+
+    benchmarks = {
+        "clients.get_all_clients": lambda: clients_service.ClientService().get_all_clients(),
+        "iptv.get_all_services": iptv_service.get_all_services,
+        "vpn.fetch_cyberghost_server": cyberghost_service.fetch_cyberghost_server,
+        "dashboard": lambda: asyncio.run(_in_request(get_dashboard_aggregation)),
+    }
+    if args.only:
+        selected = args.only.split(",")
+        benchmarks = {name: func for name, func in benchmarks.items() if any(key in name for key in selected)}
+
+    with tempfile.TemporaryDirectory() as tmp, ExitStack() as stack:
+        workdir = Path(tmp)
+        _prepare_fixtures(args, workdir, stack)
+        backend = _build_backend(args)
+        backend.install(stack)
+        pihole = FakePiholeApi(latency=args.pihole_latency_ms / 1000)
+        pihole.install(stack)
+        systemd_bus = _build_systemd_bus(args)
+        systemd_bus.install(stack)
+
+        results = []
+        for name, func in benchmarks.items():
+            print(f"running {name}...", file=sys.stderr)
+            results.append(
+                measure(name, func, rounds=args.rounds, counters=(backend.calls, pihole.calls, systemd_bus.calls))
+            )
+
+    baseline = json.loads(args.baseline.read_text()) if args.baseline else None
+    print_results(results, baseline)
+
+    if args.output:
+        report = {
+            "meta": metadata(
+                latency_ms=args.latency_ms,
+                dbus_latency_ms=args.dbus_latency_ms,
+                pihole_latency_ms=args.pihole_latency_ms,
+                clients=args.clients,
+                proxies=args.proxies,
+                servers=args.servers,
+            ),
+            "results": results,
+        }
+        args.output.write_text(json.dumps(report, indent=2))
+        print(f"results written to {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
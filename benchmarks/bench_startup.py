@@ -0,0 +1,103 @@
+"""
+Import-time profile of the application: cold start wall time and the slowest modules,
+based on 'python -X importtime'.
+
+Usage: python benchmarks/bench_startup.py [--runs 5] [--top 25] [--output results.json]
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+SRC_DIR = Path(__file__).resolve().parents[1] / "src"
+
+
+def _import_once() -> tuple[float, str]:
+    started_at = time.perf_counter()
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        cwd=SRC_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return time.perf_counter() - started_at, process.stderr
+
+
+def parse_importtime(output: str) -> list[dict]:
+    """
+    Parses '-X importtime' lines: 'import time: self [us] | cumulative | imported package'.
+    """
+    modules = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        modules.append(
+            {
+                "module": name.strip(),
+                "depth": (len(name) - len(name.lstrip()) - 1) // 2,
+                "self_ms": int(self_us) / 1000,
+                "cumulative_ms": int(cumulative_us) / 1000,
+            }
+        )
+    return modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=25)
+    parser.add_argument("--output", type=Path, help="write results as JSON")
+    args = parser.parse_args()
+
+    wall_times = []
+    profiles = []
+    for _ in range(args.runs):
+        seconds, output = _import_once()
+        wall_times.append(seconds * 1000)
+        profiles.append({module["module"]: module for module in parse_importtime(output)})
+
+    # Median per module over all runs, the first run also pays for a cold page cache
+    modules = []
+    for name, module in profiles[-1].items():
+        samples = [profile[name] for profile in profiles if name in profile]
+        modules.append(
+            {
+                **module,
+                "self_ms": round(statistics.median(sample["self_ms"] for sample in samples), 2),
+                "cumulative_ms": round(statistics.median(sample["cumulative_ms"] for sample in samples), 2),
+            }
+        )
+
+    app_main = next((module for module in modules if module["module"] == "app.main"), None)
+    print(
+        f"cold start (process + import app.main): median {statistics.median(wall_times):.0f} ms over {args.runs} runs"
+    )
+    if app_main:
+        print(f"import app.main: {app_main['cumulative_ms']:.0f} ms")
+
+    print(f"\n{'cumulative ms':>14} {'self ms':>9}  module")
+    for module in sorted(modules, key=lambda module: -module["cumulative_ms"])[: args.top]:
+        print(f"{module['cumulative_ms']:>14.1f} {module['self_ms']:>9.1f}  {'  ' * module['depth']}{module['module']}")
+
+    print(f"\n{'self ms':>14}  module (own code only)")
+    for module in sorted(modules, key=lambda module: -module["self_ms"])[: args.top]:
+        print(f"{module['self_ms']:>14.1f}  {module['module']}")
+
+    if args.output:
+        report = {
+            "meta": {"python": sys.version.split()[0], "runs": args.runs, "timestamp": int(time.time())},
+            "wall_ms": [round(wall, 1) for wall in wall_times],
+            "modules": modules,
+        }
+        args.output.write_text(json.dumps(report, indent=2))
+        print(f"results written to {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,557 @@
+"""
+Shared infrastructure for the service benchmarks: fake system backends that replay recorded
+command output, synthetic fixture generators and latency/allocation measurement.
+
+Nothing in here touches the real system, every command goes to a FakeBackend and every
+systemd call to a FakeSystemdBus.
+"""
+
+import asyncio
+import fnmatch
+import json
+import math
+import os
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import ExitStack
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+RECORDINGS_DIR = Path(__file__).resolve().parent / "recordings"
+SHIPPED_SERVERS_JSON = Path(__file__).resolve().parents[1] / "src/app/vpn/providers/cyberghost/servers.json"
+
+CommandResult = Tuple[int, str, str]
+
+
+def recording(name: str) -> str:
+    return (RECORDINGS_DIR / name).read_text()
+
+
+# --- Fake backends ---
+
+
+class FakeBackend:
+    """
+    Replays canned (code, stdout, stderr) results for commands, matched by prefix.
+
+    'sudo', 'sudo -u <user>' and absolute program paths are ignored when matching, so
+    "systemctl is-active" matches ["sudo", "/usr/bin/systemctl", "is-active", ...].
+    Every call sleeps `latency` seconds to mimic the fork/exec cost on the target hardware.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls: Counter = Counter()
+        self._rules: List[Tuple[List[str], CommandResult, Optional[float]]] = []
+
+    def add(self, prefix: str, stdout: str = "", code: int = 0, stderr: str = "", latency: Optional[float] = None):
+        # Longer prefixes win, so specific rules can be added after generic ones
+        self._rules.append((prefix.split(), (code, stdout, stderr), latency))
+        self._rules.sort(key=lambda rule: -len(rule[0]))
+        return self
+
+    @staticmethod
+    def normalize(cmd: List[str]) -> List[str]:
+        args = list(cmd)
+        if args and os.path.basename(args[0]) == "sudo":
+            args = args[3:] if len(args) > 2 and args[1] == "-u" else args[1:]
+        if args:
+            args[0] = os.path.basename(args[0])
+        return args
+
+    def run(self, cmd: List[str]) -> CommandResult:
+        args = self.normalize(cmd)
+        for prefix, result, latency in self._rules:
+            if args[: len(prefix)] == prefix:
+                self.calls[" ".join(prefix)] += 1
+                self._sleep(latency)
+                return result
+
+        self.calls[f"unmatched: {' '.join(args[:2])}"] += 1
+        self._sleep(None)
+        return 127, "", f"Command not found: {args[0] if args else ''}"
+
+    def _sleep(self, latency: Optional[float]) -> None:
+        latency = self.latency if latency is None else latency
+        if latency:
+            time.sleep(latency)
+
+    def run_command(self, cmd: List[str], check: bool = False) -> CommandResult:
+        """Drop-in replacement for app.core.utils.run_command."""
+        return self.run(cmd)
+
+    def subprocess_run(self, cmd: List[str], check: bool = False, **_kwargs):
+        """Drop-in replacement for subprocess.run, for modules that call it directly."""
+        code, stdout, stderr = self.run(cmd)
+        if check and code != 0:
+            raise subprocess.CalledProcessError(code, cmd, stdout, stderr)
+        return subprocess.CompletedProcess(cmd, code, stdout, stderr)
+
+    def install(self, stack: ExitStack) -> None:
+        """
+        Patches run_command in every loaded app module that imported it, and subprocess in the
+        modules that call subprocess.run directly.
+        """
+        from app.core import utils
+
+        for name, module in list(sys.modules.items()):
+            if not name.startswith("app."):
+                continue
+            if getattr(module, "run_command", None) is utils.run_command:
+                stack.enter_context(mock.patch.object(module, "run_command", self.run_command))
+            if getattr(module, "subprocess", None) is subprocess:
+                fake = SimpleNamespace(run=self.subprocess_run, CalledProcessError=subprocess.CalledProcessError)
+                stack.enter_context(mock.patch.object(module, "subprocess", fake))
+
+
+class FakePiholeApi:
+    """
+    Replaces PiholeClient._request with recorded FTL responses and a per-call latency.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls: Counter = Counter()
+        self.responses = {
+            ("GET", "/stats/summary"): json.loads(recording("pihole_stats_summary.json")),
+            ("GET", "/dns/blocking"): {"blocking": "enabled", "timer": None},
+        }
+
+    def install(self, stack: ExitStack) -> None:
+        fake = self
+
+        def _request(_client, method, endpoint, json=None, params=None, retry=True):
+            fake.calls[f"{method} {endpoint}"] += 1
+            if fake.latency:
+                time.sleep(fake.latency)
+            return fake.responses.get((method, endpoint), {})
+
+        from app.pihole.client import PiholeClient
+
+        stack.enter_context(mock.patch.object(PiholeClient, "_request", _request))
+
+
+class FakeSystemdBus:
+    """
+    In-memory systemd manager answering the same calls as the D-Bus connection of the unit manager.
+    Every call costs `latency` like a bus round trip, jobs finish after `job_latency` with a
+    JobRemoved signal. Units listed in `failing` end their jobs with 'failed', jobs for units in
+    `missing` are rejected.
+    """
+
+    def __init__(self, latency: float = 0.0, job_latency: float = 0.0):
+        self.latency = latency
+        self.job_latency = job_latency
+        self.calls: Counter = Counter()
+        self.active: Dict[str, str] = {}  # unit -> ActiveState
+        self.unit_files: Dict[str, str] = {}  # unit -> unit file state
+        self.properties: Dict[str, Dict[str, object]] = {}  # unit -> service properties, e.g. NRestarts
+        self.failing: set = set()
+        self.missing: set = set()
+        self.reloads = 0
+        self.on_job_removed = None
+        self._job_ids = iter(range(1, 2**31))
+
+    def add_unit(self, unit: str, active: str = "active", file_state: str = "enabled") -> "FakeSystemdBus":
+        self.active[unit] = active
+        self.unit_files[unit] = file_state
+        return self
+
+    async def connect(self) -> None:
+        pass
+
+    async def call(self, member: str, signature: str = "", *args) -> list:
+        from app.core.systemd import UnitError
+
+        self.calls[f"dbus {member}"] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if member in ("StartUnit", "StopUnit", "RestartUnit", "ReloadOrRestartUnit"):
+            unit = args[0]
+            if unit in self.missing:
+                raise UnitError(f"{member} failed: org.freedesktop.systemd1.NoSuchUnit: Unit {unit} not found.")
+            job_id = next(self._job_ids)
+            job = f"/org/freedesktop/systemd1/job/{job_id}"
+            result = "failed" if unit in self.failing and member != "StopUnit" else "done"
+            self.active[unit] = "inactive" if member == "StopUnit" else ("failed" if result == "failed" else "active")
+            asyncio.get_running_loop().call_later(self.job_latency, self.on_job_removed, job_id, job, unit, result)
+            return [job]
+        if member == "EnableUnitFiles":
+            self.unit_files.update(dict.fromkeys(args[0], "enabled"))
+            return [False, []]
+        if member == "DisableUnitFiles":
+            self.unit_files.update(dict.fromkeys(args[0], "disabled"))
+            return [[]]
+        if member == "UnmaskUnitFiles":
+            self.unit_files.update({unit: "disabled" for unit in args[0] if self.unit_files.get(unit) == "masked"})
+            return [[]]
+        if member == "Reload":
+            self.reloads += 1
+            return []
+        if member == "ListUnitsByNames":
+            return [[[unit, "", "loaded", self.active.get(unit, "inactive")] for unit in args[0]]]
+        if member == "ListUnitFilesByPatterns":
+            matches = [unit for unit in self.unit_files if any(fnmatch.fnmatch(unit, p) for p in args[1])]
+            return [[[f"/etc/systemd/system/{unit}", self.unit_files[unit]] for unit in matches]]
+        if member == "GetUnitFileState":
+            if args[0] not in self.unit_files:
+                raise UnitError(f"{member} failed: org.freedesktop.DBus.Error.FileNotFound")
+            return [self.unit_files[args[0]]]
+        raise UnitError(f"{member} is not implemented by the fake")
+
+    async def unit_properties(self, units: List[str], _interface: str, names: List[str]) -> Dict[str, dict]:
+        self.calls["dbus GetAll"] += len(units)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return {
+            unit: {name: value for name, value in self.properties.get(unit, {}).items() if name in names}
+            for unit in units
+            if unit in self.active
+        }
+
+    async def set_unit_properties(self, unit: str, properties: Dict[str, int]) -> None:
+        self.calls["dbus SetUnitProperties"] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.properties.setdefault(unit, {}).update(properties)
+
+    def install(self, stack: ExitStack) -> None:
+        """
+        Gives every loaded app module that uses the shared unit manager its own manager on this bus.
+        """
+        from app.core import systemd
+
+        shared, manager = systemd.units, systemd.UnitManager(bus_factories=(lambda: self,))
+        for name, module in list(sys.modules.items()):
+            if name.startswith("app.") and getattr(module, "units", None) is shared:
+                stack.enter_context(mock.patch.object(module, "units", manager))
+
+
+# --- Fixture generators ---
+
+
+def mac_address(index: int) -> str:
+    return "02:" + ":".join(f"{(index >> shift) & 0xFF:02x}" for shift in (32, 24, 16, 8, 0))
+
+
+def ip_address(index: int) -> str:
+    return f"10.{(index >> 16) & 0xFF}.{(index >> 8) & 0xFF}.{(index & 0xFF) + 1}"
+
+
+def tracker_history(count: int, now: Optional[int] = None) -> Dict[str, dict]:
+    """
+    Client tracker file content (/tmp/client_history.json) with `count` clients,
+    a third of them offline and a tenth using IPTV.
+    """
+    now = now or int(time.time())
+    history = {}
+    for index in range(count):
+        ip = ip_address(index)
+        last_seen = now - (600 if index % 3 == 0 else 10)
+        types = ["gateway"] + (["iptv"] if index % 10 == 0 else [])
+        history[ip] = {
+            "ip": ip,
+            "mac": mac_address(index),
+            "hostname": f"client-{index}.lan",
+            "first_seen": now - 3600 - index,
+            "last_seen": last_seen,
+            "types": types,
+        }
+    return history
+
+
+def iw_station_dump(macs: List[str]) -> str:
+    """
+    'iw dev wlan0 station dump' output for the given stations, based on the recorded station block.
+    """
+    block = recording("iw_station_dump.txt")
+    return "".join(re.sub(r"^Station \S+", f"Station {mac}", block, count=1) for mac in macs)
+
+
+def nft_counters(ips: List[str]) -> str:
+    """
+    'nft -j list table inet streamcloak_acct' output with byte counters for the given IPs.
+    """
+    sets = []
+    for direction in ("tx", "rx"):
+        elements = [
+            {"elem": {"val": ip, "counter": {"packets": index * 10, "bytes": index * 15000}}}
+            for index, ip in enumerate(ips)
+        ]
+        sets.append({"set": {"family": "inet", "name": direction, "table": "streamcloak_acct", "elem": elements}})
+    return json.dumps({"nftables": [{"metainfo": {"json_schema_version": 1}}, *sets]})
+
+
+def gluetun_servers_json(count: int) -> dict:
+    """
+    Cyberghost section of the gluetun servers.json with `count` servers, cycling the shipped list
+    with unique hostnames. Roughly half of them are usable UDP '87-1-' servers, like upstream.
+    """
+    shipped = json.loads(SHIPPED_SERVERS_JSON.read_text())["cyberghost"]
+    servers = []
+    for index in range(count):
+        server = dict(shipped["servers"][index % len(shipped["servers"])])
+        if index >= len(shipped["servers"]):
+            prefix, _, rest = server["hostname"].partition(".")
+            server["hostname"] = f"{prefix}{index}.{rest}"
+        servers.append(server)
+    return {"cyberghost": {**shipped, "servers": servers}}
+
+
+def write_iptv_proxies(count: int, service_dir: Path, script_dir: Path) -> None:
+    """
+    Writes `count` proxy scripts with the real generator, mixing M3U and Xtream proxies.
+    """
+    from app.iptv import service as iptv_service
+    from app.iptv.schemas import IPTVProxyCreate
+
+    with (
+        mock.patch.object(iptv_service, "SERVICE_DIR", str(service_dir)),
+        mock.patch.object(iptv_service, "SCRIPT_DIR", str(script_dir)),
+    ):
+        for index in range(count):
+            data = {"name": f"Proxy {index}", "user": f"user{index}", "password": "secret", "hostname": "box.lan"}
+            if index % 2:
+                data.update(
+                    xtream_user=f"x{index}", xtream_password="xsecret", xtream_base_url="http://provider.example:8080"
+                )
+            else:
+                data["m3u_url"] = f"http://provider.example/list{index}.m3u"
+            iptv_service._write_service_files(9000 + index, IPTVProxyCreate(**data))
+
+
+def write_proxy_cgroups(count: int, root: Path) -> None:
+    """
+    cgroup v2 directories of `count` running proxy instances below `root` (system.slice),
+    with the files read for resource accounting.
+    """
+    slice_dir = root / "system-iptv\\x2dproxy.slice"
+    for index in range(count):
+        cgroup = slice_dir / f"iptv-proxy@{9000 + index}.service"
+        cgroup.mkdir(parents=True)
+        (cgroup / "cpu.stat").write_text(f"usage_usec {index * 1_000_000}\nuser_usec 0\nsystem_usec 0\n")
+        (cgroup / "memory.current").write_text(f"{(20 + index) * 1024 * 1024}\n")
+        (cgroup / "memory.peak").write_text(f"{(30 + index) * 1024 * 1024}\n")
+        (cgroup / "io.stat").write_text(f"179:0 rbytes={index * 4096} wbytes=0 rios={index} wios=0 dbytes=0 dios=0\n")
+        (cgroup / "pids.current").write_text("7\n")
+
+
+M3U_GROUPS = ("News", "Sports", "Movies", "Kids", "Music", "Documentary", "DE | Regional", "UK | Entertainment")
+
+
+def m3u_playlist(count: int, chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+    """
+    Provider-style #EXTM3U playlist with `count` channels in chunks, without building it in memory.
+    Every 10th entry uses #EXTGRP instead of group-title, every 7th has no tvg-id.
+    """
+    buffer = [b'#EXTM3U x-tvg-url="http://provider.example/epg.xml"\n']
+    size = len(buffer[0])
+    for index in range(count):
+        group = M3U_GROUPS[index % len(M3U_GROUPS)]
+        name = f"{group.split(' | ')[0]} Channel {index} HD"
+        tvg_id = "" if index % 7 == 0 else f'tvg-id="ch{index}.example" '
+        if index % 10 == 0:
+            entry = f'#EXTINF:-1 {tvg_id}tvg-name="{name}",{name}\n#EXTGRP:{group}\n'
+        else:
+            entry = f'#EXTINF:-1 {tvg_id}tvg-name="{name}" tvg-logo="http://logo.example/{index}.png" '
+            entry += f'group-title="{group}",{name}\n'
+        line = f"{entry}http://provider.example:8080/live/user/secret/{index}.ts\n".encode()
+        buffer.append(line)
+        size += len(line)
+        if size >= chunk_size:
+            yield b"".join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield b"".join(buffer)
+
+
+def xmltv_guide(channels: int, hours: int = 48, chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+    """
+    XMLTV guide for the first `channels` channels of m3u_playlist, one programme per hour
+    from 24 hours ago on, in chunks.
+    """
+    start = int(time.time()) // 3600 * 3600 - 24 * 3600
+    buffer = ['<?xml version="1.0" encoding="UTF-8"?>\n<tv generator-info-name="stand-in">\n']
+    size = 0
+    for index in range(channels):
+        buffer.append(f'<channel id="ch{index}.example"><display-name>Channel {index}</display-name></channel>\n')
+    for index in range(channels):
+        for hour in range(hours):
+            begin = time.strftime("%Y%m%d%H%M%S +0000", time.gmtime(start + hour * 3600))
+            end = time.strftime("%Y%m%d%H%M%S +0000", time.gmtime(start + (hour + 1) * 3600))
+            entry = (
+                f'<programme start="{begin}" stop="{end}" channel="ch{index}.example">'
+                f'<title lang="en">Show {hour} &amp; more</title>'
+                f'<desc lang="en">Episode {hour} of the show on channel {index}.</desc></programme>\n'
+            )
+            buffer.append(entry)
+            size += len(entry)
+            if size >= chunk_size:
+                yield "".join(buffer).encode()
+                buffer, size = [], 0
+    buffer.append("</tv>\n")
+    yield "".join(buffer).encode()
+
+
+class PlaylistServer:
+    """
+    Local HTTP stand-in for an IPTV provider. GET /playlist.m3u streams a generated playlist,
+    GET /xmltv.php the guide of its first `guide_channels` channels, both with chunked transfer encoding
+    like most providers do.
+
+    Usage:
+        with PlaylistServer(100_000) as server:
+            url = server.url
+    """
+
+    def __init__(self, channels: int, guide_channels: int = 1000):
+        self.channels = channels
+        self.guide_channels = guide_channels
+        self.requests = 0
+        self.bytes_sent = 0
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_port}/playlist.m3u"
+
+    @property
+    def guide_url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_port}/xmltv.php?username=user&password=secret"
+
+    def __enter__(self) -> "PlaylistServer":
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                stand_in.requests += 1
+                if self.path == "/playlist.m3u":
+                    content_type, chunks = "audio/x-mpegurl", m3u_playlist(stand_in.channels)
+                elif self.path.startswith("/xmltv.php?"):
+                    content_type, chunks = "application/xml", xmltv_guide(stand_in.guide_channels)
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for chunk in chunks:
+                    self.wfile.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+                    stand_in.bytes_sent += len(chunk)
+                self.wfile.write(b"0\r\n\r\n")
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+
+# --- Measurement ---
+
+
+def measure(name: str, func: Callable[[], object], rounds: int, warmup: int = 1, counters=()) -> dict:
+    """
+    Runs func `warmup + rounds` times and returns latency statistics in milliseconds, the fake
+    backend calls of a single run and the allocations of a single run traced with tracemalloc.
+    """
+    for _ in range(warmup):
+        func()
+
+    timings = []
+    for _ in range(rounds):
+        started_at = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started_at) * 1000)
+
+    for counter in counters:
+        counter.clear()
+    tracemalloc.start(10)
+    before = tracemalloc.take_snapshot()
+    func()
+    after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    diff = after.compare_to(before, "traceback")
+    top_sites = [
+        {
+            "site": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+            "size_kib": round(stat.size_diff / 1024, 1),
+        }
+        for stat in sorted(diff, key=lambda stat: -stat.size_diff)[:5]
+        if stat.size_diff > 0
+    ]
+    calls = Counter()
+    for counter in counters:
+        calls.update(counter)
+
+    timings.sort()
+    return {
+        "name": name,
+        "rounds": rounds,
+        "min_ms": round(timings[0], 3),
+        "median_ms": round(statistics.median(timings), 3),
+        "p95_ms": round(timings[math.ceil(len(timings) * 0.95) - 1], 3),
+        "mean_ms": round(statistics.fmean(timings), 3),
+        "alloc_peak_kib": round(peak / 1024, 1),
+        "alloc_blocks": sum(stat.count_diff for stat in diff if stat.count_diff > 0),
+        "alloc_top": top_sites,
+        "backend_calls": dict(calls),
+    }
+
+
+def metadata(**extra) -> dict:
+    try:
+        revision = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = None
+
+    from app.core.config import get_settings
+
+    return {
+        "version": get_settings().VERSION,
+        "revision": revision,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "timestamp": int(time.time()),
+        **extra,
+    }
+
+
+def print_results(results: List[dict], baseline: Optional[dict] = None) -> None:
+    previous = {result["name"]: result for result in (baseline or {}).get("results", [])}
+    print(f"{'benchmark':<28} {'median ms':>10} {'p95 ms':>10} {'peak KiB':>10} {'calls':>6}  {'vs. baseline':>12}")
+    for result in results:
+        delta = ""
+        if result["name"] in previous and previous[result["name"]]["median_ms"]:
+            change = result["median_ms"] / previous[result["name"]]["median_ms"] - 1
+            delta = f"{change:+.1%}"
+        calls = sum(result["backend_calls"].values())
+        print(
+            f"{result['name']:<28} {result['median_ms']:>10.2f} {result['p95_ms']:>10.2f} "
+            f"{result['alloc_peak_kib']:>10.1f} {calls:>6}  {delta:>12}"
+        )
@@ -20,6 +20,8 @@ api_router = APIRouter()
 # 1. Public Routes
 api_router.include_router(health_router.router, prefix="/health", tags=["Healthcheck"])
 api_router.include_router(auth_router.router, prefix="/auth", tags=["Authentication"])
+# Checked with the credentials of the proxy, players cannot log in to the API
+api_router.include_router(iptv_router.player_router, prefix="/iptv", tags=["IPTV Proxy"])
 
 # 2. Protected Routes
 api_router.include_router(
@@ -1,11 +1,34 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Response, status
 
-from app.core.logger import logger
+from app.core.health import DOWN, health_report
+from app.core.startup import readiness
 
 router = APIRouter()
 
 
 @router.get("")
 def health_check():
-    logger.debug("Health check requested")
     return {"status": "ok"}
+
+
+@router.get("/ready")
+def readiness_check(response: Response):
+    """
+    503 until this worker has finished its warm-up, e.g. for a reverse proxy or the setup UI.
+    """
+    if not readiness.ready:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+        return {"status": "warming_up", "steps": readiness.steps}
+    return {"status": "ready", "startup_seconds": readiness.startup_seconds, "steps": readiness.steps}
+
+
+@router.get("/deep")
+def deep_health_check(response: Response):
+    """
+    Status of tun0, the Pi-hole FTL API, hostapd and the disk with per-component latency.
+    Served from the results of the background probes, polling it never starts a process.
+    """
+    report = health_report.get()
+    if report["status"] == DOWN:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    return report
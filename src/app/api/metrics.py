@@ -0,0 +1,14 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from app.core import metrics
+
+router = APIRouter()
+
+
+@router.get("", response_class=PlainTextResponse)
+def get_metrics():
+    """
+    Prometheus text exposition of request, subprocess, Pi-hole API and cache metrics.
+    """
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -4,14 +4,18 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
 
 from app.auth.schemas import Token
-from app.auth.service import check_refresh_eligibility, create_access_token, oauth2_scheme, verify_token
+from app.auth.service import check_refresh_eligibility, create_access_token, logout, oauth2_scheme, verify_token
 from app.core.config import get_settings
+from app.core.rate_limit import RateLimiter, rate_limited
 
 router = APIRouter()
 settings = get_settings()
 
+# 5 attempts at once, then one every 5 seconds and at most 30 per 5 minutes per client IP
+login_limiter = RateLimiter("login", rate=0.2, burst=5, window=300, window_limit=30)
 
-@router.post("/login")
+
+@router.post("/login", dependencies=[rate_limited(login_limiter)])
 async def login(form_data: Annotated[OAuth2PasswordRequestForm, Depends()]):
     if form_data.password != settings.DEVICE_PASSWORD:
         raise HTTPException(
@@ -33,7 +37,23 @@ async def refresh_token(token: Annotated[str, Depends(oauth2_scheme)]):
     if new_token:
         context = {"access_token": new_token, "token_type": "bearer", "status": "refreshed"}
     else:
-        valid_token = verify_token(token)
-        context = {"access_token": valid_token, "token_type": "bearer", "status": "valid"}
+        verify_token(token)
+        context = {"access_token": token, "token_type": "bearer", "status": "valid"}
 
     return Token.model_validate(context)
+
+
+@router.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
+async def logout_session(token: Annotated[str, Depends(oauth2_scheme)]):
+    """
+    Revoke the current token and every token refreshed from the same login.
+    """
+    logout(token)
+
+
+@router.post("/logout-all", status_code=status.HTTP_204_NO_CONTENT)
+async def logout_all_devices(token: Annotated[str, Depends(oauth2_scheme)]):
+    """
+    Revoke every token issued so far, on all devices.
+    """
+    logout(token, all_devices=True)
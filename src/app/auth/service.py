@@ -1,25 +1,106 @@
+import hashlib
+import threading
+import time
+import uuid
+from collections import OrderedDict
 from datetime import datetime, timedelta, timezone
 from typing import Optional
 
+import jwt
 from fastapi import HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from jose import JWTError, jwt
 
+from app.auth.sessions import login_time, session_registry
 from app.core.config import get_settings
 
 settings = get_settings()
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl=f"{settings.API_V1_STR}/auth/login")
 
-
-def create_access_token(data: dict):
+TOKEN_CACHE_SIZE = 256  # verified tokens kept, polling clients reuse the same token thousands of times
+
+# Key material is prepared once instead of on every encode/decode
+_SIGNING_KEY = jwt.get_algorithm_by_name(settings.ALGORITHM).prepare_key(settings.SECRET_KEY)
+_ALGORITHMS = [settings.ALGORITHM]
+
+
+class _VerifiedTokenCache:
+    """
+    Bounded LRU of SHA-256 token digests -> verified claims.
+    Entries are only valid until the token's own 'exp', so a hit is as strict as a full decode.
+    Claims are copied in and out, a caller changing its dict cannot change what the next one reads.
+    """
+
+    def __init__(self, maxsize: int = TOKEN_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries: OrderedDict[bytes, dict] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, digest: bytes) -> Optional[dict]:
+        with self._lock:
+            claims = self._entries.get(digest)
+            if claims is None:
+                return None
+            if claims["exp"] <= time.time():
+                del self._entries[digest]
+                return None
+            self._entries.move_to_end(digest)
+            return dict(claims)
+
+    def put(self, digest: bytes, claims: dict) -> None:
+        with self._lock:
+            self._entries[digest] = dict(claims)
+            self._entries.move_to_end(digest)
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+token_cache = _VerifiedTokenCache()
+
+
+def create_access_token(data: dict, session: Optional[dict] = None):
+    """
+    Issues a token with its own 'jti'. Refreshed tokens pass the claims of the previous token
+    as session to keep its 'sid' and the original login time.
+    """
+    now = time.time()
+    session = session or {}
     to_encode = data.copy()
     expire = datetime.now(timezone.utc) + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
+    to_encode.update(
+        {
+            "exp": expire,
+            "iat": round(now, 3),
+            "jti": uuid.uuid4().hex,
+            "sid": session.get("sid") or uuid.uuid4().hex,
+            "auth_time": int(login_time(session)) if session else int(now),
+        }
+    )
+    encoded_jwt = jwt.encode(to_encode, _SIGNING_KEY, algorithm=settings.ALGORITHM)
     return encoded_jwt
 
 
+def decode_token(token: str) -> dict:
+    """
+    Returns the verified claims of a token, served from the LRU when the token was seen before.
+    Raises jwt.PyJWTError if the token is invalid, expired or revoked.
+    """
+    digest = hashlib.sha256(token.encode()).digest()
+    claims = token_cache.get(digest)
+    if claims is None:
+        claims = jwt.decode(token, _SIGNING_KEY, algorithms=_ALGORITHMS, options={"require": ["exp"]})
+        token_cache.put(digest, claims)
+
+    # Checked on every call, a cached token may have been revoked in the meantime
+    if session_registry.is_revoked(claims):
+        raise jwt.InvalidTokenError("Token has been revoked")
+    return claims
+
+
 def verify_token(token: str):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -28,24 +109,29 @@ def verify_token(token: str):
     )
 
     try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+        payload = decode_token(token)
         username: str = payload.get("sub")
         if username is None:
             raise credentials_exception
         return username
-    except JWTError as e:
+    except jwt.PyJWTError as e:
         raise credentials_exception from e
 
 
 def check_refresh_eligibility(token: str) -> Optional[str]:
     try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+        payload = decode_token(token)
         username: str = payload.get("sub")
         exp_timestamp = payload.get("exp")
 
         if not username or not exp_timestamp:
             return None
 
+        # Refreshing keeps a session alive only up to its maximum age, then a new login is required
+        session_age = time.time() - login_time(payload)
+        if session_age > settings.SESSION_MAX_AGE_DAYS * 86400:
+            return None
+
         now_utc = datetime.now(timezone.utc)
         exp_time = datetime.fromtimestamp(exp_timestamp, tz=timezone.utc)
         remaining_time = exp_time - now_utc
@@ -53,10 +139,29 @@ def check_refresh_eligibility(token: str) -> Optional[str]:
         threshold = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES / 2)
 
         if remaining_time < threshold:
-            new_token = create_access_token(data={"sub": username})
+            new_token = create_access_token(data={"sub": username}, session=payload)
             return new_token
 
         return None
 
-    except JWTError:
+    except jwt.PyJWTError:
         return None
+
+
+def logout(token: str, all_devices: bool = False) -> None:
+    """
+    Revokes the session of the given token, or every token issued so far.
+    """
+    try:
+        claims = decode_token(token)
+    except jwt.PyJWTError as e:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        ) from e
+
+    if all_devices:
+        session_registry.revoke_all()
+    else:
+        session_registry.revoke(claims)
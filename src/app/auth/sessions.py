@@ -0,0 +1,153 @@
+import fcntl
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from app.core.config import get_settings
+from app.core.logger import logger
+
+settings = get_settings()
+
+REVOCATION_FILE = Path("/opt/streamcloak/config/revoked_tokens.log")
+
+
+def login_time(claims: dict) -> float:
+    """
+    Start of the login session of a token. Tokens issued before 'auth_time' was added fall back to
+    their 'iat', the oldest ones without either to the start of their lifetime.
+    """
+    if claims.get("auth_time"):
+        return claims["auth_time"]
+    if claims.get("iat"):
+        return claims["iat"]
+    return claims.get("exp", time.time()) - settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60
+
+
+class SessionRegistry:
+    """
+    Revoked token ids (jti) and session ids (sid) held in memory, backed by an append-only file.
+
+    Each worker keeps its own set and only reads what other workers appended since the last check,
+    so a revocation check costs one stat() and two set lookups. A "logout all devices" is stored
+    as a single cutoff: every token issued before it is revoked.
+
+    File format, one entry per line: "id <jti|sid> <expires_at>" or "all - <cutoff>".
+    """
+
+    def __init__(self, path: Path = REVOCATION_FILE):
+        self.path = path
+        self._revoked: Dict[str, float] = {}  # id -> time after which no token with this id can be valid
+        self._revoked_before = 0.0
+        self._inode: Optional[int] = None
+        self._offset = 0
+        self._lock = threading.Lock()
+
+    def is_revoked(self, claims: dict) -> bool:
+        self.sync()
+        if claims.get("iat", 0) < self._revoked_before:
+            return True
+        return claims.get("jti") in self._revoked or claims.get("sid") in self._revoked
+
+    def revoke(self, claims: dict) -> None:
+        """
+        Revokes the token and every other token of its login session.
+        """
+        session_expires = login_time(claims) + settings.SESSION_MAX_AGE_DAYS * 86400
+        lines = []
+        if claims.get("jti"):
+            lines.append(f"id {claims['jti']} {claims.get('exp', session_expires):.0f}\n")
+        if claims.get("sid"):
+            # Refreshed tokens of this session stay valid up to one token lifetime after the session limit
+            lines.append(f"id {claims['sid']} {session_expires + settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60:.0f}\n")
+        self._append(lines)
+
+    def revoke_all(self) -> None:
+        self._append([f"all - {time.time():.3f}\n"])
+
+    def compact(self) -> None:
+        """
+        Rewrites the file without expired entries. Runs under the file lock, so no append is lost.
+        """
+        try:
+            with open(self.path, "r+") as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                revoked, revoked_before = self._parse(f.read().splitlines())
+
+                now = time.time()
+                kept = [f"id {key} {expires:.0f}\n" for key, expires in revoked.items() if expires > now]
+                if revoked_before:
+                    kept.append(f"all - {revoked_before:.3f}\n")
+
+                tmp_path = self.path.with_suffix(".tmp")
+                with open(tmp_path, "w") as tmp:
+                    tmp.writelines(kept)
+                os.replace(tmp_path, self.path)
+            logger.info(f"Compacted session registry to {len(kept)} entries.")
+        except FileNotFoundError:
+            return
+        except OSError as e:
+            logger.error(f"Cannot compact session registry: {e}")
+
+    def _append(self, lines: List[str]) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        while True:
+            with open(self.path, "a") as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                # A compaction may have replaced the file while we were waiting for the lock
+                if os.fstat(f.fileno()).st_ino != os.stat(self.path).st_ino:
+                    continue
+                f.writelines(lines)
+                break
+        self.sync()
+
+    def sync(self) -> None:
+        """
+        Loads entries appended since the last check, or everything if the file was replaced.
+        """
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return
+
+        if stat.st_ino == self._inode and stat.st_size == self._offset:
+            return
+
+        with self._lock, open(self.path, "rb") as f:
+            # Compare against the opened file, the path may have been replaced since the stat() above
+            stat = os.fstat(f.fileno())
+            if stat.st_ino != self._inode or stat.st_size < self._offset:
+                self._revoked, self._revoked_before = {}, 0.0
+                self._inode, self._offset = stat.st_ino, 0
+
+            f.seek(self._offset)
+            chunk = f.read()
+
+            # Only consume complete lines, a concurrent append may still be in progress
+            end = chunk.rfind(b"\n") + 1
+            revoked, revoked_before = self._parse(chunk[:end].decode().splitlines())
+            self._revoked.update(revoked)
+            self._revoked_before = max(self._revoked_before, revoked_before)
+            self._offset += end
+
+    @staticmethod
+    def _parse(lines: List[str]) -> tuple[Dict[str, float], float]:
+        revoked: Dict[str, float] = {}
+        revoked_before = 0.0
+        for line in lines:
+            parts = line.split()
+            if len(parts) != 3:
+                continue
+            try:
+                value = float(parts[2])
+            except ValueError:
+                continue
+            if parts[0] == "all":
+                revoked_before = max(revoked_before, value)
+            elif parts[0] == "id":
+                revoked[parts[1]] = value
+        return revoked, revoked_before
+
+
+session_registry = SessionRegistry()
@@ -0,0 +1,154 @@
+import json
+import tempfile
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+from app.core.config import get_settings
+from app.core.logger import logger
+from app.core.utils import run_command
+
+settings = get_settings()
+
+NFT_TABLE = "streamcloak_acct"
+SAMPLE_INTERVAL = 5  # in seconds - counters are read at most once per interval, for all clients at once
+RATE_WINDOW = 60  # in seconds - rates are averaged over this sliding window
+
+# Per-client byte counters for forwarded traffic, kept in dynamic sets so one 'nft list table' reads them all.
+# tx = sent by the client (saddr), rx = received by the client (daddr).
+NFT_RULESET = f"""
+table inet {NFT_TABLE} {{
+    set tx {{
+        type ipv4_addr
+        size 4096
+        flags dynamic,timeout
+        timeout 1d
+    }}
+    set rx {{
+        type ipv4_addr
+        size 4096
+        flags dynamic,timeout
+        timeout 1d
+    }}
+    chain forward {{
+        type filter hook forward priority -200; policy accept;
+        ip saddr {{ 10.0.0.0/8, 172.16.0.0/12, 192.168.0.0/16 }} update @tx {{ ip saddr counter }}
+        ip daddr {{ 10.0.0.0/8, 172.16.0.0/12, 192.168.0.0/16 }} update @rx {{ ip daddr counter }}
+    }}
+}}
+"""
+
+Counters = Dict[str, Dict[str, int]]  # ip -> {"rx": bytes, "tx": bytes}
+
+
+def parse_nft_counters(raw: str) -> Counters:
+    """
+    Extracts the per-IP byte counters from 'nft -j list table inet streamcloak_acct' output.
+    """
+    counters: Counters = {}
+    data = json.loads(raw)
+
+    for item in data.get("nftables", []):
+        nft_set = item.get("set")
+        if not nft_set or nft_set.get("name") not in ("rx", "tx"):
+            continue
+
+        direction = nft_set["name"]
+        for element in nft_set.get("elem", []):
+            # Elements with a stateful expression are wrapped: {"elem": {"val": ..., "counter": {...}}}
+            if not isinstance(element, dict) or "elem" not in element:
+                continue
+            ip = element["elem"].get("val")
+            counter = element["elem"].get("counter") or {}
+            if isinstance(ip, str):
+                counters.setdefault(ip, {"rx": 0, "tx": 0})[direction] = counter.get("bytes", 0)
+
+    return counters
+
+
+class BandwidthMonitor:
+    """
+    Reads all client counters with a single nft call per interval and keeps a short
+    sample history to compute rates over a sliding window.
+    """
+
+    def __init__(self):
+        self._samples: Deque[Tuple[float, Counters]] = deque(maxlen=RATE_WINDOW // SAMPLE_INTERVAL + 1)
+        self._lock = threading.Lock()
+        self._last_read: Optional[float] = None  # also set by failed reads, nft is not retried on every request
+
+    def _read_counters(self) -> Optional[Counters]:
+        code, stdout, err = run_command(["sudo", "nft", "-j", "list", "table", "inet", NFT_TABLE])
+        if code != 0:
+            # The table is installed at startup (install_ruleset), requests only read it
+            logger.warning(f"Traffic counters unavailable: {err.strip()}")
+            self._samples.clear()
+            return None
+
+        try:
+            return parse_nft_counters(stdout)
+        except (ValueError, AttributeError) as e:
+            logger.warning(f"Cannot parse nft counters: {e}")
+            return None
+
+    def get_usage(self) -> Optional[Dict[str, dict]]:
+        """
+        Returns rx/tx byte totals and the current rate in bit/s per client IP, None if the counters
+        cannot be read.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if self._last_read is None or now - self._last_read >= SAMPLE_INTERVAL:
+                self._last_read = now
+                counters = self._read_counters()
+                if counters is not None:
+                    self._samples.append((now, counters))
+
+            if not self._samples:
+                return None
+
+            latest_ts, latest = self._samples[-1]
+            base_ts, base = latest_ts, latest
+            previous_samples = list(self._samples)[:-1]
+            if previous_samples:
+                # Oldest sample inside the window, or the previous one if polling is sparser than the window
+                in_window = [sample for sample in previous_samples if latest_ts - sample[0] <= RATE_WINDOW]
+                base_ts, base = in_window[0] if in_window else previous_samples[-1]
+
+        elapsed = latest_ts - base_ts
+        usage = {}
+        for ip, current in latest.items():
+            rate = 0.0
+            if elapsed > 0:
+                previous = base.get(ip, {"rx": 0, "tx": 0})
+                # Counters restart from zero when an element times out, never report negative traffic
+                delta = max(0, current["rx"] - previous["rx"]) + max(0, current["tx"] - previous["tx"])
+                rate = delta * 8 / elapsed
+            usage[ip] = {"rx_bytes": current["rx"], "tx_bytes": current["tx"], "rate_bps": round(rate, 1)}
+        return usage
+
+
+def install_ruleset() -> None:
+    """
+    Installs the accounting table if it is missing. Runs once at startup, in the worker running the
+    scheduler, as the table is shared by all workers.
+    """
+    if settings.ENVIRONMENT == "dev":
+        return
+    code, _, _ = run_command(["sudo", "nft", "list", "table", "inet", NFT_TABLE])
+    if code == 0:
+        return
+
+    with tempfile.NamedTemporaryFile("w", suffix=".nft") as f:
+        f.write(NFT_RULESET)
+        f.flush()
+        code, _, err = run_command(["sudo", "nft", "-f", f.name])
+
+    if code == 0:
+        logger.info(f"Installed nftables accounting table '{NFT_TABLE}'.")
+    else:
+        logger.error(f"Cannot install nftables accounting table: {err}")
+
+
+bandwidth_monitor = BandwidthMonitor()
@@ -62,6 +62,26 @@ class ClientSchema(BaseModel):
         description="True if the device is tagged as an IPTV receiver.",
     )
 
+    rx_bytes: Optional[int] = Field(
+        default=0,
+        title="Received Bytes",
+        description="Bytes forwarded to the device through the box (nftables counter), "
+        "null if the counters are unavailable.",
+    )
+
+    tx_bytes: Optional[int] = Field(
+        default=0,
+        title="Sent Bytes",
+        description="Bytes forwarded from the device through the box (nftables counter), "
+        "null if the counters are unavailable.",
+    )
+
+    rate_bps: Optional[float] = Field(
+        default=0.0,
+        title="Current Rate",
+        description="Combined rx/tx rate in bit/s, averaged over the last minute, null if unavailable.",
+    )
+
     class Config:
         from_attributes = True
         json_schema_extra = {
@@ -74,5 +94,8 @@ class ClientSchema(BaseModel):
                 "wifi": True,
                 "gateway": False,
                 "iptv": False,
+                "rx_bytes": 734003200,
+                "tx_bytes": 52428800,
+                "rate_bps": 2400000.0,
             }
         }
@@ -4,7 +4,9 @@ import socket
 from pathlib import Path
 from typing import Any, Dict, List
 
+from app.clients.bandwidth import bandwidth_monitor
 from app.core.logger import logger
+from app.core.request_cache import request_cached
 from app.core.utils import run_command
 
 TRACKER_FILE = Path("/tmp/client_history.json")
@@ -33,6 +35,7 @@ class ClientService:
             return None
 
     @staticmethod
+    @request_cached("clients.wifi_stations")
     def _get_wifi_stations_raw() -> Dict[str, Dict[str, Any]]:
         """
         Executes 'iw' command to get live WiFi station layer 2 data.
@@ -65,6 +68,7 @@ class ClientService:
         return wifi_data
 
     @staticmethod
+    @request_cached("clients.tracker_history")
     def _get_tracker_history() -> Dict[str, Any]:
         """Reads the JSON history file generated by the background network sniffer."""
         if not TRACKER_FILE.exists():
@@ -139,7 +143,15 @@ class ClientService:
                     "_is_online": True,
                 }
 
-        # 4. Create List and Sort
+        # 4. Attach traffic counters (one batched nft read for all clients), left empty if they are unavailable
+        usage = bandwidth_monitor.get_usage()
+        for client in final_clients_map.values():
+            if usage is None:
+                client.update(rx_bytes=None, tx_bytes=None, rate_bps=None)
+            else:
+                client.update(usage.get(client["device_ip"], {}))
+
+        # 5. Create List and Sort
         output_list = list(final_clients_map.values())
 
         # Sort: Online devices first
@@ -0,0 +1,136 @@
+import threading
+import time
+import weakref
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+from app.core.logger import logger
+from app.core.metrics import register_collector
+
+_caches: "weakref.WeakSet[TTLCache]" = weakref.WeakSet()
+
+
+class _Entry:
+    __slots__ = ("value", "loaded_at", "refreshing")
+
+    def __init__(self, value: Any, loaded_at: float):
+        self.value = value
+        self.loaded_at = loaded_at
+        self.refreshing = False
+
+
+class TTLCache:
+    """
+    Small thread-safe cache with a TTL per key and stale-while-revalidate.
+
+    A value younger than `ttl` is returned as is. Until `ttl + stale_ttl` the stale value is still
+    returned while a background thread reloads it. Older or missing values are loaded synchronously,
+    concurrent callers of the same key wait for a single load.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._entries: Dict[Hashable, _Entry] = {}
+        self._load_locks: Dict[Hashable, threading.Lock] = {}
+        self._lock = threading.Lock()
+        # Bumped by invalidations so in-flight loads cannot store outdated values: per key, and the epoch
+        # for invalidating everything. Loads of other keys are not affected.
+        self._generations: Dict[Hashable, int] = {}
+        self._epoch = 0
+
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refresh_errors = 0
+        _caches.add(self)
+
+    def get(self, key: Hashable, loader: Callable[[], Any], ttl: float, stale_ttl: float = 0.0) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                age = now - entry.loaded_at
+                if age < ttl:
+                    self.hits += 1
+                    return entry.value
+                if age < ttl + stale_ttl:
+                    self.stale_hits += 1
+                    if not entry.refreshing:
+                        entry.refreshing = True
+                        threading.Thread(
+                            target=self._refresh, args=(key, loader, entry, self._generation(key)), daemon=True
+                        ).start()
+                    return entry.value
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+
+        with load_lock:
+            # Another thread may have loaded the value while we were waiting
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and time.monotonic() - entry.loaded_at < ttl:
+                    self.hits += 1
+                    return entry.value
+                self.misses += 1
+                generation = self._generation(key)
+
+            value = loader()
+            self._store(key, value, generation)
+            return value
+
+    def invalidate(self, *keys: Hashable) -> None:
+        """
+        Drops the given keys, or everything if no key is given.
+        """
+        with self._lock:
+            if not keys:
+                self._epoch += 1
+                self._generations.clear()
+                self._entries.clear()
+                return
+            for key in keys:
+                self._generations[key] = self._generations.get(key, 0) + 1
+                self._entries.pop(key, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "name": self.name,
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "refresh_errors": self.refresh_errors,
+            }
+
+    def _generation(self, key: Hashable) -> Tuple[int, int]:
+        return self._epoch, self._generations.get(key, 0)
+
+    def _store(self, key: Hashable, value: Any, generation: Tuple[int, int]) -> None:
+        with self._lock:
+            if generation == self._generation(key):
+                self._entries[key] = _Entry(value, time.monotonic())
+
+    def _refresh(self, key: Hashable, loader: Callable[[], Any], entry: _Entry, generation: Tuple[int, int]) -> None:
+        try:
+            self._store(key, loader(), generation)
+        except Exception as e:
+            logger.warning(f"Background refresh of {self.name}[{key}] failed: {e}")
+            with self._lock:
+                self.refresh_errors += 1
+        finally:
+            # Also when an invalidation discarded the value, else the entry would never be refreshed again
+            with self._lock:
+                entry.refreshing = False
+
+
+def _collect_cache_metrics():
+    stats = [cache.stats() for cache in list(_caches)]
+    for field, documentation in (
+        ("hits", "Fresh cache hits."),
+        ("stale_hits", "Stale cache hits served while refreshing."),
+        ("misses", "Cache misses loaded synchronously."),
+    ):
+        samples = [(f"streamcloak_cache_{field}_total", {"cache": s["name"]}, s[field]) for s in stats]
+        yield f"streamcloak_cache_{field}_total", "counter", documentation, samples
+
+
+register_collector(_collect_cache_metrics)
@@ -20,6 +20,7 @@ class Settings(BaseSettings):
     SECRET_KEY: str = secrets.token_urlsafe(32)
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60
+    SESSION_MAX_AGE_DAYS: int = 30
     DEVICE_ID: str = "SC-DEV1"
     DEVICE_MODEL: str = "V1-PRO"
     DEVICE_PASSWORD: str = "streamcloak"
@@ -29,6 +30,21 @@ class Settings(BaseSettings):
     PIHOLE_API_URL: str = "https://127.0.0.1:8443/api"
     PIHOLE_PASSWORD: str = "streamcloak"
 
+    # --- IPTV ---
+    IPTV_HEALTH_RESTART_AFTER: int = 0  # failed health checks in a row before a proxy is restarted, 0 never restarts
+
+    # --- METRICS ---
+    METRICS_PUBLIC: bool = False  # serve /metrics without authentication, e.g. for a Prometheus on the local network
+
+    # --- LOGGING ---
+    LOG_JSON: bool = True  # one JSON object per line, set to false for human readable logs
+
+    # --- PROFILING ---
+    PROFILING_ENABLED: bool = False  # profile every request, keep those slower than the threshold
+    PROFILING_THRESHOLD_MS: int = 1000
+    PROFILING_INTERVAL_MS: int = 10
+    PROFILING_MAX_PROFILES: int = 20
+
     model_config = SettingsConfigDict(
         env_file=".env", env_file_encoding="utf-8", env_ignore_empty=True, case_sensitive=True, extra="ignore"
     )
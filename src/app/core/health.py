@@ -0,0 +1,180 @@
+import asyncio
+import json
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
+
+from app.core.config import get_settings
+from app.core.logger import logger
+from app.core.startup import lazy_import
+from app.core.systemd import units
+
+requests = lazy_import("requests")
+urllib3 = lazy_import("urllib3")
+
+settings = get_settings()
+
+HEALTH_FILE = Path("/tmp/streamcloak_health.json")
+PROBE_INTERVAL = 30  # in seconds
+PROBE_TIMEOUT = 5  # in seconds - a hanging probe is reported as down instead of delaying the others
+STALE_AFTER = 3 * PROBE_INTERVAL  # in seconds - results older than this are not trusted anymore
+
+DISK_DEGRADED_FREE = 10  # in percent
+DISK_DOWN_FREE = 2  # in percent
+
+OK, DEGRADED, DOWN, DISABLED, UNKNOWN = "ok", "degraded", "down", "disabled", "unknown"
+
+ProbeResult = Tuple[str, str]  # status, detail
+
+
+def probe_tun0() -> ProbeResult:
+    """
+    Reads the interface flags from sysfs, no fork needed. The tunnel only has to be up while the
+    VPN is enabled or running.
+    """
+    from app.vpn.openvpn.service import OPENVPN_UNIT
+
+    state = units.run(units.active_states(OPENVPN_UNIT)).get(OPENVPN_UNIT, "inactive")
+    if state != "active" and not units.run(units.is_enabled(OPENVPN_UNIT)):
+        return DISABLED, "VPN is switched off"
+
+    try:
+        flags = int(Path("/sys/class/net/tun0/flags").read_text().strip(), 16)
+    except FileNotFoundError:
+        return DOWN, "tun0 does not exist"
+    return (OK, "tun0 is up") if flags & 0x1 else (DOWN, "tun0 is down")
+
+
+def probe_ftl() -> ProbeResult:
+    """
+    Any HTTP answer of the FTL API, even 401, means it is reachable.
+    """
+    # Self-signed certificate of the local Pi-hole, like in PiholeClient
+    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+    try:
+        response = requests.get(f"{settings.PIHOLE_API_URL}/auth", timeout=PROBE_TIMEOUT - 1, verify=False)
+    except requests.RequestException as e:
+        return DOWN, f"FTL API unreachable: {e.__class__.__name__}"
+    if response.status_code >= 500:
+        return DEGRADED, f"FTL API answered {response.status_code}"
+    return OK, f"FTL API answered {response.status_code}"
+
+
+def probe_hostapd() -> ProbeResult:
+    from app.wifi.service import HOSTAPD_UNIT, get_wifi_status_file
+
+    if not get_wifi_status_file():
+        return DISABLED, "WiFi is switched off"
+
+    state = units.run(units.active_states(HOSTAPD_UNIT)).get(HOSTAPD_UNIT, "inactive")
+    return (OK, "hostapd is active") if state == "active" else (DOWN, f"hostapd is {state}")
+
+
+def probe_disk() -> ProbeResult:
+    usage = shutil.disk_usage("/")
+    free_percent = usage.free * 100 / usage.total
+    detail = f"{free_percent:.1f}% free ({usage.free // 2**20} MiB)"
+    if free_percent < DISK_DOWN_FREE:
+        return DOWN, detail
+    if free_percent < DISK_DEGRADED_FREE:
+        return DEGRADED, detail
+    return OK, detail
+
+
+PROBES: Dict[str, Callable[[], ProbeResult]] = {
+    "tun0": probe_tun0,
+    "ftl": probe_ftl,
+    "hostapd": probe_hostapd,
+    "disk": probe_disk,
+}
+
+
+async def _run_probe(probe: Callable[[], ProbeResult]) -> dict:
+    started_at = time.perf_counter()
+    try:
+        status, detail = await asyncio.wait_for(asyncio.to_thread(probe), PROBE_TIMEOUT)
+    except asyncio.TimeoutError:
+        status, detail = DOWN, f"probe timed out after {PROBE_TIMEOUT}s"
+    except Exception as e:
+        status, detail = DOWN, f"probe failed: {e}"
+    return {
+        "status": status,
+        "detail": detail,
+        "latency_ms": round((time.perf_counter() - started_at) * 1000, 1),
+        "checked_at": time.time(),
+    }
+
+
+def _overall(components: Dict[str, dict]) -> str:
+    statuses = {component["status"] for component in components.values()}
+    for status in (DOWN, UNKNOWN, DEGRADED):
+        if status in statuses:
+            return status
+    return OK
+
+
+async def run_health_probes(probes: Optional[Dict[str, Callable[[], ProbeResult]]] = None) -> dict:
+    """
+    Scheduler job: runs all probes concurrently and publishes the results for every worker.
+    """
+    probes = probes or PROBES
+    results = await asyncio.gather(*(_run_probe(probe) for probe in probes.values()))
+    report = {"checked_at": time.time(), "components": dict(zip(probes, results, strict=True))}
+
+    tmp_path = HEALTH_FILE.with_suffix(".tmp")
+    try:
+        tmp_path.write_text(json.dumps(report))
+        os.replace(tmp_path, HEALTH_FILE)
+    except OSError as e:
+        logger.error(f"Cannot write health report: {e}")
+
+    for name, component in report["components"].items():
+        if component["status"] in (DOWN, DEGRADED):
+            logger.warning(f"Health probe '{name}' is {component['status']}: {component['detail']}")
+    return report
+
+
+class HealthReport:
+    """
+    Serves the latest probe results from the shared file, re-read only when it changed.
+    """
+
+    def __init__(self, path: Path = HEALTH_FILE):
+        self.path = path
+        self._mtime_ns: Optional[int] = None
+        self._report: Optional[dict] = None
+        self._lock = threading.Lock()
+
+    def get(self) -> dict:
+        with self._lock:
+            try:
+                mtime_ns = os.stat(self.path).st_mtime_ns
+                if mtime_ns != self._mtime_ns:
+                    self._report = json.loads(self.path.read_text())
+                    self._mtime_ns = mtime_ns
+            except (OSError, ValueError):
+                self._report, self._mtime_ns = None, None
+            report = self._report
+
+        now = time.time()
+        if report is None:
+            return {"status": UNKNOWN, "checked_at": None, "age_seconds": None, "components": {}}
+
+        components = {name: dict(component) for name, component in report["components"].items()}
+        for component in components.values():
+            if now - component["checked_at"] > STALE_AFTER:
+                component["status"] = UNKNOWN
+                component["detail"] = f"stale result: {component['detail']}"
+
+        return {
+            "status": _overall(components),
+            "checked_at": report["checked_at"],
+            "age_seconds": round(now - report["checked_at"], 1),
+            "components": components,
+        }
+
+
+health_report = HealthReport()
@@ -1,21 +1,149 @@
+import atexit
+import json
 import logging
+import queue
 import sys
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional, Tuple
 
 from app.core.config import get_settings
 
 settings = get_settings()
 
 LOG_FORMAT = "%(asctime)s [%(levelname)s] [%(name)s] %(message)s"
+REQUEST_ID_HEADER = "X-Request-ID"
+
+# Repeated messages (same logger, level, call site and text) beyond the burst are dropped for the rest of the window
+LOG_RATE_WINDOW = 60  # in seconds
+LOG_RATE_BURST = 10
+
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+# Attributes every LogRecord has, everything else was passed via extra={...} and ends up in the JSON
+_RESERVED_ATTRS = set(logging.LogRecord("", 0, "", 0, "", (), None).__dict__) | {"message", "asctime", "request_id"}
+
+_listener: Optional[QueueListener] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line: ts, level, logger, msg, request_id and any extra fields.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class RequestContextFilter(logging.Filter):
+    """
+    Tags records with the ID of the request they were logged in.
+    Runs in the calling thread, before the record is queued and the context is lost.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Lets through at most `burst` identical records per `window`. Records are keyed by the line that
+    logged them and the formatted message, a call logging a different port or unit every time is not
+    silenced by another. The number of dropped records is attached to the first record of the next
+    window. Errors and the access log always pass.
+    """
+
+    def __init__(self, window: float = LOG_RATE_WINDOW, burst: int = LOG_RATE_BURST, exempt=("app.access",)):
+        super().__init__()
+        self.window = window
+        self.burst = burst
+        self.exempt = set(exempt)
+        self._counters: Dict[Tuple[str, int, str, int, str], list] = {}  # key -> [window_start, count, suppressed]
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.ERROR or record.name in self.exempt:
+            return True
+
+        key = (record.name, record.levelno, record.pathname, record.lineno, record.getMessage())
+        now = time.monotonic()
+        with self._lock:
+            counter = self._counters.get(key)
+            if counter is None or now - counter[0] >= self.window:
+                if len(self._counters) > 1024:
+                    self._counters.clear()
+                suppressed = counter[2] if counter else 0
+                self._counters[key] = [now, 1, 0]
+                if suppressed:
+                    record.suppressed = suppressed
+                return True
+
+            counter[1] += 1
+            if counter[1] <= self.burst:
+                return True
+            counter[2] += 1
+            return False
+
+
+def _is_health_check(path: str) -> bool:
+    # /api/v1/health and everything below it, like /api/v1/health/ready
+    prefix = f"{settings.API_V1_STR}/health"
+    return path == prefix or path.startswith(f"{prefix}/")
+
+
+def _stop_listener() -> None:
+    if _listener is not None:
+        _listener.stop()
+
+
+# Registered once, setup_logging() may run several times and replaces the listener
+atexit.register(_stop_listener)
 
 
 def setup_logging():
-    logging.basicConfig(
-        level=logging.INFO,
-        format=LOG_FORMAT,
-        handlers=[logging.StreamHandler(sys.stdout)],
-    )
+    """
+    Routes all records through a queue, the actual I/O happens in a listener thread
+    so a slow stdout/journald never blocks a request.
+    """
+    global _listener
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JsonFormatter() if settings.LOG_JSON else logging.Formatter(LOG_FORMAT))
+
+    queue_handler = QueueHandler(queue.SimpleQueue())
+    queue_handler.addFilter(RequestContextFilter())
+    queue_handler.addFilter(RateLimitFilter())
+
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(logging.INFO)
+
+    if _listener is not None:
+        _listener.stop()
+    _listener = QueueListener(queue_handler.queue, stream_handler, respect_handler_level=True)
+    _listener.start()
 
     logging.getLogger("uvicorn.access").handlers = []
+    # Replaced by the access log of RequestLoggingMiddleware, which has the request ID and duration
+    logging.getLogger("uvicorn.access").disabled = True
     logging.getLogger("uvicorn.error").handlers = []
 
     logger = logging.getLogger("app")
@@ -24,3 +152,58 @@ def setup_logging():
 
 
 logger = logging.getLogger("app")
+access_logger = logging.getLogger("app.access")
+
+
+class RequestLoggingMiddleware:
+    """
+    Assigns every request an ID (taken from the X-Request-ID header if present), returns it in the
+    response and writes one access log record with status and duration at the end.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for name, value in scope["headers"]:
+            if name == b"x-request-id":
+                request_id = value.decode("latin-1")[:64]
+                break
+        request_id = request_id or uuid.uuid4().hex[:16]
+        token = request_id_var.set(request_id)
+
+        started_at = time.perf_counter()
+        status_code = 500
+
+        async def send_with_id(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message["headers"] = [*message.get("headers", []), (REQUEST_ID_HEADER.encode(), request_id.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            duration_ms = round((time.perf_counter() - started_at) * 1000, 1)
+            # Health checks are polled every few seconds, only failures are worth an entry in prod
+            level = logging.DEBUG if _is_health_check(scope["path"]) and status_code < 400 else logging.INFO
+            access_logger.log(
+                level,
+                "%s %s %s",
+                scope["method"],
+                scope["path"],
+                status_code,
+                extra={
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "status": status_code,
+                    "duration_ms": duration_ms,
+                },
+            )
+            request_id_var.reset(token)
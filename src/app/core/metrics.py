@@ -0,0 +1,348 @@
+import bisect
+import json
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from app.core.logger import logger
+
+# Every worker publishes its values to this directory, a scrape answered by any worker adds them all up
+SNAPSHOT_DIR = Path("/tmp/streamcloak_metrics")
+SNAPSHOT_INTERVAL = 5  # in seconds - the values of the other workers are at most this old
+
+# Upper bounds in seconds, tuned for a Raspberry Pi: most requests are fast, forks and FTL calls are not
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+Sample = Tuple[str, Dict[str, str], float]  # name, labels, value
+Family = Tuple[str, str, str, List[Sample]]  # name, type, help, samples
+
+_metrics: List["_Metric"] = []
+_collectors: List[Callable[[], Iterable[Family]]] = []
+_snapshot_path: Optional[Path] = None
+_snapshot_stop = threading.Event()
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(str(value))}"' for key, value in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _CounterChild:
+    __slots__ = ("_value", "_lock")
+
+    def __init__(self):
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self._value += amount
+
+
+class _HistogramChild:
+    __slots__ = ("_buckets", "_counts", "_sum", "_lock")
+
+    def __init__(self, buckets: Sequence[float]):
+        self._buckets = buckets
+        self._counts = [0] * (len(buckets) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self._buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+
+
+class _Metric(ABC):
+    """
+    Base for labelled metrics. Every label combination gets its own child with its own lock,
+    so concurrent requests on different routes never contend.
+    """
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def labels(self, *values: str):
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    @abstractmethod
+    def _new_child(self):
+        pass
+
+    @abstractmethod
+    def samples(self) -> List[Sample]:
+        pass
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self) -> _CounterChild:
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+    def samples(self) -> List[Sample]:
+        return [
+            (self.name, dict(zip(self.labelnames, values, strict=True)), child._value)
+            for values, child in list(self._children.items())
+        ]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self) -> _HistogramChild:
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def samples(self) -> List[Sample]:
+        samples = []
+        for values, child in list(self._children.items()):
+            labels = dict(zip(self.labelnames, values, strict=True))
+            with child._lock:
+                counts, total = list(child._counts), child._sum
+
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), counts, strict=True):
+                cumulative += count
+                samples.append((f"{self.name}_bucket", {**labels, "le": _format_value(bound)}, cumulative))
+            samples.append((f"{self.name}_sum", labels, total))
+            samples.append((f"{self.name}_count", labels, cumulative))
+        return samples
+
+
+def register_collector(collector: Callable[[], Iterable[Family]]) -> None:
+    """
+    Registers a callback that yields (name, type, help, samples) at scrape time,
+    for values that already live elsewhere (e.g. cache statistics).
+    """
+    _collectors.append(collector)
+
+
+def _families() -> List[Family]:
+    families = [(metric.name, metric.kind, metric.documentation, metric.samples()) for metric in _metrics]
+    for collector in _collectors:
+        families.extend(collector())
+    return families
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _read_snapshots(directory: Path, own_path: Path) -> List[Family]:
+    """
+    The published values of the other workers. Snapshots of workers that died are removed, their counts
+    drop out of the totals like after a restart, which Prometheus handles as a counter reset.
+    """
+    families = []
+    for path in directory.glob("*.json"):
+        if path == own_path or not path.stem.isdigit():
+            continue
+        if not _pid_alive(int(path.stem)):
+            path.unlink(missing_ok=True)
+            continue
+        try:
+            families.extend(json.loads(path.read_text()))
+        except (OSError, ValueError):
+            continue  # removed or replaced meanwhile
+    return families
+
+
+def _merge(families: List[Family]) -> List[Family]:
+    """
+    Adds up the samples with the same name and labels, keeping the order in which they first appear.
+    """
+    merged: Dict[str, Tuple[str, str, Dict[Tuple[str, tuple], float]]] = {}
+    for name, kind, documentation, samples in families:
+        values = merged.setdefault(name, (kind, documentation, {}))[2]
+        for sample_name, labels, value in samples:
+            key = (sample_name, tuple(labels.items()))
+            values[key] = values.get(key, 0) + value
+    return [
+        (
+            name,
+            kind,
+            documentation,
+            [(sample_name, dict(labels), value) for (sample_name, labels), value in values.items()],
+        )
+        for name, (kind, documentation, values) in merged.items()
+    ]
+
+
+def _publish_snapshots(path: Path) -> None:
+    tmp_path = path.with_suffix(".tmp")
+    published = None
+    while not _snapshot_stop.wait(SNAPSHOT_INTERVAL):
+        snapshot = json.dumps(_families())
+        # An idle worker keeps its last snapshot instead of rewriting it every interval
+        if snapshot == published:
+            continue
+        try:
+            tmp_path.write_text(snapshot)
+            os.replace(tmp_path, path)
+            published = snapshot
+        except OSError as e:
+            logger.warning(f"Cannot publish metrics of worker {os.getpid()}: {e}")
+
+
+def start_snapshots(directory: Path = SNAPSHOT_DIR) -> None:
+    """
+    Called by every worker at startup: publishes its values periodically, so that /metrics reports
+    the totals of all workers and not just of the one that answered the scrape.
+    """
+    global _snapshot_path
+    if _snapshot_path is not None:
+        return
+    directory.mkdir(parents=True, exist_ok=True)
+    _snapshot_path = directory / f"{os.getpid()}.json"
+    _snapshot_stop.clear()
+    threading.Thread(target=_publish_snapshots, args=(_snapshot_path,), name="metrics-snapshots", daemon=True).start()
+
+
+def stop_snapshots() -> None:
+    global _snapshot_path
+    if _snapshot_path is None:
+        return
+    _snapshot_stop.set()
+    _snapshot_path.unlink(missing_ok=True)
+    _snapshot_path = None
+
+
+def render() -> str:
+    """
+    Renders all metrics in the Prometheus text exposition format (version 0.0.4), summed over all workers.
+    """
+    families = _families()
+    if _snapshot_path is not None:
+        families = _merge(families + _read_snapshots(_snapshot_path.parent, _snapshot_path))
+
+    lines = []
+    for name, kind, documentation, samples in families:
+        lines.append(f"# HELP {name} {documentation}")
+        lines.append(f"# TYPE {name} {kind}")
+        for sample_name, labels, value in samples:
+            lines.append(f"{sample_name}{_format_labels(labels)} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+REQUEST_LATENCY = Histogram(
+    "streamcloak_http_request_duration_seconds", "HTTP request latency per route.", ["method", "route"]
+)
+REQUESTS = Counter(
+    "streamcloak_http_requests_total", "HTTP requests per route and status.", ["method", "route", "status"]
+)
+COMMAND_DURATION = Histogram(
+    "streamcloak_command_duration_seconds", "Duration of subprocesses started via run_command.", ["command"]
+)
+COMMANDS = Counter("streamcloak_commands_total", "Subprocesses started via run_command.", ["command", "exit_code"])
+UNIT_JOB_DURATION = Histogram(
+    "streamcloak_unit_job_duration_seconds", "Time from queueing a systemd job until it finished.", ["method"]
+)
+UNIT_JOBS = Counter("streamcloak_unit_jobs_total", "systemd jobs queued via the unit manager.", ["method", "result"])
+PIHOLE_API_REQUESTS = Counter(
+    "streamcloak_pihole_api_requests_total", "Requests sent to the Pi-hole FTL API.", ["method", "endpoint", "status"]
+)
+
+
+def command_label(cmd: Sequence[str]) -> str:
+    """
+    Low-cardinality label for a command: program name plus subcommand, e.g. 'systemctl restart'.
+    'sudo' and 'sudo -u <user>' prefixes, options and paths are left out.
+    """
+    args = list(cmd)
+    if args and os.path.basename(args[0]) == "sudo":
+        args = args[3:] if len(args) > 2 and args[1] == "-u" else args[1:]
+    if not args:
+        return "unknown"
+
+    label = os.path.basename(args[0])
+    if len(args) > 1 and not args[1].startswith("-") and "/" not in args[1]:
+        label += f" {args[1]}"
+    return label
+
+
+def _route_template(scope) -> str:
+    """
+    Path template of the matched route, e.g. '/api/v1/iptv/{port}', which keeps the label cardinality low.
+    Newer FastAPI versions resolve included routers lazily and keep the full path in a separate context.
+    """
+    context = scope.get("fastapi", {}).get("effective_route_context")
+    if context is not None:
+        return context.path_format
+    route = scope.get("route")
+    return getattr(route, "path_format", None) or "unmatched"
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware recording latency and status per route template.
+    Avoids the extra task and memory stream of BaseHTTPMiddleware on every request.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started_at = time.perf_counter()
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route_label = _route_template(scope)
+            REQUEST_LATENCY.labels(scope["method"], route_label).observe(time.perf_counter() - started_at)
+            REQUESTS.labels(scope["method"], route_label, str(status_code)).inc()
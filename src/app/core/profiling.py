@@ -0,0 +1,292 @@
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from app.core.config import get_settings
+from app.core.logger import logger
+
+settings = get_settings()
+
+PROFILE_HEADER = "x-profile"  # set to any value by an authenticated client to profile that request
+PROFILE_ID_HEADER = "X-Profile-Id"
+# Shared by all workers, a profile can be downloaded from whichever worker answers
+PROFILE_DIR = Path("/tmp/streamcloak_profiles")
+
+# Leaf functions of threads that are just waiting, their stacks would drown out the real work
+_IDLE_FILES = ("threading.py", "selectors.py", "queue.py", "base_events.py")
+
+Stack = Tuple[str, ...]  # root first
+
+
+class _Session:
+    __slots__ = ("stacks", "samples", "concurrent")
+
+    def __init__(self):
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.concurrent = 1  # most sessions sampled at once, their stacks are mixed as threads are not per request
+
+
+class _Sampler:
+    """
+    One background thread for all profiled requests, only alive while at least one is in flight.
+    Each tick snapshots the stacks of all busy threads (event loop and threadpool workers) and adds
+    them to every active session. The threads cannot be told apart by request, so sessions that
+    overlap get each other's stacks as well, each session records how many overlapped.
+    """
+
+    def __init__(self):
+        self._sessions: List[_Session] = []
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._frame_names: Dict[object, str] = {}
+
+    def start(self) -> _Session:
+        session = _Session()
+        with self._lock:
+            self._sessions.append(session)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+                self._thread.start()
+        return session
+
+    def stop(self, session: _Session) -> None:
+        """
+        After this the session is not updated anymore and can be read without the lock.
+        """
+        with self._lock:
+            self._sessions.remove(session)
+
+    def _run(self) -> None:
+        interval = settings.PROFILING_INTERVAL_MS / 1000
+        own_id = threading.get_ident()
+        while True:
+            with self._lock:
+                if not self._sessions:
+                    self._thread = None
+                    return
+
+            stacks = [
+                self._stack(frame)
+                for thread_id, frame in sys._current_frames().items()
+                if thread_id != own_id and not frame.f_code.co_filename.endswith(_IDLE_FILES)
+            ]
+            # Updated under the lock, a session that was stopped meanwhile is being read by its request
+            with self._lock:
+                for session in self._sessions:
+                    session.samples += 1
+                    session.stacks.update(stacks)
+                    session.concurrent = max(session.concurrent, len(self._sessions))
+
+            time.sleep(interval)
+
+    def _stack(self, frame) -> Stack:
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            name = self._frame_names.get(code)
+            if name is None:
+                name = self._frame_names[code] = (
+                    f"{code.co_name} ({_short_path(code.co_filename)}:{code.co_firstlineno})"
+                )
+            stack.append(name)
+            frame = frame.f_back
+        stack.reverse()
+        return tuple(stack)
+
+
+def _short_path(filename: str) -> str:
+    for marker in ("site-packages" + os.sep, os.sep + "src" + os.sep):
+        index = filename.rfind(marker)
+        if index != -1:
+            return filename[index + len(marker) :]
+    return os.path.basename(filename)
+
+
+class ProfileStore:
+    """
+    The most recent request profiles of all workers, one JSON file each in a shared directory like
+    the metrics snapshots. Beyond `maxlen` the oldest ones are dropped first.
+    """
+
+    def __init__(self, directory: Path, maxlen: int):
+        self.directory = directory
+        self.maxlen = maxlen
+
+    def _path(self, profile_id: str) -> Optional[Path]:
+        # IDs come from the URL, never leave the directory
+        return self.directory / f"{profile_id}.json" if profile_id.isalnum() else None
+
+    def _paths(self) -> List[Path]:
+        """
+        Newest first.
+        """
+        entries = []
+        for path in self.directory.glob("*.json"):
+            try:
+                entries.append((path.stat().st_mtime_ns, path))
+            except OSError:
+                continue  # dropped by another worker meanwhile
+        return [path for _mtime, path in sorted(entries, reverse=True)]
+
+    def add(self, profile: dict) -> None:
+        path = self._path(profile["id"])
+        tmp_path = path.with_suffix(".tmp")
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            tmp_path.write_text(json.dumps(profile))
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Cannot store profile {profile['id']}: {e}")
+            return
+        for old_path in self._paths()[self.maxlen :]:
+            old_path.unlink(missing_ok=True)
+
+    def list(self) -> List[dict]:
+        profiles = []
+        for path in self._paths():
+            try:
+                profile = json.loads(path.read_text())
+            except (OSError, ValueError):
+                continue
+            profiles.append({key: value for key, value in profile.items() if key != "stacks"})
+        return profiles
+
+    def get(self, profile_id: str) -> Optional[dict]:
+        path = self._path(profile_id)
+        try:
+            return json.loads(path.read_text()) if path else None
+        except (OSError, ValueError):
+            return None
+
+    def clear(self) -> None:
+        for path in self.directory.glob("*.json"):
+            path.unlink(missing_ok=True)
+
+
+sampler = _Sampler()
+profile_store = ProfileStore(PROFILE_DIR, settings.PROFILING_MAX_PROFILES)
+
+
+def to_collapsed(profile: dict) -> str:
+    """
+    Brendan Gregg's collapsed stack format, one 'frame;frame;frame count' line per stack.
+    The format has no room for a note on concurrent requests, see concurrent_requests of the summary.
+    """
+    return "".join(f"{stack} {count}\n" for stack, count in profile["stacks"].items())
+
+
+def to_speedscope(profile: dict) -> dict:
+    """
+    Sampled profile in the speedscope file format (https://www.speedscope.app).
+    """
+    frame_index: Dict[str, int] = {}
+    frames = []
+    concurrent = profile.get("concurrent_requests", 1)
+    overlap = f", includes the stacks of {concurrent - 1} concurrent requests" if concurrent > 1 else ""
+    samples = []
+    weights = []
+    for stack, count in profile["stacks"].items():
+        indexes = []
+        for name in stack.split(";"):
+            if name not in frame_index:
+                frame_index[name] = len(frames)
+                frames.append({"name": name})
+            indexes.append(frame_index[name])
+        samples.append(indexes)
+        weights.append(count * profile["interval_ms"])
+
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "shared": {"frames": frames},
+        "profiles": [
+            {
+                "type": "sampled",
+                "name": f"{profile['method']} {profile['path']}",
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": sum(weights),
+                "samples": samples,
+                "weights": weights,
+            }
+        ],
+        "name": f"{profile['method']} {profile['path']} ({profile['duration_ms']} ms{overlap})",
+        "exporter": f"{settings.PROJECT_NAME} {settings.VERSION}",
+    }
+
+
+def _is_authenticated(scope) -> bool:
+    from app.auth.service import decode_token
+
+    for name, value in scope["headers"]:
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() != "bearer":
+                return False
+            try:
+                decode_token(token)
+                return True
+            except Exception:
+                return False
+    return False
+
+
+class ProfilingMiddleware:
+    """
+    Samples the stacks of requests slower than PROFILING_THRESHOLD_MS when PROFILING_ENABLED is set.
+    Authenticated clients can profile single requests with the 'X-Profile' header, these are kept
+    regardless of their duration. Requests that are not profiled pass through untouched.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        requested = any(name == PROFILE_HEADER.encode() for name, _ in scope["headers"])
+        if requested:
+            requested = _is_authenticated(scope)
+        if not (requested or settings.PROFILING_ENABLED):
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = uuid.uuid4().hex[:12]
+
+        async def send_with_id(message):
+            if requested and message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", []), (PROFILE_ID_HEADER.encode(), profile_id.encode())]
+            await send(message)
+
+        session = sampler.start()
+        started_at = time.time()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            sampler.stop(session)
+            duration_ms = round((time.time() - started_at) * 1000, 1)
+            if requested or duration_ms >= settings.PROFILING_THRESHOLD_MS:
+                await asyncio.to_thread(
+                    profile_store.add,
+                    {
+                        "id": profile_id,
+                        "method": scope["method"],
+                        "path": scope["path"],
+                        "started_at": started_at,
+                        "duration_ms": duration_ms,
+                        "samples": session.samples,
+                        "interval_ms": settings.PROFILING_INTERVAL_MS,
+                        "concurrent_requests": session.concurrent,
+                        "stacks": {";".join(stack): count for stack, count in session.stacks.items()},
+                    },
+                )
+                logger.info(f"Captured profile {profile_id} of {scope['method']} {scope['path']} ({duration_ms} ms)")
@@ -0,0 +1,143 @@
+import asyncio
+import fcntl
+import json
+import math
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+from fastapi import Depends, HTTPException, Request, status
+
+from app.core.logger import logger
+
+# Buckets are shared by all workers, one file per limiter
+RATE_LIMIT_DIR = Path("/tmp/streamcloak_rate_limits")
+
+
+class _Bucket:
+    __slots__ = ("tokens", "updated_at", "window_start", "window_count", "previous_count")
+
+    def __init__(self, tokens: float, now: float):
+        self.tokens = tokens
+        self.updated_at = now
+        self.window_start = now
+        self.window_count = 0
+        self.previous_count = 0
+
+    def dump(self) -> list:
+        return [self.tokens, self.updated_at, self.window_start, self.window_count, self.previous_count]
+
+    @classmethod
+    def load(cls, values: list) -> "_Bucket":
+        bucket = cls(0, 0)
+        bucket.tokens, bucket.updated_at, bucket.window_start, bucket.window_count, bucket.previous_count = values
+        return bucket
+
+
+class RateLimiter:
+    """
+    Rate limiter keyed by e.g. client IP, shared by all workers: the buckets are kept in a file that is
+    read and rewritten under flock on every hit. The limited routes are rare, like logins, so the file
+    access costs nothing noticeable, and a client cannot get N times the limit from N workers.
+
+    Every key has a token bucket (`burst` requests at once, refilled at `rate` per second) and an
+    optional sliding-window cap of `window_limit` requests per `window` seconds, approximated from the
+    current and the previous fixed window. Memory is bounded by `max_keys`; the least recently used
+    key is evicted first, which for idle keys is the same as a full bucket.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        rate: float,
+        burst: int,
+        window: float = 0.0,
+        window_limit: int = 0,
+        max_keys: int = 1024,
+        path: Optional[Path] = None,
+    ):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.window = window
+        self.window_limit = window_limit
+        self.max_keys = max_keys
+        self.path = path or RATE_LIMIT_DIR / f"{name}.json"
+        self._lock = threading.Lock()
+
+    def hit(self, key: str) -> float:
+        """
+        Consumes one request for the key.
+        Returns 0 if it is allowed, otherwise the seconds until the next request would be.
+        """
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock, open(self.path, "a+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            f.seek(0)
+            try:
+                buckets = OrderedDict((k, _Bucket.load(v)) for k, v in json.loads(f.read() or "{}").items())
+            except (ValueError, TypeError):
+                buckets = OrderedDict()  # cut short by a crash, every client starts with a full bucket
+
+            retry_after = self._consume(buckets, key, time.time())
+
+            f.seek(0)
+            f.truncate()
+            json.dump({k: bucket.dump() for k, bucket in buckets.items()}, f)
+        return retry_after
+
+    def _consume(self, buckets: OrderedDict, key: str, now: float) -> float:
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = buckets[key] = _Bucket(self.burst, now)
+            if len(buckets) > self.max_keys:
+                buckets.popitem(last=False)
+        else:
+            buckets.move_to_end(key)
+
+        # Wall clock, it is the same for all workers. A clock set back refills nothing.
+        bucket.tokens = min(self.burst, bucket.tokens + max(0.0, now - bucket.updated_at) * self.rate)
+        bucket.updated_at = now
+
+        if bucket.tokens < 1:
+            return (1 - bucket.tokens) / self.rate
+
+        if self.window_limit:
+            elapsed = max(0.0, now - bucket.window_start)
+            if elapsed >= self.window:
+                # Roll over; a gap longer than two windows leaves nothing to carry over
+                bucket.previous_count = bucket.window_count if elapsed < 2 * self.window else 0
+                bucket.window_count = 0
+                bucket.window_start = now - elapsed % self.window
+                elapsed = now - bucket.window_start
+
+            weight = 1 - elapsed / self.window
+            if bucket.previous_count * weight + bucket.window_count >= self.window_limit:
+                return self.window - elapsed
+
+            bucket.window_count += 1
+
+        bucket.tokens -= 1
+        return 0.0
+
+
+def rate_limited(limiter: RateLimiter):
+    """
+    FastAPI dependency that answers 429 once the client IP exceeds the limiter.
+    Usage: @router.post("/path", dependencies=[rate_limited(limiter)])
+    """
+
+    async def check_rate_limit(request: Request) -> None:
+        client_ip = request.client.host if request.client else "unknown"
+        retry_after = await asyncio.to_thread(limiter.hit, client_ip)
+        if retry_after:
+            logger.debug(f"Rate limit '{limiter.name}' exceeded by {client_ip}")
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many requests, please try again later.",
+                headers={"Retry-After": str(math.ceil(retry_after))},
+            )
+
+    return Depends(check_rate_limit)
@@ -0,0 +1,88 @@
+import functools
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Hashable, Optional
+
+# One dict per request. Threadpool workers run with a copy of the request context,
+# which still points to the same dict, so sync endpoints share it with the event loop.
+_store: ContextVar[Optional[Dict[Hashable, Any]]] = ContextVar("request_cache", default=None)
+
+
+def request_cached(namespace: str, key: Optional[Callable[..., Hashable]] = None):
+    """
+    Memoizes a function for the duration of the current request.
+    Outside of a request (scheduler jobs, startup) every call goes through.
+
+    `key` maps the call arguments to the cache key, by default all arguments are used.
+    Methods should pass a key without `self`, their services are created per call.
+    Cached values are shared between callers and must not be mutated.
+
+    Usage:
+        @request_cached("openvpn.config", key=lambda self: self.conf_path)
+        def get_remote_address(self) -> str: ...
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            store = _store.get()
+            if store is None:
+                return func(*args, **kwargs)
+
+            cache_key = (namespace, key(*args, **kwargs) if key else (args, tuple(sorted(kwargs.items()))))
+            try:
+                return store[cache_key]
+            except KeyError:
+                pass
+
+            value = func(*args, **kwargs)
+            store[cache_key] = value
+            return value
+
+        return wrapper
+
+    return decorator
+
+
+def invalidate(*namespaces: str) -> None:
+    """
+    Drops the cached results of the given namespaces, or everything if none is given.
+    Call it after writes, so the rest of the request reads the new state.
+    """
+    store = _store.get()
+    if not store:
+        return
+    if not namespaces:
+        store.clear()
+        return
+    for cache_key in [cache_key for cache_key in store if cache_key[0] in namespaces]:
+        store.pop(cache_key, None)
+
+
+@contextmanager
+def request_scope():
+    """
+    Opens a cache scope outside of HTTP requests, e.g. for a scheduler job.
+    """
+    token = _store.set({})
+    try:
+        yield
+    finally:
+        _store.reset(token)
+
+
+class RequestCacheMiddleware:
+    """
+    Gives every HTTP request its own empty cache.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        with request_scope():
+            await self.app(scope, receive, send)
@@ -0,0 +1,76 @@
+import asyncio
+import importlib.util
+import sys
+import time
+from types import ModuleType
+from typing import Callable, Dict, List, Optional, Tuple
+
+from app.core.logger import logger
+
+_lazy_modules: Dict[str, ModuleType] = {}
+
+
+def lazy_import(name: str) -> ModuleType:
+    """
+    Returns a module that is only executed on first attribute access.
+    Keeps heavy dependencies that are only needed by some endpoints out of the startup path.
+
+    Usage: requests = lazy_import("requests")
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named '{name}'", name=name)
+
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    _lazy_modules[name] = module
+    return module
+
+
+def load_lazy_modules() -> None:
+    """
+    Executes all lazily imported modules, so the first request does not pay for them.
+    """
+    for module in list(_lazy_modules.values()):
+        module.__name__  # noqa: B018 - any attribute access executes the module
+
+
+class Readiness:
+    """
+    Tracks the warm-up of this worker. /health answers as soon as the process runs,
+    /health/ready only once the warm-up steps are done.
+    """
+
+    def __init__(self):
+        self.ready = False
+        self.startup_seconds: Optional[float] = None  # from process start until ready
+        self.steps: Dict[str, float] = {}  # step -> duration in seconds
+
+    async def warm_up(self, steps: List[Tuple[str, Callable[[], object]]]) -> None:
+        """
+        Runs the blocking warm-up steps in a worker thread, one after another.
+        A failing step is logged and does not keep the worker from becoming ready.
+        """
+        for name, step in steps:
+            started_at = time.monotonic()
+            try:
+                await asyncio.to_thread(step)
+            except Exception as e:
+                logger.warning(f"Warm-up step '{name}' failed: {e}")
+            self.steps[name] = round(time.monotonic() - started_at, 3)
+
+        import psutil
+
+        # Measured from the process creation, so interpreter start and imports are included
+        self.startup_seconds = round(time.time() - psutil.Process().create_time(), 3)
+        self.ready = True
+        logger.info(f"Worker ready after {self.startup_seconds}s")
+
+
+readiness = Readiness()
@@ -0,0 +1,466 @@
+import asyncio
+import itertools
+import os
+import threading
+import time
+from typing import Callable, Coroutine, Dict, Iterable, Optional, Sequence
+
+from app.core.logger import logger
+from app.core.metrics import UNIT_JOB_DURATION, UNIT_JOBS
+from app.core.utils import run_command
+
+SYSTEMD_BUS_NAME = "org.freedesktop.systemd1"
+MANAGER_PATH = "/org/freedesktop/systemd1"
+MANAGER_INTERFACE = "org.freedesktop.systemd1.Manager"
+SERVICE_INTERFACE = "org.freedesktop.systemd1.Service"
+JOB_REMOVED_MATCH = (
+    f"type='signal',sender='{SYSTEMD_BUS_NAME}',interface='{MANAGER_INTERFACE}',member='JobRemoved',"
+    f"path='{MANAGER_PATH}'"
+)
+
+JOB_MODE = "replace"
+JOB_TIMEOUT = 90  # in seconds - systemd's default start timeout, a job taking longer is reported as 'timeout'
+CALL_TIMEOUT = 25  # in seconds - the D-Bus default for method calls
+UNLIMITED = 2**64 - 1  # 'infinity' of uint64 resource control properties like MemoryMax
+
+# 'systemctl is-enabled' exits with 0 for all of these
+ENABLED_STATES = {"enabled", "enabled-runtime", "static", "alias", "indirect", "generated"}
+
+# JobRemoved signals that arrived before the reply with the job path was processed
+FINISHED_JOBS_KEPT = 256
+
+
+class UnitError(RuntimeError):
+    """
+    A call to the systemd manager was rejected, e.g. unknown unit or missing permission.
+    """
+
+
+class DbusSystemdBus:
+    """
+    Connection to the systemd manager on the system bus. The bus needs root or a polkit rule
+    for org.freedesktop.systemd1.manage-units and manage-unit-files.
+    """
+
+    def __init__(self):
+        self.on_job_removed: Optional[Callable[[int, str, str, str], None]] = None
+        self._bus = None
+
+    async def connect(self) -> None:
+        from dbus_fast import BusType
+        from dbus_fast.aio import MessageBus
+
+        self._bus = await MessageBus(bus_type=BusType.SYSTEM).connect()
+        self._bus.add_message_handler(self._on_message)
+        await self._call(
+            "org.freedesktop.DBus", "/org/freedesktop/DBus", "org.freedesktop.DBus", "AddMatch", "s", JOB_REMOVED_MATCH
+        )
+        # Without a subscription systemd does not emit job signals
+        await self.call("Subscribe")
+
+    async def call(self, member: str, signature: str = "", *args) -> list:
+        return await self._call(SYSTEMD_BUS_NAME, MANAGER_PATH, MANAGER_INTERFACE, member, signature, *args)
+
+    async def _call(self, destination: str, path: str, interface: str, member: str, signature: str, *args) -> list:
+        from dbus_fast import Message, MessageType
+
+        message = Message(
+            destination=destination, path=path, interface=interface, member=member, signature=signature, body=list(args)
+        )
+        reply = await asyncio.wait_for(self._bus.call(message), CALL_TIMEOUT)
+        if reply.message_type == MessageType.ERROR:
+            detail = reply.body[0] if reply.body else reply.error_name
+            raise UnitError(f"{member} failed: {reply.error_name}: {detail}")
+        return reply.body
+
+    async def unit_properties(
+        self, units: Sequence[str], interface: str, names: Sequence[str]
+    ) -> Dict[str, Dict[str, object]]:
+        async def read(unit: str) -> Optional[Dict[str, object]]:
+            try:
+                (path,) = await self.call("GetUnit", "s", unit)
+            except UnitError:
+                return None  # not loaded, e.g. a stopped on-demand proxy
+            (properties,) = await self._call(
+                SYSTEMD_BUS_NAME, path, "org.freedesktop.DBus.Properties", "GetAll", "s", interface
+            )
+            return {name: properties[name].value for name in names if name in properties}
+
+        results = await asyncio.gather(*(read(unit) for unit in units))
+        return {unit: result for unit, result in zip(units, results, strict=True) if result is not None}
+
+    async def set_unit_properties(self, unit: str, properties: Dict[str, int]) -> None:
+        from dbus_fast import Variant
+
+        # runtime=False: systemd persists them as drop-ins in /etc/systemd/system.control
+        await self.call(
+            "SetUnitProperties",
+            "sba(sv)",
+            unit,
+            False,
+            [[name, Variant("t", value)] for name, value in properties.items()],
+        )
+
+    def _on_message(self, message) -> bool:
+        if message.member == "JobRemoved" and message.interface == MANAGER_INTERFACE and self.on_job_removed:
+            self.on_job_removed(*message.body)
+        return False
+
+
+class SystemctlBus:
+    """
+    Fallback for systems without dbus-fast or without access to the system bus. Translates the
+    manager calls into systemctl commands, a job is reported as removed as soon as systemctl returns.
+    """
+
+    SYSTEMCTL = ["sudo", "/usr/bin/systemctl"]
+    JOB_COMMANDS = {
+        "StartUnit": "start",
+        "StopUnit": "stop",
+        "RestartUnit": "restart",
+        "ReloadOrRestartUnit": "reload-or-restart",
+    }
+    FILE_COMMANDS = {"EnableUnitFiles": "enable", "DisableUnitFiles": "disable", "UnmaskUnitFiles": "unmask"}
+
+    def __init__(self):
+        self.on_job_removed: Optional[Callable[[int, str, str, str], None]] = None
+        self._job_ids = itertools.count(1)
+
+    async def connect(self) -> None:
+        pass
+
+    async def call(self, member: str, signature: str = "", *args) -> list:
+        if member in self.JOB_COMMANDS:
+            unit = args[0]
+            code, _, _ = await asyncio.to_thread(run_command, [*self.SYSTEMCTL, self.JOB_COMMANDS[member], unit])
+            job_id = next(self._job_ids)
+            job = f"{MANAGER_PATH}/job/local{job_id}"
+            asyncio.get_running_loop().call_soon(
+                self.on_job_removed, job_id, job, unit, "done" if code == 0 else "failed"
+            )
+            return [job]
+
+        if member in self.FILE_COMMANDS:
+            # Reload is requested separately, like over D-Bus
+            await self._systemctl(self.FILE_COMMANDS[member], "--no-reload", *args[0])
+            return [False, []] if member == "EnableUnitFiles" else [[]]
+        if member == "Reload":
+            await self._systemctl("daemon-reload")
+            return []
+        if member == "Subscribe":
+            return []
+        if member == "ListUnitsByNames":
+            stdout = await self._systemctl("show", "--property=Id,LoadState,ActiveState,SubState", *args[0])
+            units = []
+            for block in stdout.split("\n\n"):
+                props = dict(line.split("=", 1) for line in block.splitlines() if "=" in line)
+                if props.get("Id"):
+                    # Same field order as the D-Bus reply, the unused ones are left empty
+                    units.append([props["Id"], "", props.get("LoadState", ""), props.get("ActiveState", "inactive")])
+            return [units]
+        if member == "ListUnitFilesByPatterns":
+            stdout = await self._systemctl("list-unit-files", "--no-legend", "--no-pager", *args[1])
+            return [[line.split()[:2] for line in stdout.splitlines() if len(line.split()) >= 2]]
+        if member == "GetUnitFileState":
+            code, stdout, stderr = await asyncio.to_thread(run_command, [*self.SYSTEMCTL, "is-enabled", args[0]])
+            if not stdout:
+                raise UnitError(f"GetUnitFileState failed: {stderr}")
+            return [stdout]
+        raise UnitError(f"{member} is not supported without D-Bus")
+
+    async def unit_properties(
+        self, units: Sequence[str], _interface: str, names: Sequence[str]
+    ) -> Dict[str, Dict[str, object]]:
+        stdout = await self._systemctl("show", f"--property=Id,LoadState,{','.join(names)}", *units)
+        results = {}
+        for block in stdout.split("\n\n"):
+            props = dict(line.split("=", 1) for line in block.splitlines() if "=" in line)
+            if props.get("Id") and props.get("LoadState") == "loaded":
+                # Numbers are typed over D-Bus, 'systemctl show' prints them as text
+                results[props["Id"]] = {
+                    name: int(props[name]) if props[name].isdigit() else props[name] for name in names if name in props
+                }
+        return results
+
+    async def set_unit_properties(self, unit: str, properties: Dict[str, int]) -> None:
+        assignments = []
+        for name, value in properties.items():
+            if name == "CPUQuotaPerSecUSec":
+                # Not assignable by systemctl, CPUQuota takes the same limit in percent
+                assignments.append("CPUQuota=" if value == UNLIMITED else f"CPUQuota={value / 10_000:g}%")
+            else:
+                assignments.append(f"{name}={'infinity' if value == UNLIMITED else value}")
+        await self._systemctl("set-property", unit, *assignments)
+
+    async def _systemctl(self, *args: str) -> str:
+        code, stdout, stderr = await asyncio.to_thread(run_command, [*self.SYSTEMCTL, *args])
+        if code != 0:
+            raise UnitError(f"systemctl {args[0]} failed: {stderr}")
+        return stdout
+
+
+class UnitManager:
+    """
+    Controls systemd units for all services of the box.
+
+    Start, stop and restart are queued as systemd jobs and awaited via their JobRemoved signal,
+    enabling, disabling and unmasking several units is one call followed by one daemon-reload.
+    Reload requests that arrive while a reload is running share the next one.
+
+    The connection lives on its own event loop thread, so the manager can be awaited from any loop
+    and called from the threadpool via run():
+
+        await units.restart("hostapd.service")
+        units.run(units.restart("hostapd.service"))
+    """
+
+    def __init__(self, bus_factories: Sequence[Callable[[], object]] = (DbusSystemdBus, SystemctlBus)):
+        self.bus_factories = bus_factories
+        self._bus = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._thread_lock = threading.Lock()
+        self._connect_lock = asyncio.Lock()
+        self._reload_lock = asyncio.Lock()
+        self._reloads_started = 0
+        self._jobs: Dict[str, asyncio.Future] = {}  # job path -> waiter
+        self._finished: Dict[str, str] = {}  # job path -> result
+
+    # --- Event loop ---
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._thread_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, name="systemd-bus", daemon=True)
+                self._thread.start()
+            return self._loop
+
+    async def _dispatch(self, coro: Coroutine):
+        loop = self._ensure_loop()
+        if asyncio.get_running_loop() is loop:
+            return await coro
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, loop))
+
+    def run(self, coro: Coroutine):
+        """
+        Blocking bridge for sync code, e.g. endpoints running in the threadpool.
+        """
+        loop = self._ensure_loop()
+        if threading.current_thread() is self._thread:
+            coro.close()
+            raise RuntimeError("UnitManager.run() called from the bus loop, await the coroutine instead")
+        return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+    async def _get_bus(self):
+        if self._bus is not None:
+            return self._bus
+        async with self._connect_lock:
+            if self._bus is not None:
+                return self._bus
+            for factory in self.bus_factories:
+                bus = factory()
+                bus.on_job_removed = self._on_job_removed
+                try:
+                    await bus.connect()
+                except Exception as e:
+                    logger.warning(f"Cannot connect to systemd via {type(bus).__name__}: {e}")
+                    continue
+                logger.info(f"Controlling systemd units via {type(bus).__name__}")
+                self._bus = bus
+                return bus
+        raise UnitError("No connection to systemd available")
+
+    # --- Jobs ---
+
+    def _on_job_removed(self, _job_id: int, job: str, _unit: str, result: str) -> None:
+        waiter = self._jobs.pop(job, None)
+        if waiter is not None:
+            if not waiter.done():
+                waiter.set_result(result)
+            return
+        # Either a job of another client or the reply to our call is still queued behind this signal
+        self._finished[job] = result
+        if len(self._finished) > FINISHED_JOBS_KEPT:
+            self._finished.pop(next(iter(self._finished)))
+
+    async def _run_job(self, method: str, unit: str, timeout: float) -> str:
+        bus = await self._get_bus()
+        started_at = time.monotonic()
+        try:
+            (job,) = await bus.call(method, "ss", unit, JOB_MODE)
+        except UnitError as e:
+            logger.error(f"{method} {unit} rejected: {e}")
+            result = "error"
+        else:
+            result = self._finished.pop(job, None)
+            if result is None:
+                waiter = asyncio.get_running_loop().create_future()
+                self._jobs[job] = waiter
+                try:
+                    result = await asyncio.wait_for(waiter, timeout)
+                except asyncio.TimeoutError:
+                    result = "timeout"
+                finally:
+                    self._jobs.pop(job, None)
+
+        UNIT_JOB_DURATION.labels(method).observe(time.monotonic() - started_at)
+        UNIT_JOBS.labels(method, result).inc()
+        if result != "done":
+            logger.warning(f"{method} {unit} finished with result '{result}'")
+        return result
+
+    async def _run_jobs(self, method: str, units: Iterable[str], timeout: float) -> bool:
+        results = await asyncio.gather(*(self._run_job(method, unit, timeout) for unit in units))
+        return all(result == "done" for result in results)
+
+    async def start(self, *units: str, timeout: float = JOB_TIMEOUT) -> bool:
+        """
+        Starts the units concurrently, True if every job finished with 'done'.
+        """
+        return await self._dispatch(self._run_jobs("StartUnit", units, timeout))
+
+    async def start_each(self, *units: str, timeout: float = JOB_TIMEOUT) -> Dict[str, str]:
+        """
+        Starts the units concurrently and returns the job result per unit, e.g. {'a.service': 'done'}.
+        """
+
+        async def run() -> Dict[str, str]:
+            results = await asyncio.gather(*(self._run_job("StartUnit", unit, timeout) for unit in units))
+            return dict(zip(units, results, strict=True))
+
+        return await self._dispatch(run())
+
+    async def stop(self, *units: str, timeout: float = JOB_TIMEOUT) -> bool:
+        return await self._dispatch(self._run_jobs("StopUnit", units, timeout))
+
+    async def restart(self, *units: str, timeout: float = JOB_TIMEOUT) -> bool:
+        return await self._dispatch(self._run_jobs("RestartUnit", units, timeout))
+
+    async def reload_or_restart(self, *units: str, timeout: float = JOB_TIMEOUT) -> bool:
+        """
+        Runs ExecReload= of the running units, e.g. a SIGHUP to re-read their configuration, and starts the others.
+        """
+        return await self._dispatch(self._run_jobs("ReloadOrRestartUnit", units, timeout))
+
+    # --- Unit files ---
+
+    async def _reload(self) -> None:
+        requested_at = self._reloads_started
+        async with self._reload_lock:
+            # A reload that started after our request has already picked up our changes
+            if self._reloads_started > requested_at:
+                return
+            self._reloads_started += 1
+            bus = await self._get_bus()
+            await bus.call("Reload")
+
+    async def _unit_files(self, method: str, signature: str, units: Sequence[str], reload: bool, *flags) -> None:
+        bus = await self._get_bus()
+        await bus.call(method, signature, list(units), *flags)
+        if reload:
+            await self._reload()
+
+    async def daemon_reload(self) -> None:
+        await self._dispatch(self._reload())
+
+    async def enable(self, *units: str, reload: bool = True) -> None:
+        """
+        Enables all units with one call and one daemon-reload. Raises UnitError on failure.
+        """
+        await self._dispatch(self._unit_files("EnableUnitFiles", "asbb", units, reload, False, True))
+
+    async def disable(self, *units: str, reload: bool = True) -> None:
+        await self._dispatch(self._unit_files("DisableUnitFiles", "asb", units, reload, False))
+
+    async def unmask(self, *units: str, reload: bool = True) -> None:
+        await self._dispatch(self._unit_files("UnmaskUnitFiles", "asb", units, reload, False))
+
+    # --- State ---
+
+    async def _active_states(self, units: Sequence[str]) -> Dict[str, str]:
+        bus = await self._get_bus()
+        (entries,) = await bus.call("ListUnitsByNames", "as", list(units))
+        return {entry[0]: entry[3] for entry in entries}
+
+    async def active_states(self, *units: str) -> Dict[str, str]:
+        """
+        ActiveState of all units with one call, e.g. {'hostapd.service': 'active'}.
+        """
+        return await self._dispatch(self._active_states(units))
+
+    async def is_active(self, unit: str) -> bool:
+        """
+        False if the state cannot be read, like 'systemctl is-active'.
+        """
+        try:
+            states = await self.active_states(unit)
+        except UnitError as e:
+            logger.warning(f"Cannot read the state of {unit}: {e}")
+            return False
+        return states.get(unit) == "active"
+
+    async def _unit_properties(
+        self, units: Sequence[str], names: Sequence[str], interface: str
+    ) -> Dict[str, Dict[str, object]]:
+        bus = await self._get_bus()
+        return await bus.unit_properties(units, interface, names)
+
+    async def unit_properties(
+        self, units: Sequence[str], names: Sequence[str], interface: str = SERVICE_INTERFACE
+    ) -> Dict[str, Dict[str, object]]:
+        """
+        Selected properties of the loaded units, e.g. {'hostapd.service': {'NRestarts': 0}}.
+        Units that are not loaded are left out.
+        """
+        return await self._dispatch(self._unit_properties(units, names, interface))
+
+    async def _set_properties(self, unit: str, properties: Dict[str, Optional[int]]) -> None:
+        bus = await self._get_bus()
+        await bus.set_unit_properties(
+            unit, {name: UNLIMITED if value is None else value for name, value in properties.items()}
+        )
+
+    async def set_properties(self, unit: str, properties: Dict[str, Optional[int]]) -> None:
+        """
+        Sets numeric resource control properties like 'systemctl set-property', e.g. {'MemoryMax': 268435456}.
+        They apply to the running unit at once and are persisted without a daemon-reload, None removes the limit.
+        Raises UnitError on failure.
+        """
+        await self._dispatch(self._set_properties(unit, properties))
+
+    async def _unit_file_states(self, patterns: Sequence[str]) -> Dict[str, str]:
+        bus = await self._get_bus()
+        (entries,) = await bus.call("ListUnitFilesByPatterns", "asas", [], list(patterns))
+        return {os.path.basename(path): state for path, state in entries}
+
+    async def unit_file_states(self, *patterns: str) -> Dict[str, str]:
+        """
+        Enablement state of all unit files matching the glob patterns, e.g. {'iptv-proxy-9000.service': 'enabled'}.
+        """
+        return await self._dispatch(self._unit_file_states(patterns))
+
+    async def _unit_file_state(self, unit: str) -> Optional[str]:
+        bus = await self._get_bus()
+        try:
+            (state,) = await bus.call("GetUnitFileState", "s", unit)
+        except UnitError:
+            return None
+        return state
+
+    async def is_enabled(self, unit: str) -> bool:
+        return await self._dispatch(self._unit_file_state(unit)) in ENABLED_STATES
+
+    async def _enablement(self, units: Sequence[str]) -> Dict[str, Optional[str]]:
+        states = await asyncio.gather(*(self._unit_file_state(unit) for unit in units))
+        return dict(zip(units, states, strict=True))
+
+    async def enablement(self, *units: str) -> Dict[str, Optional[str]]:
+        """
+        Unit file state per unit, None for unknown units. Unlike unit_file_states() this covers
+        instances of templates, which are not listed as unit files of their own.
+        """
+        return await self._dispatch(self._enablement(units))
+
+
+units = UnitManager()
@@ -1,12 +1,19 @@
 import subprocess
+import time
 from typing import List, Tuple
 
 from app.core.logger import logger
+from app.core.metrics import COMMAND_DURATION, COMMANDS, command_label
 
 
 def run_command(cmd: List[str], check: bool = False) -> Tuple[int, str, str]:
     cmd_str = " ".join(cmd)
-    logger.info(f"Executing command: {cmd_str}")
+    # Every fork passes here, lazy formatting keeps this free when debug logging is off
+    logger.debug("Executing command: %s", cmd_str)
+
+    label = command_label(cmd)
+    started_at = time.perf_counter()
+    returncode = -1
 
     try:
         process = subprocess.run(
@@ -16,8 +23,14 @@ def run_command(cmd: List[str], check: bool = False) -> Tuple[int, str, str]:
             check=check,  # raises CalledProcessError on error if true
         )
 
+        returncode = process.returncode
         if process.returncode != 0:
-            logger.warning(f"Command failed ({process.returncode}): {process.stderr.strip()}")
+            logger.warning(
+                "Command failed (%s): %s",
+                process.returncode,
+                process.stderr.strip(),
+                extra={"command": label, "duration_ms": round((time.perf_counter() - started_at) * 1000, 1)},
+            )
 
         return process.returncode, process.stdout.strip(), process.stderr.strip()
 
@@ -25,8 +38,13 @@ def run_command(cmd: List[str], check: bool = False) -> Tuple[int, str, str]:
         err_msg = f"Command not found: {cmd[0]}"
         logger.error(err_msg)
         # Return code 127 ist Standard für "Command not found"
+        returncode = 127
         return 127, "", err_msg
 
     except Exception as e:
         logger.error(f"Unexpected error executing {cmd_str}: {e}")
         return -1, "", str(e)
+
+    finally:
+        COMMAND_DURATION.labels(label).observe(time.perf_counter() - started_at)
+        COMMANDS.labels(label, str(returncode)).inc()
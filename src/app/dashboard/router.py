@@ -4,7 +4,7 @@ from fastapi.concurrency import run_in_threadpool
 from app.clients.service import ClientService
 from app.dashboard.schemas import DashboardSchema
 from app.device.service import get_network_info_data
-from app.pihole.client import PiholeClient
+from app.pihole.dependencies import get_pihole_service
 from app.vpn.openvpn.service import OpenVPNService
 from app.vpn.providers.service import connected_vpn_server_info
 
@@ -14,7 +14,7 @@ router = APIRouter()
 @router.get("", response_model=DashboardSchema)
 async def get_dashboard_aggregation():
     client_service = ClientService()
-    pihole_service = PiholeClient()
+    pihole_service = get_pihole_service()
     openvpn_service = OpenVPNService()
     clients = await run_in_threadpool(client_service.get_all_clients)
     network = get_network_info_data()
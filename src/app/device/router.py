@@ -1,6 +1,7 @@
 from fastapi import APIRouter, Query, status
 
 from app.core.config import get_settings
+from app.core.rate_limit import RateLimiter, rate_limited
 from app.device import service
 from app.device.schemas import DeviceInfo, DeviceStatusSummary, NetworkInfo, SingleIPResponse, SystemResources
 
@@ -9,6 +10,9 @@ settings = get_settings()
 
 router = APIRouter()
 
+# Each call forks up to three curl requests to external IP services
+external_ip_limiter = RateLimiter("external_ip", rate=0.2, burst=5)
+
 
 @router.get("/summary", response_model=DeviceStatusSummary)
 def get_device_summary():
@@ -67,7 +71,7 @@ def get_internal_ip(
     return SingleIPResponse(ip_address=ip)
 
 
-@router.get("/network/external", response_model=SingleIPResponse)
+@router.get("/network/external", response_model=SingleIPResponse, dependencies=[rate_limited(external_ip_limiter)])
 def get_external_ip():
     """
     Get only the public external IP.
@@ -2,10 +2,10 @@ import pwd
 import re
 import socket
 
-import psutil
-
 from app.core.config import get_settings
 from app.core.logger import logger
+from app.core.request_cache import request_cached
+from app.core.startup import lazy_import
 from app.core.utils import run_command
 from app.device.schemas import DeviceInfo, DeviceStatusSummary, NetworkInfo, SystemResources
 
@@ -15,6 +15,8 @@ except ModuleNotFoundError:
     pass  # you are on Windows
 import struct
 
+psutil = lazy_import("psutil")
+
 settings = get_settings()
 
 
@@ -41,6 +43,7 @@ def _validate_system_user(username: str) -> bool:
         return False
 
 
+@request_cached("device.external_ip")
 def get_external_ip_address(user: str = "iptvproxy") -> str | None:
     """
     Tries to get the external IP by running curl as a specific system user.
@@ -123,6 +126,7 @@ def _get_ip_via_psutil(interface: str) -> str | None:
     return None
 
 
+@request_cached("device.internal_ip")
 def get_internal_ip_address(interface: str = "eth0") -> str | None:
     """
     Retrieves the local IPv4 address of a specific interface.
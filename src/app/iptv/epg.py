@@ -0,0 +1,368 @@
+import asyncio
+import bisect
+import calendar
+import gzip
+import mmap
+import os
+import struct
+import time
+import xml.etree.ElementTree as ET
+from array import array
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from app.core.logger import logger
+from app.core.startup import lazy_import
+from app.iptv.playlist import INDEX_DIR, MappedIndexes, build_lock, url_checksum
+
+httpx = lazy_import("httpx")  # only needed while downloading a guide
+
+EPG_REFRESH_INTERVAL = 12  # in hours - providers update their guides once or twice a day
+DOWNLOAD_TIMEOUT = 60  # in seconds - between two chunks, xmltv.php is generated on the fly by most providers
+
+# Budget: programmes outside the window are evicted on every refresh, the rest is capped per guide.
+# The gzipped full guides of all proxies share the disk budget, a guide above its share is not kept.
+PAST_WINDOW = 2 * 60 * 60  # in seconds - ended programmes are kept this long for "what was just on"
+FUTURE_WINDOW = 7 * 24 * 60 * 60  # in seconds
+MAX_PROGRAMMES = 300_000  # per guide, ~6 MB on disk and ~20 MB while building
+DISK_BUDGET = 256 * 2**20  # in bytes - for the full guides of all proxies
+MAX_TEXT_LENGTH = 512  # in bytes - titles and descriptions are cut to this length
+
+# Layout: header | channels (by id) | programmes (by channel, then start) | string blob
+MAGIC = b"SCE1"
+HEADER = struct.Struct("<4sIdII")  # magic, crc32 of the source URL, fetched at, channel count, programme count
+CHANNEL = struct.Struct("<IIHHII")  # id offset, name offset, id length, name length, first programme, count
+PROGRAMME = struct.Struct("<IIIIHH")  # start, stop, title offset, description offset, their lengths
+
+
+class Programme(NamedTuple):
+    start: int  # unix time
+    stop: int
+    title: str
+    description: str
+
+
+def guide_path(port: int) -> Path:
+    return INDEX_DIR / f"epg-{port}.xml.gz"
+
+
+def epg_index_path(port: int) -> Path:
+    return INDEX_DIR / f"epg-{port}.idx"
+
+
+@lru_cache(maxsize=4096)
+def parse_xmltv_time(value: str) -> Optional[int]:
+    """
+    '20240101200000 +0100' to unix time. strptime is several times slower and this runs for every programme,
+    the cache helps as the programmes of all channels start at the same full and half hours.
+    """
+    value = value.strip()
+    try:
+        timestamp = calendar.timegm(
+            (int(value[0:4]), int(value[4:6]), int(value[6:8]), int(value[8:10]), int(value[10:12]), 0, 0, 0, 0)
+        )
+        if len(value) >= 14 and value[12:14].isdigit():
+            timestamp += int(value[12:14])
+        offset = value[14:].strip()
+        if offset[:1] in ("+", "-") and offset[1:5].isdigit():
+            minutes = int(offset[1:3]) * 60 + int(offset[3:5])
+            timestamp -= minutes * 60 if offset[0] == "+" else -minutes * 60
+        return timestamp
+    except ValueError:
+        return None
+
+
+def _text(element: Optional[ET.Element]) -> bytes:
+    if element is None or not element.text:
+        return b""
+    return element.text.strip().encode()[:MAX_TEXT_LENGTH]
+
+
+class _GuideWriter:
+    """
+    Collects the programmes of one download. Strings go to a temporary blob file right away,
+    the programmes are kept as packed integers until they are sorted into the index.
+    """
+
+    def __init__(self, path: Path, now: float):
+        self.path = path
+        self.earliest_stop = now - PAST_WINDOW
+        self.latest_start = now + FUTURE_WINDOW
+        self.evicted = 0
+        self.dropped = 0  # above MAX_PROGRAMMES
+
+        self._blob_path = path.with_suffix(".blob")
+        self._blob = open(self._blob_path, "wb")
+        self._blob_size = 0
+        self._channels: Dict[bytes, int] = {}
+        self._names: Dict[int, Tuple[int, int]] = {}
+        self._programmes = array("I")  # channel, start, stop, title offset, description offset per programme
+        self._lengths = array("H")  # title length, description length per programme
+
+    def _store(self, value: bytes) -> Tuple[int, int]:
+        if not value:
+            return 0, 0
+        location = (self._blob_size, len(value))
+        self._blob.write(value)
+        self._blob_size += len(value)
+        return location
+
+    def _channel(self, channel_id: bytes) -> int:
+        return self._channels.setdefault(channel_id, len(self._channels))
+
+    def add_channel(self, element: ET.Element) -> None:
+        channel_id = element.get("id", "").encode()[:MAX_TEXT_LENGTH]
+        if channel_id:
+            self._names[self._channel(channel_id)] = self._store(_text(element.find("display-name")))
+
+    def add_programme(self, element: ET.Element) -> None:
+        channel_id = element.get("channel", "").encode()[:MAX_TEXT_LENGTH]
+        start = parse_xmltv_time(element.get("start", ""))
+        stop = parse_xmltv_time(element.get("stop", ""))
+        if not channel_id or start is None:
+            return
+        stop = stop if stop is not None and stop > start else start
+
+        if stop < self.earliest_stop or start > self.latest_start:
+            self.evicted += 1
+            return
+        if len(self._lengths) >= 2 * MAX_PROGRAMMES:
+            self.dropped += 1
+            return
+
+        title_offset, title_length = self._store(_text(element.find("title")))
+        description_offset, description_length = self._store(_text(element.find("desc")))
+        self._programmes.extend((self._channel(channel_id), start, stop, title_offset, description_offset))
+        self._lengths.extend((title_length, description_length))
+
+    @property
+    def count(self) -> int:
+        return len(self._lengths) // 2
+
+    def discard(self) -> None:
+        self._blob.close()
+        self._blob_path.unlink(missing_ok=True)
+
+    def commit(self, url: str, fetched_at: float) -> int:
+        self._blob.close()
+        channel_ids = sorted(self._channels)  # by raw id, looked up by exact match
+        ranks = array("I", bytes(4 * len(channel_ids)))
+        for rank, channel_id in enumerate(channel_ids):
+            ranks[self._channels[channel_id]] = rank
+
+        programmes = self._programmes
+        order = sorted(range(self.count), key=lambda i: (ranks[programmes[5 * i]] << 32) | programmes[5 * i + 1])
+
+        tmp_path = self.path.with_suffix(".tmp")
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(HEADER.pack(MAGIC, url_checksum(url), fetched_at, len(channel_ids), self.count))
+
+                counts = [0] * len(channel_ids)
+                for i in range(self.count):
+                    counts[ranks[programmes[5 * i]]] += 1
+                # The ids are stored after the programme strings, their blob offsets continue from there
+                first, id_offset = 0, self._blob_size
+                for rank, channel_id in enumerate(channel_ids):
+                    name_offset, name_length = self._names.get(self._channels[channel_id], (0, 0))
+                    f.write(CHANNEL.pack(id_offset, name_offset, len(channel_id), name_length, first, counts[rank]))
+                    first += counts[rank]
+                    id_offset += len(channel_id)
+
+                for i in order:
+                    _, start, stop, title_offset, description_offset = programmes[5 * i : 5 * i + 5]
+                    f.write(
+                        PROGRAMME.pack(
+                            start,
+                            stop,
+                            title_offset,
+                            description_offset,
+                            self._lengths[2 * i],
+                            self._lengths[2 * i + 1],
+                        )
+                    )
+
+                with open(self._blob_path, "rb") as blob:
+                    while chunk := blob.read(1024 * 1024):
+                        f.write(chunk)
+                f.write(b"".join(channel_ids))
+            os.replace(tmp_path, self.path)
+        except OSError:
+            tmp_path.unlink(missing_ok=True)
+            raise
+        finally:
+            self._blob_path.unlink(missing_ok=True)
+        return self.count
+
+
+class GuideIndex:
+    """
+    Read-only, memory-mapped view of the programmes of one guide, searchable by channel and time.
+    """
+
+    def __init__(self, path: Path):
+        with open(path, "rb") as f:
+            self.mtime_ns = os.fstat(f.fileno()).st_mtime_ns
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self.url_checksum, self.fetched_at, self.channel_count, self.programme_count = HEADER.unpack_from(
+            self._mm, 0
+        )
+        if magic != MAGIC:
+            raise ValueError(f"{path} is no EPG index")
+        self._channels_at = HEADER.size
+        self._programmes_at = self._channels_at + self.channel_count * CHANNEL.size
+        self._blob_at = self._programmes_at + self.programme_count * PROGRAMME.size
+
+    def _string(self, offset: int, length: int) -> str:
+        start = self._blob_at + offset
+        return self._mm[start : start + length].decode("utf-8", "replace")
+
+    def _channel(self, rank: int) -> Tuple[str, str, int, int]:
+        id_offset, name_offset, id_length, name_length, first, count = CHANNEL.unpack_from(
+            self._mm, self._channels_at + rank * CHANNEL.size
+        )
+        return self._string(id_offset, id_length), self._string(name_offset, name_length), first, count
+
+    def _programme(self, position: int) -> Programme:
+        start, stop, title_offset, description_offset, title_length, description_length = PROGRAMME.unpack_from(
+            self._mm, self._programmes_at + position * PROGRAMME.size
+        )
+        return Programme(
+            start, stop, self._string(title_offset, title_length), self._string(description_offset, description_length)
+        )
+
+    def _start(self, position: int) -> int:
+        return PROGRAMME.unpack_from(self._mm, self._programmes_at + position * PROGRAMME.size)[0]
+
+    def channels(self) -> List[Tuple[str, str, int]]:
+        """
+        Id, display name and number of programmes of every channel, sorted by id.
+        """
+        channels = []
+        for rank in range(self.channel_count):
+            channel_id, name, _, count = self._channel(rank)
+            channels.append((channel_id, name, count))
+        return channels
+
+    def find_channel(self, channel_id: str) -> Optional[Tuple[str, range]]:
+        """
+        Display name and programme positions of a channel.
+        """
+        key = channel_id.encode()
+        ranks = range(self.channel_count)
+        rank = bisect.bisect_left(ranks, key, key=lambda i: self._channel(i)[0].encode())
+        if rank == self.channel_count:
+            return None
+        found_id, name, first, count = self._channel(rank)
+        if found_id != channel_id:
+            return None
+        return name, range(first, first + count)
+
+    def now_next(
+        self, channel_id: str, at: float, upcoming: int = 1
+    ) -> Optional[Tuple[str, Optional[Programme], list]]:
+        """
+        The programme running at `at` (if any) and the next `upcoming` ones of a channel.
+        None if the guide does not know the channel.
+        """
+        channel = self.find_channel(channel_id)
+        if channel is None:
+            return None
+        name, positions = channel
+
+        # Last programme starting at or before `at`, it is running unless it already ended
+        position = bisect.bisect_right(positions, at, key=self._start) - 1
+        current = self._programme(positions[position]) if position >= 0 else None
+        if current is not None and current.stop <= at:
+            current = None
+        following = positions[position + 1 : position + 1 + upcoming]
+        return name, current, [self._programme(i) for i in following]
+
+
+guide_indexes = MappedIndexes(epg_index_path, GuideIndex)
+
+
+def guide_budget(guides: int) -> int:
+    """
+    Disk share of one full guide, when `guides` proxies have one.
+    """
+    return DISK_BUDGET // max(guides, 1)
+
+
+async def build_guide(port: int, url: str, budget: int) -> int:
+    """
+    Downloads xmltv.php once: the bytes are gzipped into the full guide while an incremental parser
+    picks the programmes for the index. Returns the number of indexed programmes.
+    A guide larger than `budget` compressed bytes is not kept, its index is.
+    """
+    INDEX_DIR.mkdir(parents=True, exist_ok=True)
+    path = epg_index_path(port)
+
+    with build_lock(path) as locked:
+        if not locked:
+            logger.debug(f"EPG of port {port} is already being fetched")
+            return 0
+
+        started_at = time.monotonic()
+        fetched_at = time.time()
+        writer = _GuideWriter(path, fetched_at)
+        guide_tmp = guide_path(port).with_suffix(".tmp")
+        parser = ET.XMLPullParser(events=("start", "end"))
+        root = None
+        try:
+            with open(guide_tmp, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=6) as guide:
+                timeout = httpx.Timeout(DOWNLOAD_TIMEOUT)
+                async with httpx.AsyncClient(timeout=timeout, follow_redirects=True) as client:
+                    async with client.stream("GET", url) as response:
+                        response.raise_for_status()
+                        async for chunk in response.aiter_bytes():
+                            guide.write(chunk)
+                            parser.feed(chunk)
+                            for event, element in parser.read_events():
+                                if root is None:
+                                    root = element
+                                if event != "end" or element.tag not in ("channel", "programme"):
+                                    continue
+                                if element.tag == "programme":
+                                    writer.add_programme(element)
+                                else:
+                                    writer.add_channel(element)
+                                # Completed elements are dropped, the tree never holds more than one
+                                root.clear()
+                parser.close()
+
+            count = await asyncio.to_thread(writer.commit, url, fetched_at)
+            if guide_tmp.stat().st_size <= budget:
+                os.replace(guide_tmp, guide_path(port))
+            else:
+                logger.warning(f"EPG of port {port} exceeds its disk budget of {budget // 2**20} MiB, not kept")
+                guide_tmp.unlink()
+                guide_path(port).unlink(missing_ok=True)
+        except BaseException:
+            writer.discard()
+            guide_tmp.unlink(missing_ok=True)
+            raise
+
+    if writer.dropped:
+        logger.warning(f"EPG of port {port} has more than {MAX_PROGRAMMES} programmes, {writer.dropped} dropped")
+    logger.info(
+        f"Indexed {count} programmes of the EPG of port {port} in {time.monotonic() - started_at:.1f}s "
+        f"({writer.evicted} outside the time window)"
+    )
+    return count
+
+
+def guide_is_current(port: int, url: str) -> bool:
+    index = guide_indexes.get(port)
+    return (
+        index is not None
+        and index.url_checksum == url_checksum(url)
+        and time.time() - index.fetched_at < EPG_REFRESH_INTERVAL * 60 * 60
+    )
+
+
+def remove_guide(port: int) -> None:
+    for path in (guide_path(port), epg_index_path(port), epg_index_path(port).with_suffix(".lock")):
+        path.unlink(missing_ok=True)
@@ -0,0 +1,157 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Deque, Dict, Optional
+
+from app.core.logger import logger
+from app.core.startup import lazy_import
+
+httpx = lazy_import("httpx")  # only needed by the scheduler job
+
+HEALTH_FILE = Path("/tmp/streamcloak_iptv_health.json")
+CHECK_INTERVAL = 60  # in seconds
+CHECK_TIMEOUT = 10  # in seconds - per proxy, a proxy answering slower counts as failed
+STALE_AFTER = 3 * CHECK_INTERVAL  # in seconds - results older than this are reported as unknown
+MAX_CONCURRENT_CHECKS = 4  # every check makes the proxy serve its playlist, keep the load on the Pi low
+PLAYLIST_PROBE_BYTES = 1024  # the playlist has to start with #EXTM3U within the first bytes
+HISTORY_LENGTH = 20  # checks kept per proxy
+
+OK, FAILING, UNKNOWN = "ok", "failing", "unknown"
+
+# Only kept by the worker running the scheduler, the others read the published file
+_history: Dict[int, Deque[dict]] = {}
+_failures: Dict[int, int] = {}  # port -> failed checks in a row
+
+
+async def _check_proxy(client, url: str) -> dict:
+    """
+    Requests the playlist like a player would and reads only its first bytes.
+    """
+    started_at = time.perf_counter()
+    status_code, ok = None, False
+    try:
+        async with client.stream("GET", url) as response:
+            status_code = response.status_code
+            head = b""
+            async for chunk in response.aiter_bytes():
+                head += chunk
+                if len(head) >= PLAYLIST_PROBE_BYTES:
+                    break
+        if status_code >= 400:
+            detail = f"Proxy answered HTTP {status_code}"
+        elif not head.lstrip(b"\xef\xbb\xbf \t\r\n").startswith(b"#EXTM3U"):
+            detail = "Proxy does not return an M3U playlist"
+        else:
+            ok, detail = True, f"Proxy answered HTTP {status_code}"
+    except httpx.TimeoutException:
+        detail = f"Proxy did not answer within {CHECK_TIMEOUT}s"
+    except httpx.HTTPError as e:
+        detail = f"Proxy unreachable: {e.__class__.__name__}"
+
+    return {
+        "ok": ok,
+        "http_status": status_code,
+        "detail": detail,
+        "latency_ms": round((time.perf_counter() - started_at) * 1000, 1),
+        "checked_at": time.time(),
+    }
+
+
+def _summary(port: int) -> dict:
+    history = list(_history[port])
+    latest = history[-1]
+    return {
+        "status": OK if latest["ok"] else FAILING,
+        "checked_at": latest["checked_at"],
+        "latency_ms": latest["latency_ms"],
+        "http_status": latest["http_status"],
+        "detail": latest["detail"],
+        "consecutive_failures": _failures.get(port, 0),
+        "success_rate": round(sum(check["ok"] for check in history) / len(history), 2),
+        "history": history,
+    }
+
+
+async def check_proxies(targets: Dict[int, str]) -> Dict[int, dict]:
+    """
+    Checks the playlist URL of every running proxy with bounded concurrency and publishes the results
+    for every worker. Proxies missing from `targets` lose their history, e.g. a stopped on-demand proxy.
+    Returns the summary per port.
+    """
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_CHECKS)
+
+    async def check(client, url: str) -> dict:
+        async with semaphore:
+            return await _check_proxy(client, url)
+
+    ports = list(targets)
+    if ports:
+        async with httpx.AsyncClient(timeout=CHECK_TIMEOUT) as client:
+            results = await asyncio.gather(*(check(client, targets[port]) for port in ports))
+    else:
+        results = []
+
+    for port in set(_history) - set(ports):
+        del _history[port]
+        _failures.pop(port, None)
+    for port, result in zip(ports, results, strict=True):
+        _history.setdefault(port, deque(maxlen=HISTORY_LENGTH)).append(result)
+        _failures[port] = 0 if result["ok"] else _failures.get(port, 0) + 1
+        if not result["ok"]:
+            logger.warning(f"IPTV proxy on port {port} failed its health check: {result['detail']}")
+
+    summaries = {port: _summary(port) for port in ports}
+    tmp_path = HEALTH_FILE.with_suffix(".tmp")
+    try:
+        tmp_path.write_text(json.dumps({"checked_at": time.time(), "proxies": summaries}))
+        os.replace(tmp_path, HEALTH_FILE)
+    except OSError as e:
+        logger.error(f"Cannot write IPTV health report: {e}")
+    return summaries
+
+
+def reset_failures(port: int) -> None:
+    """
+    After a restart the proxy gets a fresh count of failed checks.
+    """
+    _failures.pop(port, None)
+
+
+class ProxyHealthReport:
+    """
+    Serves the latest check results from the shared file, re-read only when it changed.
+    """
+
+    def __init__(self, path: Path = HEALTH_FILE):
+        self.path = path
+        self._mtime_ns: Optional[int] = None
+        self._proxies: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def get(self, port: int) -> Optional[dict]:
+        """
+        Health of one proxy, None if it has not been checked, e.g. because it is not running.
+        """
+        with self._lock:
+            try:
+                mtime_ns = os.stat(self.path).st_mtime_ns
+                if mtime_ns != self._mtime_ns:
+                    self._proxies = json.loads(self.path.read_text())["proxies"]
+                    self._mtime_ns = mtime_ns
+            except (OSError, ValueError, KeyError):
+                self._proxies, self._mtime_ns = {}, None
+            # JSON object keys are strings
+            health = self._proxies.get(str(port))
+
+        if health is None:
+            return None
+        if time.time() - health["checked_at"] > STALE_AFTER:
+            return {**health, "status": UNKNOWN, "detail": f"stale result: {health['detail']}"}
+        return health
+
+
+proxy_health = ProxyHealthReport()
@@ -0,0 +1,529 @@
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import shlex
+import signal
+import struct
+import sys
+import time
+import zlib
+from array import array
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional
+from urllib.parse import parse_qsl, quote, unquote, urlencode, urlsplit
+
+import httpx
+
+# The host runs as its own unit next to the API. It only needs the proxy scripts and httpx,
+# not the settings of the API, so it logs through the standard library to the journal.
+logger = logging.getLogger("iptv-proxy-host")
+
+SCRIPT_DIR = "/usr/local/bin"
+SCRIPT_PATTERN = re.compile(r"^iptv-proxy-(\d+)\.sh$")
+CACHE_DIR = Path(os.environ.get("CACHE_DIRECTORY", "/var/cache/iptv-proxy-host"))  # set by CacheDirectory=
+# The EPG cache of the API (app.iptv.epg), passed on the command line by the unit
+GUIDE_DIR = Path("/opt/streamcloak/data/iptv")
+GUIDE_INDEX_HEADER = struct.Struct("<4sI")  # magic, crc32 of the guide URL, the start of the EPG index header
+SHARED_ACTIVATION = "shared"
+
+CONFIG_CHECK_INTERVAL = 1  # in seconds - the script directory changes whenever a proxy is written or removed
+DEFAULT_CACHE_EXPIRATION = 6  # in hours - if a script has no --m3u-cache-expiration
+MAX_REQUEST_HEAD = 16 * 1024  # request line and headers
+CHUNK_SIZE = 64 * 1024
+UPSTREAM_TIMEOUT = httpx.Timeout(10, read=30)  # in seconds - a live stream may stall for a while
+# One pool for all tenants, idle connections to the same provider are reused across ports
+UPSTREAM_LIMITS = httpx.Limits(max_connections=200, max_keepalive_connections=20)
+FORWARDED_HEADERS = ("range", "user-agent", "accept")
+# content-encoding in case the upstream compresses anyway, the body is relayed as received
+RELAYED_HEADERS = (
+    "content-type",
+    "content-length",
+    "content-range",
+    "content-encoding",
+    "accept-ranges",
+    "last-modified",
+)
+XTREAM_KINDS = ("live", "movie", "series", "timeshift")
+
+STATUS_TEXT = {200: "OK", 206: "Partial Content", 400: "Bad Request", 401: "Unauthorized", 404: "Not Found"}
+STATUS_TEXT.update({405: "Method Not Allowed", 502: "Bad Gateway", 503: "Service Unavailable"})
+
+
+class Tenant(NamedTuple):
+    """
+    One proxy, read from the command line in its script.
+    """
+
+    port: int
+    advertised_port: int
+    hostname: str
+    user: str
+    password: str
+    m3u_url: str
+    xtream_base_url: Optional[str]
+    xtream_user: Optional[str]
+    xtream_password: Optional[str]
+    cache_hours: int
+    version: int = 0  # mtime of the script, the API touches it to restart the proxy
+
+
+class Request(NamedTuple):
+    method: str
+    path: str
+    query: Dict[str, str]
+    headers: Dict[str, str]
+
+
+def read_tenant(script_path: Path) -> Optional[Tenant]:
+    """
+    None unless the script belongs to a shared proxy that is not suspended.
+    """
+    content = script_path.read_text(encoding="utf-8")
+    header = dict(re.findall(r"^# (Activation|Suspended): (.*)$", content, flags=re.MULTILINE))
+    if header.get("Activation") != SHARED_ACTIVATION or header.get("Suspended"):
+        return None
+
+    tokens = shlex.split(content, comments=True)
+    args = {flag: value for flag, value in zip(tokens, tokens[1:], strict=False) if flag.startswith("--")}
+    port = int(args["--port"])
+    return Tenant(
+        port=port,
+        advertised_port=int(args.get("--advertised-port", port)),
+        hostname=args["--hostname"],
+        user=args["--user"],
+        password=args["--password"],
+        m3u_url=args["--m3u-url"],
+        xtream_base_url=args.get("--xtream-base-url"),
+        xtream_user=args.get("--xtream-user"),
+        xtream_password=args.get("--xtream-password"),
+        cache_hours=int(args.get("--m3u-cache-expiration", DEFAULT_CACHE_EXPIRATION)),
+        version=script_path.stat().st_mtime_ns,
+    )
+
+
+def read_tenants(script_dir: str) -> Dict[int, Tenant]:
+    tenants = {}
+    for entry in os.scandir(script_dir):
+        if not SCRIPT_PATTERN.match(entry.name):
+            continue
+        try:
+            tenant = read_tenant(Path(entry.path))
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Skipping {entry.name}: {e!r}")
+            continue
+        if tenant:
+            tenants[tenant.port] = tenant
+    return tenants
+
+
+class Playlist(NamedTuple):
+    path: Path
+    offsets: array  # file offset of every stream URL line, in playlist order
+    fetched_at: float
+
+
+class PlaylistCache:
+    """
+    Upstream playlists on disk, shared by all tenants with the same URL. Only the offsets of the
+    stream URLs are kept in memory, a stream request reads its URL from the file.
+    """
+
+    def __init__(self, client: httpx.AsyncClient, cache_dir: Path = CACHE_DIR):
+        self.client = client
+        self.cache_dir = cache_dir
+        self._playlists: Dict[str, Playlist] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    async def get(self, url: str, max_age: float) -> Playlist:
+        async with self._locks.setdefault(url, asyncio.Lock()):
+            playlist = self._playlists.get(url)
+            if playlist is None or time.time() - playlist.fetched_at >= max_age:
+                playlist = await self._fetch(url)
+                self._playlists[url] = playlist
+            return playlist
+
+    async def _fetch(self, url: str) -> Playlist:
+        path = self.cache_dir / f"{hashlib.sha256(url.encode()).hexdigest()[:32]}.m3u"
+        tmp_path = path.with_suffix(".tmp")
+        offsets, position, carry = array("Q"), 0, b""
+        try:
+            async with self.client.stream("GET", url) as response:
+                response.raise_for_status()
+                with open(tmp_path, "wb") as f:
+                    async for chunk in response.aiter_bytes(CHUNK_SIZE):
+                        f.write(chunk)
+                        lines = (carry + chunk).split(b"\n")
+                        carry = lines.pop()
+                        for line in lines:
+                            if line.strip() and not line.startswith(b"#"):
+                                offsets.append(position)
+                            position += len(line) + 1
+            if carry.strip() and not carry.startswith(b"#"):
+                offsets.append(position)
+            os.replace(tmp_path, path)
+        finally:
+            tmp_path.unlink(missing_ok=True)
+        logger.info(f"Playlist {path.name} cached with {len(offsets)} streams")
+        return Playlist(path, offsets, time.time())
+
+    def stream_url(self, playlist: Playlist, index: int) -> Optional[str]:
+        if not 0 <= index < len(playlist.offsets):
+            return None
+        with open(playlist.path, "rb") as f:
+            f.seek(playlist.offsets[index])
+            return f.readline().decode("utf-8", "replace").strip()
+
+    def retain(self, urls: set) -> None:
+        """
+        Forgets the playlists no tenant uses anymore.
+        """
+        for url in set(self._playlists) - urls:
+            self._locks.pop(url, None)
+            self.discard(url)
+
+    def discard(self, url: str) -> None:
+        """
+        Drops one playlist, the next request fetches it again.
+        """
+        playlist = self._playlists.pop(url, None)
+        if playlist is not None:
+            playlist.path.unlink(missing_ok=True)
+
+
+async def _read_request(reader: asyncio.StreamReader) -> Optional[Request]:
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+        return None
+    request_line, *header_lines = head.decode("latin-1").split("\r\n")
+    try:
+        method, target, _version = request_line.split(" ")
+    except ValueError:
+        return None
+    headers = {}
+    for line in header_lines:
+        name, _, value = line.partition(":")
+        if value:
+            headers[name.strip().lower()] = value.strip()
+    parts = urlsplit(target)
+    return Request(method, unquote(parts.path), dict(parse_qsl(parts.query)), headers)
+
+
+async def _send_head(writer: asyncio.StreamWriter, status: int, headers: Dict[str, str]) -> None:
+    # Every response ends with the connection, no keep-alive and no chunked encoding needed
+    lines = [f"HTTP/1.1 {status} {STATUS_TEXT.get(status, 'Error')}", "Connection: close"]
+    lines.extend(f"{name}: {value}" for name, value in headers.items())
+    writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+    await writer.drain()
+
+
+async def _send(writer: asyncio.StreamWriter, status: int, body: bytes = b"", content_type: str = "text/plain") -> None:
+    await _send_head(writer, status, {"Content-Type": content_type, "Content-Length": str(len(body))})
+    writer.write(body)
+    await writer.drain()
+
+
+class ProxyHost:
+    """
+    Serves every shared proxy from one event loop: one listener per port, one upstream connection
+    pool and one playlist cache for all of them. Memory grows with the streams being relayed,
+    a configured proxy only costs its listening socket.
+    """
+
+    def __init__(self, script_dir: str = SCRIPT_DIR, cache_dir: Path = CACHE_DIR, guide_dir: Path = GUIDE_DIR):
+        self.script_dir = script_dir
+        self.cache_dir = cache_dir
+        self.guide_dir = guide_dir
+        self.client: Optional[httpx.AsyncClient] = None
+        self.playlists: Optional[PlaylistCache] = None
+        self.tenants: Dict[int, Tenant] = {}
+        self.servers: Dict[int, asyncio.Server] = {}
+        self._reload = False
+        self._stop = False
+        self._wake = asyncio.Event()
+
+    # --- Configuration ---
+
+    async def apply(self, tenants: Dict[int, Tenant]) -> None:
+        """
+        Opens listeners for new proxies and replaces those whose config changed or that were restarted.
+        Running streams of a removed or changed proxy go on until the player disconnects. Only the
+        playlists of changed proxies are fetched again, like restarting one dedicated proxy.
+        """
+        changed = {port for port in self.tenants if tenants.get(port) != self.tenants[port]}
+        for port in changed & set(self.servers):
+            self.servers.pop(port).close()
+            logger.info(f"Proxy on port {port} closed")
+        for port in changed:
+            self.playlists.discard(self.tenants[port].m3u_url)
+        self.tenants = tenants
+        self.playlists.retain({tenant.m3u_url for tenant in tenants.values()})
+
+        for port in tenants:
+            if port in self.servers:
+                continue
+            try:
+                self.servers[port] = await asyncio.start_server(
+                    lambda reader, writer, port=port: self.handle(port, reader, writer),
+                    port=port,
+                    reuse_address=True,
+                    limit=MAX_REQUEST_HEAD,
+                )
+                logger.info(f"Proxy on port {port} listening")
+            except OSError as e:
+                # e.g. the dedicated unit of the proxy is still stopping, retried on the next check
+                logger.warning(f"Cannot listen on port {port}: {e}")
+
+    async def watch(self) -> None:
+        """
+        Re-reads the scripts when the directory changed or on SIGHUP, and retries ports that could not be bound.
+        """
+        last_mtime = None
+        while not self._stop:
+            try:
+                mtime = os.stat(self.script_dir).st_mtime_ns
+            except OSError as e:
+                logger.error(f"Cannot read {self.script_dir}: {e}")
+                mtime = last_mtime
+            unbound = set(self.tenants) - set(self.servers)
+            # A restart only touches its script, which does not change the directory but is followed by SIGHUP
+            if mtime != last_mtime or unbound or self._reload:
+                self._reload = False
+                last_mtime = mtime
+                await self.apply(await asyncio.to_thread(read_tenants, self.script_dir))
+            try:
+                await asyncio.wait_for(self._wake.wait(), CONFIG_CHECK_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    def _on_signal(self, action: str) -> None:
+        if action == "reload":
+            self._reload = True
+        else:
+            self._stop = True
+        self._wake.set()
+
+    async def run(self) -> None:
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        # Playlists are fetched again after a restart, like by a dedicated proxy
+        for path in self.cache_dir.glob("*.m3u"):
+            path.unlink()
+        loop = asyncio.get_running_loop()
+        loop.add_signal_handler(signal.SIGHUP, self._on_signal, "reload")
+        loop.add_signal_handler(signal.SIGTERM, self._on_signal, "stop")
+        loop.add_signal_handler(signal.SIGINT, self._on_signal, "stop")
+
+        async with httpx.AsyncClient(
+            timeout=UPSTREAM_TIMEOUT, limits=UPSTREAM_LIMITS, follow_redirects=True
+        ) as self.client:
+            self.playlists = PlaylistCache(self.client, self.cache_dir)
+            await self.watch()
+            for server in self.servers.values():
+                server.close()
+        logger.info("IPTV proxy host stopped")
+
+    # --- Requests ---
+
+    async def handle(self, port: int, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request = await _read_request(reader)
+            tenant = self.tenants.get(port)
+            if request is None:
+                await _send(writer, 400, b"Bad request")
+            elif request.method not in ("GET", "HEAD"):
+                await _send(writer, 405, b"Method not allowed")
+            elif tenant is None:
+                await _send(writer, 503, b"Proxy is being reconfigured")
+            else:
+                await self.route(tenant, request, writer)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass  # the player went away
+        except Exception as e:
+            logger.error(f"Request on port {port} failed: {e!r}")
+        finally:
+            writer.close()
+
+    def _authorized(self, tenant: Tenant, user: Optional[str], password: Optional[str]) -> bool:
+        return user == tenant.user and password == tenant.password
+
+    async def route(self, tenant: Tenant, request: Request, writer: asyncio.StreamWriter) -> None:
+        segments = request.path.strip("/").split("/")
+        query_auth = (request.query.get("username"), request.query.get("password"))
+
+        if request.path in ("/iptv.m3u", "/get.php"):
+            if not self._authorized(tenant, *query_auth):
+                return await _send(writer, 401, b"Unauthorized")
+            return await self.send_playlist(tenant, request, writer)
+
+        if tenant.xtream_base_url and request.path in ("/player_api.php", "/xmltv.php"):
+            if not self._authorized(tenant, *query_auth):
+                return await _send(writer, 401, b"Unauthorized")
+            if request.path == "/xmltv.php" and await asyncio.to_thread(self._guide_is_cached, tenant):
+                return await self.send_guide(tenant, request, writer)
+            query = {**request.query, "username": tenant.xtream_user, "password": tenant.xtream_password}
+            url = f"{tenant.xtream_base_url}{request.path}?{urlencode(query)}"
+            if request.path == "/player_api.php" and "action" not in request.query:
+                return await self.send_account(tenant, url, writer)
+            return await self.relay(url, request, writer)
+
+        # Xtream streams: /live/<user>/<password>/<id>.ts, /movie/..., /series/... and /<user>/<password>/<id>.
+        # The kinds are checked first, a password of digits would otherwise look like a playlist index.
+        xtream_kind = len(segments) == 4 and segments[0] in XTREAM_KINDS
+        if tenant.xtream_base_url and (xtream_kind or len(segments) == 3):
+            kind = segments[0] + "/" if xtream_kind else ""
+            user, password, stream = segments[-3:]
+            if not self._authorized(tenant, user, password):
+                return await _send(writer, 401, b"Unauthorized")
+            url = f"{tenant.xtream_base_url}/{kind}{quote(tenant.xtream_user)}/{quote(tenant.xtream_password)}/{stream}"
+            return await self.relay(url, request, writer)
+
+        # Streams of the rewritten playlist: /<user>/<password>/<index>/<name>
+        if len(segments) == 4 and segments[2].isdigit():
+            if not self._authorized(tenant, segments[0], segments[1]):
+                return await _send(writer, 401, b"Unauthorized")
+            try:
+                playlist = await self.playlists.get(tenant.m3u_url, tenant.cache_hours * 3600)
+            except httpx.HTTPError as e:
+                logger.warning(f"Playlist of port {tenant.port} unavailable: {e!r}")
+                return await _send(writer, 502, b"Upstream playlist unavailable")
+            url = await asyncio.to_thread(self.playlists.stream_url, playlist, int(segments[2]))
+            if not url:
+                return await _send(writer, 404, b"Unknown stream")
+            return await self.relay(url, request, writer)
+
+        await _send(writer, 404, b"Not found")
+
+    async def send_playlist(self, tenant: Tenant, request: Request, writer: asyncio.StreamWriter) -> None:
+        """
+        The upstream playlist with every stream URL pointing to this proxy, read from the cache in chunks.
+        """
+        try:
+            playlist = await self.playlists.get(tenant.m3u_url, tenant.cache_hours * 3600)
+        except httpx.HTTPError as e:
+            logger.warning(f"Playlist of port {tenant.port} unavailable: {e!r}")
+            return await _send(writer, 502, b"Upstream playlist unavailable")
+
+        prefix = f"http://{tenant.hostname}:{tenant.advertised_port}/{quote(tenant.user)}/{quote(tenant.password)}/"
+        await _send_head(writer, 200, {"Content-Type": "audio/x-mpegurl"})
+        if request.method == "HEAD":
+            return
+        index, carry = 0, b""
+        with open(playlist.path, "rb") as f:
+            while True:
+                chunk = await asyncio.to_thread(f.read, CHUNK_SIZE)
+                lines = (carry + chunk).split(b"\n")
+                carry = lines.pop()
+                if not chunk and carry:
+                    lines.append(carry)  # last line without a line break
+                out = []
+                for line in lines:
+                    if line.strip() and not line.startswith(b"#"):
+                        name = line.strip().rsplit(b"/", 1)[-1].split(b"?", 1)[0].decode("utf-8", "replace")
+                        line = f"{prefix}{index}/{quote(name) or 'stream'}".encode()
+                        index += 1
+                    out.append(line)
+                if out:
+                    writer.write(b"\n".join(out) + b"\n")
+                    await writer.drain()
+                if not chunk:
+                    break
+
+    def _guide_path(self, tenant: Tenant) -> Path:
+        return self.guide_dir / f"epg-{tenant.port}.xml.gz"  # like epg.guide_path()
+
+    def _guide_is_cached(self, tenant: Tenant) -> bool:
+        """
+        Whether the API has cached the guide of the current provider account, like epg.guide_is_current()
+        but regardless of its age: a guide the API could not refresh is still better than none.
+        """
+        guide_url = (
+            f"{tenant.xtream_base_url}/xmltv.php?username={tenant.xtream_user}&password={tenant.xtream_password}"
+        )
+        try:
+            with open(self.guide_dir / f"epg-{tenant.port}.idx", "rb") as f:
+                _magic, checksum = GUIDE_INDEX_HEADER.unpack(f.read(GUIDE_INDEX_HEADER.size))
+        except (OSError, struct.error):
+            return False
+        return checksum == zlib.crc32(guide_url.encode()) and self._guide_path(tenant).exists()
+
+    async def send_guide(self, tenant: Tenant, request: Request, writer: asyncio.StreamWriter) -> None:
+        """
+        The guide cached by the API, instead of downloading it from the provider for every player.
+        It is stored gzipped and sent as is to players accepting gzip.
+        """
+        path = self._guide_path(tenant)
+        compressed = "gzip" in request.headers.get("accept-encoding", "")
+        try:
+            f = open(path, "rb") if compressed else gzip.open(path, "rb")
+        except OSError:
+            return await _send(writer, 503, b"Guide is being replaced")
+        with f:
+            headers = {"Content-Type": "application/xml"}
+            if compressed:
+                headers.update({"Content-Encoding": "gzip", "Content-Length": str(os.fstat(f.fileno()).st_size)})
+            await _send_head(writer, 200, headers)
+            if request.method == "HEAD":
+                return
+            while chunk := await asyncio.to_thread(f.read, CHUNK_SIZE):
+                writer.write(chunk)
+                await writer.drain()
+
+    async def send_account(self, tenant: Tenant, url: str, writer: asyncio.StreamWriter) -> None:
+        """
+        Xtream login: players build their stream URLs from server_info, so it has to name this proxy.
+        """
+        try:
+            response = await self.client.get(url)
+            account = response.json()
+        except (httpx.HTTPError, ValueError) as e:
+            logger.warning(f"Xtream login of port {tenant.port} failed: {e!r}")
+            return await _send(writer, 502, b"Upstream unavailable")
+        if isinstance(account, dict):
+            user_info = account.get("user_info")
+            if isinstance(user_info, dict):
+                user_info.update(username=tenant.user, password=tenant.password)
+            server_info = account.get("server_info")
+            if isinstance(server_info, dict):
+                server_info.update(url=tenant.hostname, port=str(tenant.advertised_port), server_protocol="http")
+        await _send(writer, response.status_code, json.dumps(account).encode(), "application/json")
+
+    async def relay(self, url: str, request: Request, writer: asyncio.StreamWriter) -> None:
+        """
+        Streams the upstream response to the player chunk by chunk, until either side disconnects.
+        """
+        headers = {name: request.headers[name] for name in FORWARDED_HEADERS if name in request.headers}
+        # The body is relayed as received, ask for it uncompressed like the player would get it from a dedicated proxy
+        headers["accept-encoding"] = "identity"
+        started = False
+        try:
+            async with self.client.stream(request.method, url, headers=headers) as response:
+                relayed = {name: response.headers[name] for name in RELAYED_HEADERS if name in response.headers}
+                await _send_head(writer, response.status_code, relayed)
+                started = True
+                if request.method == "HEAD":
+                    return
+                async for chunk in response.aiter_raw(CHUNK_SIZE):
+                    writer.write(chunk)
+                    await writer.drain()
+        except httpx.HTTPError as e:
+            logger.warning(f"Upstream stream failed: {e.__class__.__name__}")
+            if not started:
+                await _send(writer, 502, b"Upstream unavailable")
+
+
+def main(argv: List[str]) -> None:
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s", stream=sys.stdout)
+    # Upstream URLs carry the provider credentials, httpx would log every one of them
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    script_dir = argv[1] if len(argv) > 1 else SCRIPT_DIR
+    guide_dir = Path(argv[2]) if len(argv) > 2 else GUIDE_DIR
+    asyncio.run(ProxyHost(script_dir, guide_dir=guide_dir).run())
+
+
+if __name__ == "__main__":
+    main(sys.argv)
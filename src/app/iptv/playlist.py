@@ -0,0 +1,398 @@
+import asyncio
+import bisect
+import fcntl
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+import zlib
+from array import array
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from app.core.logger import logger
+from app.core.startup import lazy_import
+
+httpx = lazy_import("httpx")  # only needed while downloading a playlist
+
+INDEX_DIR = Path("/opt/streamcloak/data/iptv")
+REFRESH_CHECK_INTERVAL = 300  # in seconds - how often the scheduler looks for missing or expired indexes
+DOWNLOAD_TIMEOUT = 30  # in seconds - between two chunks, a 200 MB playlist may take minutes in total
+
+MAX_LINE_LENGTH = 64 * 1024  # in bytes - longer lines are no channel entries and are dropped
+MAX_FIELD_LENGTH = 1024  # in bytes - names, groups and ids are cut to this length
+MAX_CHANNELS = 1_000_000
+
+# Layout: header | groups | records (by group, then name) | name order | string blob
+MAGIC = b"SCI1"
+HEADER = struct.Struct("<4sIdII")  # magic, crc32 of the source URL, fetched at, channel count, group count
+GROUP = struct.Struct("<IHxxII")  # name offset, name length, first record, record count
+RECORD = struct.Struct("<IIHHI")  # name offset, tvg-id offset, name length, tvg-id length, group id
+ORDER = struct.Struct("<I")  # record index, the records sorted by name
+
+EXTINF_NAME = re.compile(rb'^#EXTINF:[^,"]*(?:"[^"]*"[^,"]*)*,(.*)$')  # the name follows the first unquoted comma
+EXTINF_ATTRIBUTE = re.compile(rb'([\w-]+)="([^"]*)"')
+
+
+class Channel(NamedTuple):
+    name: str
+    group: str
+    tvg_id: str
+
+
+def _sort_key(name: str) -> str:
+    return name.casefold()
+
+
+def _field(value: bytes) -> bytes:
+    return value.strip()[:MAX_FIELD_LENGTH]
+
+
+class M3UParser:
+    """
+    Incremental M3U/M3U8 parser, fed with the chunks of a download as they arrive.
+    Only the current line is buffered, never the playlist. Every call returns the channels it completed.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self._buffer = b""
+        self._pending: Optional[Tuple[bytes, bytes, bytes]] = None
+        self._group = b""  # from an #EXTGRP line, applies to the next entry without group-title
+
+    def feed(self, chunk: bytes) -> List[Tuple[bytes, bytes, bytes]]:
+        lines = (self._buffer + chunk).split(b"\n")
+        self._buffer = lines.pop()
+        if len(self._buffer) > MAX_LINE_LENGTH:
+            self._buffer = b""
+        return [channel for line in lines if (channel := self._parse_line(line))]
+
+    def close(self) -> List[Tuple[bytes, bytes, bytes]]:
+        buffer, self._buffer = self._buffer, b""
+        channel = self._parse_line(buffer)
+        return [channel] if channel else []
+
+    def _parse_line(self, line: bytes) -> Optional[Tuple[bytes, bytes, bytes]]:
+        """
+        Returns (name, group, tvg-id) when the line completes a channel.
+        """
+        line = line.strip()
+        if not line or len(line) > MAX_LINE_LENGTH:
+            return None
+
+        if line.startswith(b"#EXTINF:"):
+            match = EXTINF_NAME.match(line)
+            attributes = dict(EXTINF_ATTRIBUTE.findall(line))
+            name = _field(match.group(1)) if match else b""
+            self._pending = (
+                name or _field(attributes.get(b"tvg-name", b"")),
+                _field(attributes.get(b"group-title", b"")),
+                _field(attributes.get(b"tvg-id", b"")),
+            )
+        elif line.startswith(b"#EXTGRP:"):
+            self._group = _field(line[len(b"#EXTGRP:") :])
+        elif not line.startswith(b"#"):
+            # The URL line completes the entry, a URL without #EXTINF has no name to index
+            pending, group = self._pending, self._group
+            self._pending, self._group = None, b""
+            if pending and pending[0] and self.count < MAX_CHANNELS:
+                self.count += 1
+                name, group_title, tvg_id = pending
+                return name, group_title or group, tvg_id
+        return None
+
+
+def index_path(port: int) -> Path:
+    return INDEX_DIR / f"channels-{port}.idx"
+
+
+def url_checksum(url: str) -> int:
+    return zlib.crc32(url.encode())
+
+
+class _IndexWriter:
+    """
+    Collects the channels of one download. The strings go to a temporary blob file right away,
+    only their offsets and the sort keys stay in memory until the index is written.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._blob_path = path.with_suffix(".blob")
+        self._blob = open(self._blob_path, "wb")
+        self._blob_size = 0
+        self._strings: Dict[bytes, Tuple[int, int]] = {}  # group names are stored once
+        self._groups: Dict[bytes, int] = {}
+        self._locations = array("I")  # name offset, tvg-id offset, name length, tvg-id length per channel
+        self._group_ids = array("I")
+        self._keys: List[str] = []
+
+    def _store(self, value: bytes, dedupe: bool = False) -> Tuple[int, int]:
+        if not value:
+            return 0, 0
+        if dedupe and value in self._strings:
+            return self._strings[value]
+        location = (self._blob_size, len(value))
+        self._blob.write(value)
+        self._blob_size += len(value)
+        if dedupe:
+            self._strings[value] = location
+        return location
+
+    def add(self, name: bytes, group: bytes, tvg_id: bytes) -> None:
+        group_id = self._groups.setdefault(group, len(self._groups))
+        self._store(group, dedupe=True)
+        name_offset, name_length = self._store(name)
+        tvg_offset, tvg_length = self._store(tvg_id)
+        self._locations.extend((name_offset, tvg_offset, name_length, tvg_length))
+        self._group_ids.append(group_id)
+        self._keys.append(_sort_key(name.decode("utf-8", "replace")))
+
+    def discard(self) -> None:
+        self._blob.close()
+        self._blob_path.unlink(missing_ok=True)
+
+    def commit(self, url: str, fetched_at: float) -> int:
+        """
+        Sorts the channels and writes the index next to its final path, then replaces it atomically.
+        """
+        self._blob.close()
+        count = len(self._group_ids)
+        group_names = sorted(self._groups, key=lambda group: _sort_key(group.decode("utf-8", "replace")))
+        ranks = array("I", bytes(4 * len(group_names)))
+        for rank, group in enumerate(group_names):
+            ranks[self._groups[group]] = rank
+        group_ranks = array("I", (ranks[group_id] for group_id in self._group_ids))
+
+        # Records ordered by group, then name: a group is one contiguous range, searchable by name prefix.
+        # The sort is stable, so sorting the name order by group keeps the names sorted within each group.
+        by_name = array("I", sorted(range(count), key=self._keys.__getitem__))
+        self._keys = []
+        by_group = array("I", sorted(by_name, key=group_ranks.__getitem__))
+        position = array("I", bytes(4 * count))
+        for i, record in enumerate(by_group):
+            position[record] = i
+
+        tmp_path = self.path.with_suffix(".tmp")
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(HEADER.pack(MAGIC, url_checksum(url), fetched_at, count, len(group_names)))
+
+                counts = [0] * len(group_names)
+                for rank in group_ranks:
+                    counts[rank] += 1
+                first = 0
+                for rank, group in enumerate(group_names):
+                    offset, length = self._strings.get(group, (0, 0))
+                    f.write(GROUP.pack(offset, length, first, counts[rank]))
+                    first += counts[rank]
+
+                for i in by_group:
+                    f.write(RECORD.pack(*self._locations[4 * i : 4 * i + 4], group_ranks[i]))
+                f.write(b"".join(ORDER.pack(position[i]) for i in by_name))
+
+                with open(self._blob_path, "rb") as blob:
+                    while chunk := blob.read(1024 * 1024):
+                        f.write(chunk)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            tmp_path.unlink(missing_ok=True)
+            raise
+        finally:
+            self._blob_path.unlink(missing_ok=True)
+        return count
+
+
+class ChannelIndex:
+    """
+    Read-only view of one index file. It is memory-mapped, so only the pages touched by a query are read.
+    """
+
+    def __init__(self, path: Path):
+        with open(path, "rb") as f:
+            self.mtime_ns = os.fstat(f.fileno()).st_mtime_ns
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self.url_checksum, self.fetched_at, self.channel_count, self.group_count = HEADER.unpack_from(
+            self._mm, 0
+        )
+        if magic != MAGIC:
+            raise ValueError(f"{path} is no channel index")
+        self._groups_at = HEADER.size
+        self._records_at = self._groups_at + self.group_count * GROUP.size
+        self._order_at = self._records_at + self.channel_count * RECORD.size
+        self._blob_at = self._order_at + self.channel_count * ORDER.size
+
+    def close(self) -> None:
+        self._mm.close()
+
+    def _string(self, offset: int, length: int) -> str:
+        start = self._blob_at + offset
+        return self._mm[start : start + length].decode("utf-8", "replace")
+
+    def _group(self, group_id: int) -> Tuple[str, int, int]:
+        name_offset, name_length, first, count = GROUP.unpack_from(self._mm, self._groups_at + group_id * GROUP.size)
+        return self._string(name_offset, name_length), first, count
+
+    def _name(self, record: int) -> str:
+        name_offset, _, name_length, _, _ = RECORD.unpack_from(self._mm, self._records_at + record * RECORD.size)
+        return self._string(name_offset, name_length)
+
+    def _channel(self, record: int) -> Channel:
+        name_offset, tvg_offset, name_length, tvg_length, group_id = RECORD.unpack_from(
+            self._mm, self._records_at + record * RECORD.size
+        )
+        return Channel(
+            self._string(name_offset, name_length), self._group(group_id)[0], self._string(tvg_offset, tvg_length)
+        )
+
+    def _by_name(self, position: int) -> int:
+        return ORDER.unpack_from(self._mm, self._order_at + position * ORDER.size)[0]
+
+    def groups(self) -> List[Tuple[str, int]]:
+        """
+        All groups with their number of channels, sorted by name.
+        """
+        groups = []
+        for group_id in range(self.group_count):
+            name, _, count = self._group(group_id)
+            groups.append((name, count))
+        return groups
+
+    def _find_group(self, name: str) -> Optional[int]:
+        key = _sort_key(name)
+        group_ids = range(self.group_count)
+        group_id = bisect.bisect_left(group_ids, key, key=lambda i: _sort_key(self._group(i)[0]))
+        # Groups differing only in case share the sort key, the exact name decides
+        while group_id < self.group_count and _sort_key(self._group(group_id)[0]) == key:
+            if self._group(group_id)[0] == name:
+                return group_id
+            group_id += 1
+        return None
+
+    def search(
+        self, prefix: str = "", group: Optional[str] = None, offset: int = 0, limit: int = 100
+    ) -> Tuple[int, List[Channel]]:
+        """
+        Channels whose name starts with `prefix` (case-insensitive), optionally only of one group,
+        sorted by name. Returns the number of matches and the requested page.
+        """
+        if group is not None:
+            group_id = self._find_group(group)
+            if group_id is None:
+                return 0, []
+            _, first, count = self._group(group_id)
+            positions = range(first, first + count)
+            record_at = int  # within a group, the records are in name order already
+        else:
+            positions = range(self.channel_count)
+            record_at = self._by_name
+
+        key = _sort_key(prefix)
+        if key:
+
+            def name_start(position: int) -> str:
+                return _sort_key(self._name(record_at(position)))[: len(key)]
+
+            start = bisect.bisect_left(positions, key, key=name_start)
+            end = bisect.bisect_right(positions, key, lo=start, key=name_start)
+            positions = positions[start:end]
+
+        page = positions[offset : offset + limit]
+        return len(positions), [self._channel(record_at(position)) for position in page]
+
+
+class MappedIndexes:
+    """
+    Opened indexes per port, reopened when a refresh has replaced the file.
+    `index_class` is called with the path and has to provide `mtime_ns`.
+    """
+
+    def __init__(self, path_for: Callable[[int], Path], index_class: Callable[[Path], Any]):
+        self._path_for = path_for
+        self._index_class = index_class
+        self._indexes: Dict[int, Any] = {}
+        self._lock = threading.Lock()
+
+    def get(self, port: int) -> Optional[Any]:
+        path = self._path_for(port)
+        with self._lock:
+            index = self._indexes.get(port)
+            try:
+                mtime_ns = os.stat(path).st_mtime_ns
+            except FileNotFoundError:
+                self._indexes.pop(port, None)
+                return None
+
+            if index is None or index.mtime_ns != mtime_ns:
+                # The old mapping stays valid for queries still running on it, it is freed with the object
+                index = self._index_class(path)
+                self._indexes[port] = index
+            return index
+
+
+channel_indexes = MappedIndexes(index_path, ChannelIndex)
+
+
+@contextmanager
+def build_lock(path: Path) -> Iterator[bool]:
+    """
+    Several workers may run the refreshes, the lock file next to the index makes sure only one of them
+    downloads. Yields whether this process got the lock.
+    """
+    with open(path.with_suffix(".lock"), "w") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        yield True
+
+
+async def build_index(port: int, url: str) -> int:
+    """
+    Downloads the playlist and indexes it chunk by chunk. Returns the number of channels.
+    The previous index stays in place until the new one is complete.
+    """
+    INDEX_DIR.mkdir(parents=True, exist_ok=True)
+    path = index_path(port)
+
+    with build_lock(path) as locked:
+        if not locked:
+            logger.debug(f"Channel index for port {port} is already being built")
+            return 0
+
+        started_at = time.monotonic()
+        fetched_at = time.time()
+        parser = M3UParser()
+        writer = _IndexWriter(path)
+        try:
+            timeout = httpx.Timeout(DOWNLOAD_TIMEOUT)
+            async with httpx.AsyncClient(timeout=timeout, follow_redirects=True) as client:
+                async with client.stream("GET", url) as response:
+                    response.raise_for_status()
+                    async for chunk in response.aiter_bytes():
+                        for channel in parser.feed(chunk):
+                            writer.add(*channel)
+            for channel in parser.close():
+                writer.add(*channel)
+            count = await asyncio.to_thread(writer.commit, url, fetched_at)
+        except BaseException:
+            writer.discard()
+            raise
+
+    logger.info(f"Indexed {count} channels of the proxy on port {port} in {time.monotonic() - started_at:.1f}s")
+    return count
+
+
+def index_is_current(port: int, url: str, max_age: float) -> bool:
+    index = channel_indexes.get(port)
+    return index is not None and index.url_checksum == url_checksum(url) and time.time() - index.fetched_at < max_age
+
+
+def remove_index(port: int) -> None:
+    for suffix in (".idx", ".lock"):
+        index_path(port).with_suffix(suffix).unlink(missing_ok=True)
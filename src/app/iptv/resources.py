@@ -0,0 +1,159 @@
+import re
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Deque, Dict, Optional, Tuple
+
+from app.core.logger import logger
+
+CGROUP_ROOT = Path("/sys/fs/cgroup/system.slice")
+SAMPLE_INTERVAL = 5  # in seconds - the cgroups are read at most once per interval, for all proxies at once
+RATE_WINDOW = 60  # in seconds - rates are averaged over this sliding window
+
+# Template instances live in a slice per template, e.g. system-iptv\x2dproxy.slice/iptv-proxy@9000.service.
+# Legacy per-port units are directly in system.slice until they are migrated.
+CGROUP_PATTERNS = ("system-iptv*.slice/iptv-proxy*@*.service", "iptv-proxy-*.service")
+UNIT_PATTERN = re.compile(r"^iptv-proxy(?:(?:-ondemand|-activator)?@|-)(\d+)(?:-activator)?\.service$")
+
+Counters = Dict[int, Dict[str, int]]  # port -> counter -> value, summed over the units of the proxy
+
+
+def _read_int(path: Path) -> Optional[int]:
+    try:
+        value = path.read_text().strip()
+    except OSError:
+        return None
+    return int(value) if value.isdigit() else None
+
+
+def _read_keyed(path: Path) -> Dict[str, int]:
+    """
+    'key value' lines like cpu.stat.
+    """
+    try:
+        lines = path.read_text().splitlines()
+    except OSError:
+        return {}
+    values = {}
+    for line in lines:
+        key, _, value = line.partition(" ")
+        if value.isdigit():
+            values[key] = int(value)
+    return values
+
+
+def _read_io(path: Path) -> Tuple[int, int]:
+    """
+    Read and written bytes over all devices of io.stat ('8:0 rbytes=1 wbytes=2 rios=3 ...').
+    """
+    read_bytes = write_bytes = 0
+    try:
+        lines = path.read_text().splitlines()
+    except OSError:
+        return 0, 0
+    for line in lines:
+        for field in line.split()[1:]:
+            key, _, value = field.partition("=")
+            if key == "rbytes":
+                read_bytes += int(value)
+            elif key == "wbytes":
+                write_bytes += int(value)
+    return read_bytes, write_bytes
+
+
+def read_cgroup(path: Path) -> Dict[str, int]:
+    """
+    Counters of one unit from its cgroup v2 files. memory.peak needs kernel 5.19.
+    """
+    read_bytes, write_bytes = _read_io(path / "io.stat")
+    counters = {
+        "cpu_usec": _read_keyed(path / "cpu.stat").get("usage_usec", 0),
+        "memory": _read_int(path / "memory.current") or 0,
+        "io_read": read_bytes,
+        "io_write": write_bytes,
+        "tasks": _read_int(path / "pids.current") or 0,
+    }
+    peak = _read_int(path / "memory.peak")
+    if peak is not None:
+        counters["memory_peak"] = peak
+    return counters
+
+
+def read_proxy_cgroups(root: Path = CGROUP_ROOT) -> Counters:
+    """
+    One pass over the cgroups of all running proxy units. A proxy can have several units,
+    e.g. an on-demand proxy and its activator, their counters are added up.
+    """
+    counters: Counters = {}
+    for pattern in CGROUP_PATTERNS:
+        for path in root.glob(pattern):
+            match = UNIT_PATTERN.match(path.name)
+            if not match:
+                continue
+            totals = counters.setdefault(int(match.group(1)), {})
+            for key, value in read_cgroup(path).items():
+                totals[key] = totals.get(key, 0) + value
+    return counters
+
+
+def _rate(current: Dict[str, int], previous: Dict[str, int], key: str, elapsed: float) -> float:
+    # A restarted unit starts its counters from zero, never report a negative rate
+    if elapsed <= 0 or key not in previous:
+        return 0.0
+    return max(0, current[key] - previous[key]) / elapsed
+
+
+class ResourceMonitor:
+    """
+    Samples the cgroups of all proxies at most once per interval and keeps a short history
+    to compute CPU and IO rates over a sliding window.
+    """
+
+    def __init__(self, root: Path = CGROUP_ROOT):
+        self.root = root
+        self._samples: Deque[Tuple[float, Counters]] = deque(maxlen=RATE_WINDOW // SAMPLE_INTERVAL + 1)
+        self._lock = threading.Lock()
+
+    def get_usage(self) -> Dict[int, dict]:
+        """
+        Resource usage per proxy port, only for proxies with a running unit.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if not self._samples or now - self._samples[-1][0] >= SAMPLE_INTERVAL:
+                try:
+                    self._samples.append((now, read_proxy_cgroups(self.root)))
+                except OSError as e:
+                    logger.warning(f"Cannot read the cgroups of the IPTV proxies: {e}")
+
+            if not self._samples:
+                return {}
+
+            latest_ts, latest = self._samples[-1]
+            base_ts, base = latest_ts, latest
+            previous_samples = list(self._samples)[:-1]
+            if previous_samples:
+                # Oldest sample inside the window, or the previous one if polling is sparser than the window
+                in_window = [sample for sample in previous_samples if latest_ts - sample[0] <= RATE_WINDOW]
+                base_ts, base = in_window[0] if in_window else previous_samples[-1]
+
+        elapsed = latest_ts - base_ts
+        usage = {}
+        for port, current in latest.items():
+            previous = base.get(port, {})
+            usage[port] = {
+                "cpu_seconds": round(current["cpu_usec"] / 1e6, 2),
+                "cpu_percent": round(_rate(current, previous, "cpu_usec", elapsed) / 1e4, 1),
+                "memory_bytes": current["memory"],
+                "memory_peak_bytes": current.get("memory_peak"),
+                "io_read_bytes": current["io_read"],
+                "io_write_bytes": current["io_write"],
+                "io_read_bps": round(_rate(current, previous, "io_read", elapsed), 1),
+                "io_write_bps": round(_rate(current, previous, "io_write", elapsed), 1),
+                "tasks": current["tasks"],
+            }
+        return usage
+
+
+resource_monitor = ResourceMonitor()
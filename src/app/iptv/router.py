@@ -1,10 +1,27 @@
-from fastapi import APIRouter, HTTPException, Path, status
+import gzip
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Path, Query, Request, Response, status
+from fastapi.responses import FileResponse, RedirectResponse, StreamingResponse
 
 from app.iptv import service
-from app.iptv.schemas import IPTVProxyCreate, IPTVProxyResponse, ServiceOperationResponse
+from app.iptv.schemas import (
+    BulkOperationResponse,
+    ChannelGroup,
+    ChannelPage,
+    EPGChannel,
+    EPGNowNext,
+    IPTVProxyBulkCreate,
+    IPTVProxyCreate,
+    IPTVProxyResponse,
+    ServiceOperationResponse,
+)
+from app.iptv.upstream import UpstreamValidationError
 
 # Initialize the router
 router = APIRouter()
+# Routes for IPTV players, authenticated with the credentials of a proxy instead of the API token
+player_router = APIRouter()
 
 
 @router.get("", response_model=list[IPTVProxyResponse], summary="List all IPTV Proxies")
@@ -23,19 +40,102 @@ def get_proxy(port: int = Path(..., ge=9000, le=9999, description="The port of t
     return service.get_service(port)
 
 
+@router.get("/{port}/channels", response_model=ChannelPage, summary="Search the channels of a Proxy")
+def get_channels(
+    port: int = Path(..., ge=9000, le=9999, description="The port of the proxy service"),
+    q: str = Query("", max_length=100, description="Case-insensitive prefix of the channel name"),
+    group: Optional[str] = Query(None, description="Only channels of this group-title"),
+    offset: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+):
+    """
+    Search the indexed playlist of a proxy, sorted by channel name.
+    The playlist is indexed in the background and refreshed after M3U_CACHE_EXPIRATION,
+    until the first index exists the endpoint answers 503.
+    """
+    return service.get_channels(port, q, group, offset, limit)
+
+
+@router.get("/{port}/channels/groups", response_model=list[ChannelGroup], summary="List the channel groups of a Proxy")
+def get_channel_groups(port: int = Path(..., ge=9000, le=9999, description="The port of the proxy service")):
+    """
+    All group-titles of the indexed playlist with their number of channels, usable as filter for /channels.
+    """
+    return service.get_channel_groups(port)
+
+
+@router.get("/{port}/epg", summary="Download the cached EPG of a Proxy", response_class=FileResponse)
+def get_epg(request: Request, port: int = Path(..., ge=9000, le=9999, description="The port of the proxy service")):
+    """
+    The full XMLTV guide of an Xtream proxy, fetched from the provider once per EPG_REFRESH_INTERVAL.
+    It is stored gzipped and sent as is to every client accepting gzip.
+    """
+    return _guide_response(request, service.get_guide_file(port))
+
+
+@player_router.get("/{port}/xmltv.php", summary="EPG of a Proxy for IPTV players", response_class=FileResponse)
+def get_player_epg(
+    request: Request,
+    port: int = Path(..., ge=9000, le=9999, description="The port of the proxy service"),
+    username: str = Query("", description="User of the proxy"),
+    password: str = Query("", description="Password of the proxy"),
+):
+    """
+    The cached guide of an Xtream proxy under the path players use, e.g. as EPG URL
+    http://<box>/api/v1/iptv/9001/xmltv.php?username=...&password=..., so they do not download it
+    from the provider every time. Until the guide is cached the player is redirected to the proxy.
+    """
+    path, proxy_url = service.get_player_guide(port, username, password)
+    if path is None:
+        query = request.url.query
+        return RedirectResponse(f"{proxy_url}/xmltv.php?{query}", status_code=status.HTTP_307_TEMPORARY_REDIRECT)
+    return _guide_response(request, path)
+
+
+def _guide_response(request: Request, path) -> Response:
+    if "gzip" in request.headers.get("accept-encoding", ""):
+        return FileResponse(path, media_type="application/xml", headers={"Content-Encoding": "gzip"})
+
+    def decompress():
+        with gzip.open(path, "rb") as f:
+            while chunk := f.read(64 * 1024):
+                yield chunk
+
+    return StreamingResponse(decompress(), media_type="application/xml")
+
+
+@router.get("/{port}/epg/channels", response_model=list[EPGChannel], summary="List the EPG channels of a Proxy")
+def get_epg_channels(port: int = Path(..., ge=9000, le=9999, description="The port of the proxy service")):
+    return service.get_epg_channels(port)
+
+
+@router.get("/{port}/epg/now", response_model=EPGNowNext, summary="What is on now and next on a channel")
+def get_epg_now(
+    port: int = Path(..., ge=9000, le=9999, description="The port of the proxy service"),
+    channel: str = Query(..., max_length=512, description="XMLTV channel id, e.g. the tvg-id of a channel"),
+    upcoming: int = Query(1, ge=1, le=20, description="Number of programmes after the current one"),
+):
+    return service.get_now_next(port, channel, upcoming)
+
+
 @router.post(
     "",
     response_model=ServiceOperationResponse,
     status_code=status.HTTP_201_CREATED,
     summary="Create a new IPTV Proxy",
 )
-def create_proxy(data: IPTVProxyCreate):
+def create_proxy(
+    data: IPTVProxyCreate,
+    validate: bool = Query(True, description="Check the M3U URL or Xtream account before creating the proxy"),
+):
     """
     Create a new systemd service for an IPTV proxy.
     Automatically assigns a free port between 9000-9999.
     """
     try:
-        return service.create_service(data)
+        return service.create_service(data, validate)
+    except UpstreamValidationError as ve:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_CONTENT, detail=str(ve)) from ve
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -43,19 +143,53 @@ def create_proxy(data: IPTVProxyCreate):
         ) from e
 
 
+@router.post(
+    "/bulk",
+    response_model=BulkOperationResponse,
+    status_code=status.HTTP_201_CREATED,
+    summary="Create several IPTV Proxies at once",
+)
+def create_proxies(
+    data: IPTVProxyBulkCreate,
+    response: Response,
+    validate: bool = Query(True, description="Check all upstreams before creating any proxy"),
+):
+    """
+    Create all proxies of the list or none of them.
+    If an upstream fails the validation nothing is created (status 422), if one proxy cannot be
+    created the others are removed again (status 500). The response reports the result of every proxy.
+    """
+    try:
+        result = service.create_services(data.proxies, validate)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to create services: {str(e)}",
+        ) from e
+
+    if result.result == "rejected":
+        response.status_code = status.HTTP_422_UNPROCESSABLE_CONTENT
+    elif result.result != "ok":
+        response.status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
+    return result
+
+
 @router.put("/{port}", response_model=ServiceOperationResponse, summary="Update Proxy")
 def update_proxy(
     data: IPTVProxyCreate,
     port: int = Path(..., ge=9000, le=9999, description="The port of the proxy service"),
+    validate: bool = Query(True, description="Check the M3U URL or Xtream account before updating the proxy"),
 ):
     """
     Update configuration for an existing proxy.
     This overwrites the service file and restarts the service.
     """
     try:
-        return service.update_service(port, data)
+        return service.update_service(port, data, validate)
     except FileNotFoundError as fe:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Proxy on port {port} not found.") from fe
+    except UpstreamValidationError as ve:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_CONTENT, detail=str(ve)) from ve
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
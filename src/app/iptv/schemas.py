@@ -3,7 +3,7 @@ from enum import Enum
 from typing import Optional
 from urllib.parse import urlparse
 
-from pydantic import BaseModel, ConfigDict, Field, HttpUrl, computed_field, field_validator
+from pydantic import BaseModel, ConfigDict, Field, HttpUrl, computed_field, field_validator, model_validator
 
 
 class ProxyMode(str, Enum):
@@ -11,11 +11,19 @@ class ProxyMode(str, Enum):
     XTREAM = "xtream"
 
 
+class ActivationMode(str, Enum):
+    ALWAYS = "always"
+    ON_DEMAND = "on_demand"
+    SHARED = "shared"  # served by the one IPTV proxy host process together with all other shared proxies
+
+
 class ServiceStatus(str, Enum):
     RUNNING = "running"
     STOPPED = "stopped"
     STARTING = "starting"
     FAILED = "failed"
+    IDLE = "idle"  # on-demand proxy waiting for its first connection
+    SUSPENDED = "suspended"  # disabled by the crash-loop detector
 
 
 class ServiceAction(str, Enum):
@@ -67,6 +75,17 @@ class IPTVProxyCreate(IPTVProxyBase):
     xtream_user: Optional[str] = None
     xtream_password: Optional[str] = None
     xtream_base_url: Optional[str] = None
+    activation: ActivationMode = Field(
+        ActivationMode.ALWAYS,
+        description="'always' keeps the proxy running, 'on_demand' starts it on the first connection "
+        "and stops it again when idle, 'shared' serves it from one host process for all shared proxies",
+    )
+    memory_max: Optional[int] = Field(
+        None, ge=16, description="Memory limit of the proxy in MiB (systemd MemoryMax), not for shared proxies"
+    )
+    cpu_quota: Optional[int] = Field(
+        None, ge=1, le=400, description="CPU limit in percent of one core (systemd CPUQuota), not for shared proxies"
+    )
 
     @field_validator("xtream_base_url")
     @classmethod
@@ -86,6 +105,44 @@ class IPTVProxyCreate(IPTVProxyBase):
                 raise ValueError("Xtream credentials must not contain spaces.")
         return v
 
+    @model_validator(mode="after")
+    def validate_limits(self):
+        # Shared proxies run in the one host process, a limit of a single proxy cannot be applied
+        if self.activation == ActivationMode.SHARED and (self.memory_max or self.cpu_quota):
+            raise ValueError("Memory and CPU limits are not available for shared proxies.")
+        return self
+
+
+class ProxyResources(BaseModel):
+    cpu_seconds: float = Field(..., description="CPU time used since the start of the units")
+    cpu_percent: float = Field(..., description="CPU usage over the last minute, 100 is one full core")
+    memory_bytes: int
+    memory_peak_bytes: Optional[int] = Field(None, description="None on kernels without memory.peak")
+    io_read_bytes: int
+    io_write_bytes: int
+    io_read_bps: float = Field(..., description="Bytes read per second over the last minute")
+    io_write_bps: float = Field(..., description="Bytes written per second over the last minute")
+    tasks: int = Field(..., description="Processes and threads")
+
+
+class ProxyHealthCheck(BaseModel):
+    ok: bool
+    http_status: Optional[int] = Field(None, description="None if the proxy did not answer")
+    detail: str
+    latency_ms: float
+    checked_at: float
+
+
+class ProxyHealth(BaseModel):
+    status: str = Field(..., description="'ok', 'failing', or 'unknown' if the last check is too old")
+    checked_at: float
+    latency_ms: float
+    http_status: Optional[int] = None
+    detail: str
+    consecutive_failures: int
+    success_rate: float = Field(..., description="Share of successful checks in the history")
+    history: list[ProxyHealthCheck] = Field(..., description="Latest checks, oldest first")
+
 
 class IPTVProxyResponse(IPTVProxyCreate):
     port: int = Field(..., ge=9000, le=9999, description="Proxy port")
@@ -95,6 +152,9 @@ class IPTVProxyResponse(IPTVProxyCreate):
     enabled: bool = Field(..., description="Systemd 'enabled' Status")
     status_detail: ServiceStatus
     proxy_url: HttpUrl
+    suspended_reason: Optional[str] = Field(None, description="Why the crash-loop detector disabled the proxy")
+    resources: Optional[ProxyResources] = Field(None, description="Usage of the proxy's cgroup, None while stopped")
+    health: Optional[ProxyHealth] = Field(None, description="Latest HTTP health checks, None while not running")
     model_config = ConfigDict(from_attributes=True)
 
     @computed_field(description="ID as alias for the port")
@@ -106,5 +166,60 @@ class IPTVProxyResponse(IPTVProxyCreate):
 class ServiceOperationResponse(BaseModel):
     action: ServiceAction
     result: str = Field(..., description="Result of the operation, e.g. 'ok'")
+    port: Optional[int] = Field(None, description="None if no port was assigned")
+    service_name: Optional[str] = None
+    detail: Optional[str] = Field(None, description="Reason if the operation failed")
+
+
+class IPTVProxyBulkCreate(BaseModel):
+    proxies: list[IPTVProxyCreate] = Field(..., min_length=1, max_length=100)
+
+
+class BulkOperationResponse(BaseModel):
+    result: str = Field(
+        ...,
+        description="'ok' if every proxy was created, 'rolled_back' if none was, "
+        "'rejected' if an upstream failed the validation and nothing was written",
+    )
+    items: list[ServiceOperationResponse] = Field(..., description="One result per proxy, in request order")
+
+
+class Channel(BaseModel):
+    name: str
+    group: Optional[str] = Field(None, description="group-title of the playlist entry")
+    tvg_id: Optional[str] = Field(None, description="tvg-id, links the channel to the EPG")
+
+
+class ChannelGroup(BaseModel):
+    name: Optional[str] = Field(None, description="None for the channels without group")
+    channels: int = Field(..., description="Number of channels in the group")
+
+
+class ChannelPage(BaseModel):
     port: int
-    service_name: str
+    total: int = Field(..., description="Number of matching channels")
+    offset: int
+    limit: int
+    indexed_at: float = Field(..., description="Unix time the playlist was downloaded")
+    items: list[Channel]
+
+
+class EPGProgramme(BaseModel):
+    start: int = Field(..., description="Unix time")
+    stop: int = Field(..., description="Unix time")
+    title: str
+    description: Optional[str] = None
+
+
+class EPGChannel(BaseModel):
+    id: str = Field(..., description="XMLTV channel id, matches the tvg-id of the playlist")
+    name: Optional[str] = None
+    programmes: int = Field(..., description="Number of cached programmes")
+
+
+class EPGNowNext(BaseModel):
+    channel_id: str
+    name: Optional[str] = None
+    now: Optional[EPGProgramme] = Field(None, description="None if nothing is running")
+    next: list[EPGProgramme]
+    fetched_at: float = Field(..., description="Unix time the guide was downloaded")
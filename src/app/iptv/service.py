@@ -1,45 +1,113 @@
+import asyncio
 import glob
 import os
 import re
+import secrets
 import shlex
 import socket
-import subprocess
+import threading
+import time
+from collections import deque
 from pathlib import Path
+from typing import Deque, Dict, Optional, Tuple
+from urllib.parse import urlencode
 
 from fastapi import HTTPException
 
+from app.core.config import get_settings
 from app.core.logger import logger
-from app.core.utils import run_command
-from app.iptv.schemas import IPTVProxyCreate, IPTVProxyResponse, ServiceOperationResponse, ServiceStatus
+from app.core.systemd import ENABLED_STATES, units
+from app.iptv import epg, health, playlist, upstream
+from app.iptv.resources import resource_monitor
+from app.iptv.schemas import (
+    ActivationMode,
+    BulkOperationResponse,
+    Channel,
+    ChannelGroup,
+    ChannelPage,
+    EPGChannel,
+    EPGNowNext,
+    EPGProgramme,
+    IPTVProxyCreate,
+    IPTVProxyResponse,
+    ServiceOperationResponse,
+    ServiceStatus,
+)
+
+settings = get_settings()
 
 SERVICE_DIR = "/etc/systemd/system"
 SCRIPT_DIR = "/usr/local/bin"
 PORT_RANGE = range(9000, 9999 + 1)
 M3U_CACHE_EXPIRATION = 6  # in hours - CAUTION: Do not change unless you also change /usr/bin/local/cleanup_iptv_tmp.sh
 
+# All proxies are instances of static templates, the instance name is the port. A proxy only consists of
+# its script /usr/local/bin/iptv-proxy-<port>.sh, so adding or changing one needs no daemon-reload.
+PROXY_TEMPLATE = "iptv-proxy@.service"
+ON_DEMAND_TEMPLATE = "iptv-proxy-ondemand@.service"
+SOCKET_TEMPLATE = "iptv-proxy@.socket"
+ACTIVATOR_TEMPLATE = "iptv-proxy-activator@.service"
+LEGACY_UNIT_PATTERN = re.compile(r"^iptv-proxy-(\d+)\.service$")  # per-port units before the templates
+SCRIPT_PATTERN = re.compile(r"^iptv-proxy-(\d+)\.sh$")
+
+# On-demand proxies: the public port is held by a socket unit, the first connection starts the proxy
+SOCKET_PROXYD = "/usr/lib/systemd/systemd-socket-proxyd"
+IDLE_TIMEOUT = 600  # in seconds - without any connection for this long, the proxy is stopped again
+INTERNAL_PORT_OFFSET = 10000  # the proxy itself listens on port + offset, on localhost behind the socket
+PROXY_START_TIMEOUT = 15  # in seconds - until the proxy has to accept connections after its start
+
+# Shared proxies: one host process (app.iptv.host) serves all of them, it picks up changed scripts by itself
+HOST_UNIT = "iptv-proxy-host.service"
+HOST_RELEASE_TIMEOUT = 5  # in seconds - until the host has closed the port of a proxy leaving it
+
+# A proxy restarting this often within the window is stopped and disabled. With RestartSec=20 a proxy
+# that dies right after its start restarts 45 times in 15 minutes, a flaky upstream only now and then.
+CRASH_LOOP_CHECK_INTERVAL = 60  # in seconds
+CRASH_LOOP_RESTARTS = 10
+CRASH_LOOP_WINDOW = 15 * 60  # in seconds
+
+UnitStates = Tuple[Dict[str, str], Dict[str, Optional[str]]]  # ActiveState and unit file state per unit name
+
+_templates_checked = False
+_restart_samples: Dict[str, Deque[Tuple[float, int]]] = {}  # unit -> (monotonic time, NRestarts)
+# Held from choosing a port until its script exists, so concurrent requests never pick the same port
+_provision_lock = threading.Lock()
+
 
 def _get_next_free_port() -> int:
     """
     Finds the next free port in the PORT_RANGE.
     """
-    existing_ports = set()
-    files = glob.glob(os.path.join(SERVICE_DIR, "iptv-proxy-*.service"))
+    return _get_free_ports(1)[0]
 
-    for f in files:
-        match = re.search(r"iptv-proxy-(\d+)\.service", f)
-        if match:
-            existing_ports.add(int(match.group(1)))
 
-    for port in PORT_RANGE:
-        if port not in existing_ports:
-            return port
+def _get_free_ports(count: int) -> list[int]:
+    """
+    Finds the next `count` free ports in the PORT_RANGE.
+    """
+    existing_ports = set(_get_ports())
+    free_ports = [port for port in PORT_RANGE if port not in existing_ports][:count]
+
+    if len(free_ports) < count:
+        raise ResourceWarning(f"No free ports available in the range {PORT_RANGE[0]}-{PORT_RANGE[-1]}!")
+    return free_ports
+
 
-    raise ResourceWarning(f"No free ports available in the range {PORT_RANGE[0]}-{PORT_RANGE[-1]}!")
+def _get_ports() -> list[int]:
+    """
+    Ports of all proxies, taken from their scripts.
+    """
+    ports = []
+    for script_file in glob.glob(os.path.join(SCRIPT_DIR, "iptv-proxy-*.sh")):
+        match = SCRIPT_PATTERN.match(os.path.basename(script_file))
+        if match:
+            ports.append(int(match.group(1)))
+    return ports
 
 
 def _get_description_from_unit(service_path: str) -> str:
     """
-    Reads the description directly from the service file.
+    Reads the description directly from a legacy per-port service file.
     """
     try:
         with open(service_path, "r", encoding="utf-8") as f:
@@ -74,7 +142,8 @@ def _parse_script_content(filepath: str) -> dict | None:
     try:
         with open(filepath, "r") as f:
             content = f.read()
-        tokens = shlex.split(content)
+        # The header comments hold metadata, a name like '--user' must not be taken for a flag
+        tokens = shlex.split(content, comments=True)
 
         data = {}
 
@@ -98,24 +167,230 @@ def _parse_script_content(filepath: str) -> dict | None:
                     data[key_map[token]] = value
                 except StopIteration:
                     pass
-        print(data)
         return data
     except Exception as e:
         logger.error(f"Error parsing {filepath}: {str(e)}")
         return None
 
 
+def _read_script_metadata(script_path: str) -> Dict[str, str]:
+    """
+    Reads the '# Key: value' header lines of a proxy script, e.g. {'name': 'Kids', 'activation': 'always'}.
+    'suspended' holds the reason if the crash-loop detector has disabled the proxy,
+    'memorymax' and 'cpuquota' the resource limits like '256M' and '50%'.
+    """
+    metadata = {}
+    try:
+        with open(script_path, "r", encoding="utf-8") as f:
+            for line in f:
+                match = re.match(r"^# (Name|Activation|Suspended|MemoryMax|CPUQuota): (.*)$", line.rstrip("\n"))
+                if match:
+                    metadata[match.group(1).lower()] = match.group(2)
+    except OSError as e:
+        logger.warning(f"Cannot read proxy script {script_path}: {e}")
+    return metadata
+
+
+def _instance(template: str, port: int) -> str:
+    return template.replace("@.", f"@{port}.")
+
+
+def _get_activation(port: int) -> ActivationMode:
+    metadata = _read_script_metadata(os.path.join(SCRIPT_DIR, f"iptv-proxy-{port}.sh"))
+    try:
+        return ActivationMode(metadata.get("activation", ActivationMode.ALWAYS.value))
+    except ValueError:
+        return ActivationMode.ALWAYS
+
+
+def _proxy_unit(port: int, activation: ActivationMode) -> str:
+    """
+    The unit running the proxy process.
+    """
+    if activation == ActivationMode.SHARED:
+        return HOST_UNIT
+    return _instance(ON_DEMAND_TEMPLATE if activation == ActivationMode.ON_DEMAND else PROXY_TEMPLATE, port)
+
+
+def _limit_properties(data: IPTVProxyCreate) -> Dict[str, Optional[int]]:
+    """
+    Resource control properties of the proxy unit. Unset limits are passed as None, which resets them,
+    so a proxy never inherits the limits of an earlier proxy on the same port.
+    """
+    return {
+        "MemoryMax": data.memory_max * 1024 * 1024 if data.memory_max else None,
+        # CPUQuota=50% is stored as 500ms CPU time per second
+        "CPUQuotaPerSecUSec": data.cpu_quota * 10_000 if data.cpu_quota else None,
+    }
+
+
+def _read_limits(metadata: Dict[str, str]) -> Dict[str, Optional[int]]:
+    limits = {
+        "memory_max": metadata.get("memorymax", "").rstrip("M"),
+        "cpu_quota": metadata.get("cpuquota", "").rstrip("%"),
+    }
+    return {key: int(value) if value.isdigit() else None for key, value in limits.items()}
+
+
+def _entry_unit(port: int, activation: ActivationMode) -> str:
+    """
+    The unit that is enabled and started: the proxy itself, or the socket holding its port.
+    """
+    return _instance(SOCKET_TEMPLATE, port) if activation == ActivationMode.ON_DEMAND else _proxy_unit(port, activation)
+
+
+def _mode_units(port: int, activation: ActivationMode) -> list[str]:
+    """
+    All units that can be running for a proxy in the given mode. The host of the shared proxies
+    is not one of them, it is never stopped for a single proxy.
+    """
+    if activation == ActivationMode.SHARED:
+        return []
+    if activation == ActivationMode.ON_DEMAND:
+        return [
+            _instance(SOCKET_TEMPLATE, port),
+            _instance(ACTIVATOR_TEMPLATE, port),
+            _instance(ON_DEMAND_TEMPLATE, port),
+        ]
+    return [_instance(PROXY_TEMPLATE, port)]
+
+
+def _dedicated_entry_units(port: int, activation: ActivationMode) -> list[str]:
+    """
+    The entry unit if it belongs to this proxy alone, the only one to disable when the proxy goes.
+    """
+    return [] if activation == ActivationMode.SHARED else [_entry_unit(port, activation)]
+
+
+def _remove_service_files(port: int) -> None:
+    Path(os.path.join(SCRIPT_DIR, f"iptv-proxy-{port}.sh")).unlink(missing_ok=True)
+
+
+def _unit_templates() -> Dict[str, str]:
+    internal_port = f"$$((%i + {INTERNAL_PORT_OFFSET}))"  # '$$' keeps systemd from expanding it
+    wait_for_port = (
+        f"for i in $$(seq {PROXY_START_TIMEOUT * 10}); do "
+        f"(exec 3<>/dev/tcp/127.0.0.1/{internal_port}) 2>/dev/null && exit 0; sleep 0.1; done; exit 1"
+    )
+    service_section = (
+        "[Service]\n"
+        "User=iptvproxy\n"
+        "Group=iptvproxy\n"
+        f"ExecStart={SCRIPT_DIR}/iptv-proxy-%i.sh\n"
+        "StandardOutput=null\n"
+        "StandardError=null\n"
+        "RestartSec=20\n"
+        "BindReadOnlyPaths=/etc/resolv.iptv-proxy.conf:/etc/resolv.conf\n"
+    )
+    return {
+        PROXY_TEMPLATE: (
+            "[Unit]\n"
+            "Description=IPTV proxy on port %i\n"
+            "After=network.target openvpn@client.service\n"
+            "Requires=openvpn@client.service\n"
+            f"Conflicts={SOCKET_TEMPLATE.replace('@.', '@%i.')}\n\n"
+            f"{service_section}"
+            "Restart=always\n\n"
+            "[Install]\n"
+            "WantedBy=multi-user.target\n"
+        ),
+        # Started by the activator, only active once the proxy accepts connections, stopped with the activator
+        ON_DEMAND_TEMPLATE: (
+            "[Unit]\n"
+            "Description=IPTV proxy on port %i (on-demand)\n"
+            "After=network.target openvpn@client.service\n"
+            "Requires=openvpn@client.service\n"
+            "StopWhenUnneeded=yes\n\n"
+            f"{service_section}"
+            f"ExecStartPost=/bin/bash -c '{wait_for_port}'\n"
+            "Restart=on-failure\n"
+        ),
+        SOCKET_TEMPLATE: (
+            "[Unit]\n"
+            "Description=IPTV proxy socket on port %i\n\n"
+            "[Socket]\n"
+            "ListenStream=%i\n"
+            f"Service={ACTIVATOR_TEMPLATE.replace('@.', '@%i.')}\n\n"
+            "[Install]\n"
+            "WantedBy=sockets.target\n"
+        ),
+        # Forwards the connections of the socket and exits after IDLE_TIMEOUT without any
+        ACTIVATOR_TEMPLATE: (
+            "[Unit]\n"
+            "Description=IPTV proxy activator on port %i\n"
+            f"Requires={ON_DEMAND_TEMPLATE.replace('@.', '@%i.')}\n"
+            f"After={ON_DEMAND_TEMPLATE.replace('@.', '@%i.')}\n\n"
+            "[Service]\n"
+            f"ExecStart=/bin/sh -c 'exec {SOCKET_PROXYD} --exit-idle-time={IDLE_TIMEOUT}s 127.0.0.1:{internal_port}'\n"
+            "DynamicUser=yes\n"
+            "PrivateTmp=yes\n"
+        ),
+        # Serves every shared proxy from one process, SIGHUP re-reads the scripts at once. The cached EPG of the
+        # API is served to the players of every proxy
+        HOST_UNIT: (
+            "[Unit]\n"
+            "Description=Shared IPTV proxy host\n"
+            "After=network.target openvpn@client.service\n"
+            "Requires=openvpn@client.service\n\n"
+            "[Service]\n"
+            "User=iptvproxy\n"
+            "Group=iptvproxy\n"
+            f"Environment=PYTHONPATH={settings.WORKING_DIR}/src\n"
+            f"ExecStart={settings.WORKING_DIR}/.venv/bin/python -m app.iptv.host {SCRIPT_DIR} {playlist.INDEX_DIR}\n"
+            "ExecReload=/bin/kill -HUP $MAINPID\n"
+            "CacheDirectory=iptv-proxy-host\n"
+            "RestartSec=20\n"
+            "Restart=always\n"
+            "BindReadOnlyPaths=/etc/resolv.iptv-proxy.conf:/etc/resolv.conf\n\n"
+            "[Install]\n"
+            "WantedBy=multi-user.target\n"
+        ),
+    }
+
+
+def ensure_unit_templates() -> None:
+    """
+    Writes the unit templates if they are missing or outdated. Only then a daemon-reload is needed.
+    """
+    global _templates_checked
+    if _templates_checked:
+        return
+
+    changed = False
+    for name, content in _unit_templates().items():
+        path = Path(SERVICE_DIR) / name
+        try:
+            current = path.read_text()
+        except FileNotFoundError:
+            current = None
+        if current != content:
+            path.write_text(content)
+            changed = True
+
+    if changed:
+        logger.info("IPTV proxy unit templates written")
+        units.run(units.daemon_reload())
+    _templates_checked = True
+
+
 def _write_service_files(port: int, data: IPTVProxyCreate) -> str:
     """
-    Creates .sh and .service files physically on the disk.
+    Creates the .sh file physically on the disk, it is the only per-port file of a proxy.
+    Returns the unit to enable and start. Resource limits are recorded in the script header,
+    they are set on the instance with _apply_limits(), as a template cannot vary them per instance.
     """
     if "\n" in data.name or "\r" in data.name:
         raise ValueError("Security breach: Name contains newlines.")
 
-    service_name = f"iptv-proxy-{port}.service"
+    on_demand = data.activation == ActivationMode.ON_DEMAND
     script_name = f"iptv-proxy-{port}.sh"
     script_path = os.path.join(SCRIPT_DIR, script_name)
-    service_path = os.path.join(SERVICE_DIR, service_name)
+
+    # An on-demand proxy listens on an internal port, but advertises the public one in its playlists
+    listen_port = port + INTERNAL_PORT_OFFSET if on_demand else port
+    port_args = [("--port", str(listen_port))]
+    if on_demand:
+        port_args.append(("--advertised-port", str(port)))
 
     base_cmd = ["/usr/local/bin/iptv-proxy"]
     cmd_args_list = []
@@ -130,7 +405,7 @@ def _write_service_files(port: int, data: IPTVProxyCreate) -> str:
         )
 
         cmd_args_list.append(("--m3u-url", full_m3u_url))
-        cmd_args_list.append(("--port", str(port)))
+        cmd_args_list.extend(port_args)
         cmd_args_list.append(("--hostname", data.hostname))
         cmd_args_list.append(("--xtream-user", data.xtream_user))
         cmd_args_list.append(("--xtream-password", data.xtream_password))
@@ -144,7 +419,7 @@ def _write_service_files(port: int, data: IPTVProxyCreate) -> str:
             raise ValueError("m3u URL is missing")
 
         cmd_args_list.append(("--m3u-url", data.m3u_url))
-        cmd_args_list.append(("--port", str(port)))
+        cmd_args_list.extend(port_args)
         cmd_args_list.append(("--hostname", data.hostname))
         cmd_args_list.append(("--user", data.user))
         cmd_args_list.append(("--password", data.password))
@@ -159,62 +434,87 @@ def _write_service_files(port: int, data: IPTVProxyCreate) -> str:
         base_cmd.append(f"  {flag} {safe_value}")
     full_command = " \\\n".join(base_cmd)
 
-    script_content = f"#!/bin/bash\n\n# Auto-generated by FastAPI Controller\n{full_command}\n"
-
-    unit_content = (
-        "[Unit]\n"
-        f"Description={data.name}\n"
-        "After=network.target openvpn@client.service\n"
-        "Requires=openvpn@client.service\n\n"
-        "[Service]\n"
-        "User=iptvproxy\n"
-        "Group=iptvproxy\n"
-        f"ExecStart={script_path}\n"
-        "StandardOutput=null\n"
-        "StandardError=null\n"
-        "Restart=always\n"
-        "RestartSec=20\n"
-        "BindReadOnlyPaths=/etc/resolv.iptv-proxy.conf:/etc/resolv.conf\n\n"
-        "[Install]\n"
-        "WantedBy=multi-user.target\n"
+    limits = ""
+    if data.memory_max:
+        limits += f"# MemoryMax: {data.memory_max}M\n"
+    if data.cpu_quota:
+        limits += f"# CPUQuota: {data.cpu_quota}%\n"
+
+    script_content = (
+        "#!/bin/bash\n\n"
+        "# Auto-generated by FastAPI Controller\n"
+        f"# Name: {data.name}\n"
+        f"# Activation: {data.activation.value}\n"
+        f"{limits}"
+        f"{full_command}\n"
     )
 
+    # Written to a temporary file first, a running proxy may restart at any time and read the script
+    tmp_path = f"{script_path}.tmp"
     try:
-        with open(script_path, "w") as f:
+        with open(tmp_path, "w") as f:
             f.write(script_content)
-        os.chmod(script_path, 0o755)
-
-        with open(service_path, "w") as f:
-            f.write(unit_content)
+        os.chmod(tmp_path, 0o755)
+        os.replace(tmp_path, script_path)
 
     except OSError as e:
         # Cleanup
-        if os.path.exists(script_path):
-            os.remove(script_path)
-        if os.path.exists(service_path):
-            os.remove(service_path)
+        Path(tmp_path).unlink(missing_ok=True)
         raise RuntimeError(f"Error writing service file: {e}") from e
 
-    return service_name
+    return _entry_unit(port, data.activation)
+
+
+async def _apply_limits(port: int, data: IPTVProxyCreate) -> None:
+    """
+    Sets the limits on the instance running the proxy. systemd applies them to a running unit at once
+    and keeps them in a drop-in of its own, so neither a unit file nor a daemon-reload is needed.
+    A shared proxy has no process of its own to limit.
+    """
+    if data.activation == ActivationMode.SHARED:
+        return
+    await units.set_properties(_proxy_unit(port, data.activation), _limit_properties(data))
+
 
+def _read_unit_states(ports: list[int]) -> UnitStates:
+    """
+    Reads the state of the units of all given proxies with a few manager calls, instead of three forks per unit.
+    """
+    active_names, entry_names = [], []
+    for port in ports:
+        activation = _get_activation(port)
+        active_names.extend(_mode_units(port, activation))
+        entry_names.append(_entry_unit(port, activation))
+    # Shared proxies all have the host as their entry unit, it is read once
+    active_names = list(dict.fromkeys(active_names + entry_names))
+    entry_names = list(dict.fromkeys(entry_names))
+
+    async def read() -> UnitStates:
+        active_states, file_states = await asyncio.gather(
+            units.active_states(*active_names), units.enablement(*entry_names)
+        )
+        return active_states, file_states
+
+    return units.run(read())
 
-def _get_service_data(port: int) -> IPTVProxyResponse | None:
+
+def _get_service_data(
+    port: int, unit_states: Optional[UnitStates] = None, usage: Optional[Dict[int, dict]] = None
+) -> IPTVProxyResponse | None:
     """
     Central logic: Collects all information for a specific port.
     Returns None if the files are missing or corrupt.
+    `unit_states` and the cgroup `usage` can be passed in when they were read for several proxies at once.
     """
-    service_name = f"iptv-proxy-{port}.service"
-    script_name = f"iptv-proxy-{port}.sh"
+    script_path = os.path.join(SCRIPT_DIR, f"iptv-proxy-{port}.sh")
 
-    service_path = os.path.join(SERVICE_DIR, service_name)
-    script_path = os.path.join(SCRIPT_DIR, script_name)
-
-    if not os.path.exists(service_path) or not os.path.exists(script_path):
+    if not os.path.exists(script_path):
         return None
 
     try:
         config = _parse_script_content(script_path)
-        service_name_ui = _get_description_from_unit(service_path)
+        metadata = _read_script_metadata(script_path)
+        service_name_ui = metadata.get("name", "Unknown service")
 
         hostname = config.get("hostname")
 
@@ -227,30 +527,32 @@ def _get_service_data(port: int) -> IPTVProxyResponse | None:
             pw = config.get("password", "")
             proxy_url = f"http://{hostname}:{port}/iptv.m3u?username={user}&password={pw}"
 
-        is_active = False
-        is_enabled = False
-        try:
-            subprocess.run(["systemctl", "is-active", "--quiet", service_name], check=True)
-            is_active = True
-        except subprocess.CalledProcessError:
-            pass
-
-        try:
-            subprocess.run(["systemctl", "is-enabled", "--quiet", service_name], check=True)
-            is_enabled = True
-        except subprocess.CalledProcessError:
-            pass
+        activation = _get_activation(port)
+        service_name = _proxy_unit(port, activation)
+        entry_unit = _entry_unit(port, activation)
+        active_states, file_states = unit_states or _read_unit_states([port])
+        if usage is None:
+            usage = resource_monitor.get_usage()
+        service_state = active_states.get(service_name, "inactive")
+        entry_state = active_states.get(entry_unit, "inactive")
+        # For an on-demand proxy 'active' and 'enabled' refer to its socket
+        is_active = entry_state == "active"
+        is_enabled = file_states.get(entry_unit) in ENABLED_STATES
 
         status_detail = ServiceStatus.STOPPED
-        if is_active:
-            if _is_port_open(port):
+        if service_state == "active":
+            # Never probe the socket of an on-demand proxy, the connection would start it
+            listen_port = port + INTERNAL_PORT_OFFSET if activation == ActivationMode.ON_DEMAND else port
+            if _is_port_open(listen_port):
                 status_detail = ServiceStatus.RUNNING
             else:
                 status_detail = ServiceStatus.STARTING
-        else:
-            _, stdout, _ = run_command(["systemctl", "show", "-p", "ActiveState", service_name])
-            if "failed" in stdout:
-                status_detail = ServiceStatus.FAILED
+        elif metadata.get("suspended"):
+            status_detail = ServiceStatus.SUSPENDED
+        elif "failed" in (service_state, entry_state):
+            status_detail = ServiceStatus.FAILED
+        elif is_active:
+            status_detail = ServiceStatus.IDLE
 
         context = {
             "id": port,
@@ -258,10 +560,15 @@ def _get_service_data(port: int) -> IPTVProxyResponse | None:
             "mode": mode,
             "name": service_name_ui,
             "filename": service_name,
+            "activation": activation,
             "active": is_active,
             "enabled": is_enabled,
             "status_detail": status_detail,
             "proxy_url": proxy_url,
+            "suspended_reason": metadata.get("suspended"),
+            "resources": usage.get(port),
+            "health": health.proxy_health.get(port),
+            **_read_limits(metadata),
             **config,  # spread operator for m3u_url, xtream settings etc.
         }
         return IPTVProxyResponse.model_validate(context)
@@ -277,17 +584,14 @@ def get_all_services() -> list[IPTVProxyResponse]:
     """
     services = []
 
-    files = glob.glob(os.path.join(SERVICE_DIR, "iptv-proxy-*.service"))
-
-    for service_file in files:
-        # get port from filename
-        match = re.search(r"iptv-proxy-(\d+)\.service", os.path.basename(service_file))
-        if not match:
-            continue
-
-        port = int(match.group(1))
+    ports = _get_ports()
+    if not ports:
+        return services
+    unit_states = _read_unit_states(ports)
+    usage = resource_monitor.get_usage()
 
-        data = _get_service_data(port)
+    for port in ports:
+        data = _get_service_data(port, unit_states, usage)
 
         if data:
             services.append(data)
@@ -309,15 +613,59 @@ def get_service(port: int) -> IPTVProxyResponse:
     return data
 
 
-def create_service(data: IPTVProxyCreate) -> ServiceOperationResponse:
-    port = _get_next_free_port()
+async def _restart_proxy(port: int, activation: ActivationMode) -> bool:
+    """
+    Restarts a proxy. An on-demand proxy is stopped instead, the next connection starts it with
+    the new configuration.
+    """
+    if activation == ActivationMode.ALWAYS:
+        return await units.restart(_proxy_unit(port, activation))
+    if activation == ActivationMode.SHARED:
+        # Restarting the host would cut the streams of every shared proxy. Touching the script marks only
+        # this proxy as restarted, the host drops its listener and cached playlist.
+        await asyncio.to_thread(os.utime, os.path.join(SCRIPT_DIR, f"iptv-proxy-{port}.sh"))
+        return await units.reload_or_restart(HOST_UNIT)
+    socket_name, activator_name, service_name = _mode_units(port, activation)
+    await units.stop(activator_name, service_name)
+    return await units.restart(socket_name)
+
+
+def _wait_for_host_release(port: int) -> None:
+    """
+    The host closes the port of a proxy leaving it on its next look at the scripts. Waiting for that
+    keeps the dedicated unit from failing to bind the port and waiting RestartSec.
+    """
+    deadline = time.monotonic() + HOST_RELEASE_TIMEOUT
+    while _is_port_open(port) and time.monotonic() < deadline:
+        time.sleep(0.2)
 
+
+def _validate_upstream(data: IPTVProxyCreate) -> None:
+    """
+    Rejects a proxy whose upstream does not work, before anything is written. Otherwise its unit
+    would restart every RestartSec forever.
+    """
+    result = upstream.validate_upstreams([data])[0]
+    if not result.ok:
+        raise upstream.UpstreamValidationError(result.detail)
+
+
+def create_service(data: IPTVProxyCreate, validate: bool = True) -> ServiceOperationResponse:
+    if validate:
+        _validate_upstream(data)
+    ensure_unit_templates()
+
+    port = None  # unset if no port was free, then there is nothing to clean up
     try:
-        service_name = _write_service_files(port, data)
+        with _provision_lock:
+            port = _get_next_free_port()
+            service_name = _write_service_files(port, data)
 
-        run_command(["systemctl", "daemon-reload"])
-        run_command(["systemctl", "enable", service_name])
-        run_command(["systemctl", "start", service_name])
+        # The template is loaded already, the new instance needs no daemon-reload
+        units.run(_apply_limits(port, data))
+        units.run(units.enable(service_name, reload=False))
+        if not units.run(units.start(service_name)):
+            logger.warning(f"Service {service_name} did not start, systemd keeps retrying.")
 
         logger.info(f"Service {service_name} created.")
         context = {"service_name": service_name, "action": "create", "result": "ok", "port": port}
@@ -325,37 +673,145 @@ def create_service(data: IPTVProxyCreate) -> ServiceOperationResponse:
 
     except Exception as e:
         # Simple cleanup
-        script_path = os.path.join(SCRIPT_DIR, f"iptv-proxy-{port}.sh")
-        service_path = os.path.join(SERVICE_DIR, f"iptv-proxy-{port}.service")
-        if os.path.exists(script_path):
-            os.remove(script_path)
-        if os.path.exists(service_path):
-            os.remove(service_path)
+        if port is not None:
+            _remove_service_files(port)
         raise e
 
 
-def update_service(port: int, data: IPTVProxyCreate) -> ServiceOperationResponse:
+def create_services(proxies: list[IPTVProxyCreate], validate: bool = True) -> BulkOperationResponse:
+    """
+    Creates several proxies as one transaction: all scripts are written first, then all instances are
+    enabled with one call and started concurrently. If any step fails, every proxy of the batch is
+    stopped, disabled and removed again. With `validate` all upstreams are checked concurrently first,
+    if one does not work nothing is created.
+    """
+    if validate:
+        checks = upstream.validate_upstreams(proxies)
+        if not all(check.ok for check in checks):
+            items = [
+                {
+                    "action": "create",
+                    "result": "ok" if check.ok else "failed",
+                    "detail": "Upstream is valid" if check.ok else check.detail,
+                }
+                for check in checks
+            ]
+            logger.warning(f"Bulk creation rejected, {sum(not check.ok for check in checks)} upstreams do not work")
+            return BulkOperationResponse.model_validate({"result": "rejected", "items": items})
+
+    ensure_unit_templates()
+
+    items = []
+    written = []  # (port, activation) of the proxies whose script exists
+    failure = None
+
+    with _provision_lock:
+        ports = _get_free_ports(len(proxies))
+        for port, data in zip(ports, proxies, strict=True):
+            service_name = _entry_unit(port, data.activation)
+            items.append({"service_name": service_name, "action": "create", "result": "skipped", "port": port})
+            if failure:
+                continue
+            try:
+                _write_service_files(port, data)
+                written.append((port, data.activation))
+                items[-1]["result"] = "pending"
+            except Exception as e:
+                items[-1].update(result="failed", detail=str(e))
+                failure = f"Writing the script for port {port} failed"
+
+    if not failure:
+        entries = list(dict.fromkeys(_entry_unit(port, activation) for port, activation in written))
+
+        # The templates are loaded already, none of the new instances needs a daemon-reload
+        async def enable_and_start() -> Dict[str, str]:
+            await asyncio.gather(*(_apply_limits(port, data) for port, data in zip(ports, proxies, strict=True)))
+            await units.enable(*entries, reload=False)
+            return await units.start_each(*entries)
+
+        try:
+            results = units.run(enable_and_start())
+        except Exception as e:
+            results = dict.fromkeys(entries, str(e))
+        for item in items:
+            job_result = results.get(item["service_name"])
+            if job_result != "done":
+                item.update(result="failed", detail=f"Start failed: {job_result}")
+                failure = f"Starting {item['service_name']} failed"
+
+    if not failure:
+        for item in items:
+            item["result"] = "ok"
+        logger.info(f"{len(items)} services created: {', '.join(item['service_name'] for item in items)}")
+        return BulkOperationResponse.model_validate({"result": "ok", "items": items})
+
+    logger.error(f"Bulk creation rolled back: {failure}")
+    mode_units = [unit for port, activation in written for unit in _mode_units(port, activation)]
+    entries = [unit for port, activation in written for unit in _dedicated_entry_units(port, activation)]
+
+    async def rollback() -> None:
+        await units.stop(*mode_units)
+        if entries:
+            await units.disable(*entries, reload=False)
+
+    try:
+        if written:
+            units.run(rollback())
+    except Exception as e:
+        logger.warning(f"Warning while rolling back {', '.join(entries)} (ignored): {e}")
+    for port, _ in written:
+        _remove_service_files(port)
+    for item in items:
+        if item["result"] == "pending":
+            item.update(result="rolled_back", detail=failure)
+        elif item["result"] == "skipped":
+            item["detail"] = failure
+    return BulkOperationResponse.model_validate({"result": "rolled_back", "items": items})
+
+
+def update_service(port: int, data: IPTVProxyCreate, validate: bool = True) -> ServiceOperationResponse:
     """
     Updates an existing service.
     The port remains the same, but parameters (URL, user, password) are overwritten.
+    A changed activation mode replaces the units of the old mode. A proxy suspended by the
+    crash-loop detector is enabled again, the new script no longer carries the marker.
     """
-    service_name = f"iptv-proxy-{port}.service"
-    service_path = os.path.join(SERVICE_DIR, service_name)
+    script_path = os.path.join(SCRIPT_DIR, f"iptv-proxy-{port}.sh")
 
-    if not os.path.exists(service_path):
+    if not os.path.exists(script_path):
         raise FileNotFoundError(f"Service on port {port} does not exist.")
+    if validate:
+        _validate_upstream(data)
 
     try:
         logger.info(f"Updating config for port {port}...")
-        _write_service_files(port, data)
-
-        # Systemd Reload & Restart
-        run_command(["systemctl", "daemon-reload"])
-        run_command(["systemctl", "restart", service_name])
-
-        logger.info(f"Service {service_name} updated.")
-
-        context = {"service_name": service_name, "action": "update", "result": "ok", "port": port}
+        old_activation = _get_activation(port)
+        suspended = bool(_read_script_metadata(script_path).get("suspended"))
+        if old_activation != data.activation:
+            logger.info(f"Switching proxy on port {port} from {old_activation.value} to {data.activation.value}")
+            units.run(units.stop(*_mode_units(port, old_activation)))
+            if old_entries := _dedicated_entry_units(port, old_activation):
+                units.run(units.disable(*old_entries, reload=False))
+
+        entry_unit = _write_service_files(port, data)
+        if old_activation == ActivationMode.SHARED and data.activation != ActivationMode.SHARED:
+            _wait_for_host_release(port)
+
+        # The instance reads the new script on its next start, no daemon-reload needed
+        async def enable_and_restart() -> bool:
+            await _apply_limits(port, data)
+            if old_activation != data.activation or suspended:
+                await units.enable(entry_unit, reload=False)
+            return await _restart_proxy(port, data.activation)
+
+        if suspended:
+            logger.info(f"Resuming suspended service {entry_unit} with its new configuration")
+        if not units.run(enable_and_restart()):
+            logger.warning(f"Service {entry_unit} did not restart, systemd keeps retrying.")
+
+        logger.info(f"Service {entry_unit} updated.")
+
+        context = {"service_name": entry_unit, "action": "update", "result": "ok", "port": port}
         return ServiceOperationResponse.model_validate(context)
 
     except Exception as e:
@@ -365,34 +821,32 @@ def update_service(port: int, data: IPTVProxyCreate) -> ServiceOperationResponse
 
 def delete_service(port: int) -> ServiceOperationResponse:
     """
-    Stops service, removes files, reloads daemon.
+    Stops service, disables it and removes its script.
     """
     if not isinstance(port, int) or not (9000 <= port <= 9999):
         raise ValueError(f"Invalid port: {port}. Must be between 9000 and 9999.")
     port = int(port)
 
-    service_name = f"iptv-proxy-{port}.service"
-    script_name = f"iptv-proxy-{port}.sh"
-    service_path = os.path.join(SERVICE_DIR, service_name)
-    script_path = os.path.join(SCRIPT_DIR, script_name)
+    script_path = os.path.join(SCRIPT_DIR, f"iptv-proxy-{port}.sh")
+    activation = _get_activation(port)
+    service_name = _entry_unit(port, activation)
 
-    if not os.path.exists(service_path):
+    if not os.path.exists(script_path):
         raise FileNotFoundError(f"Service {service_name} not found.")
 
     try:
-        # Stop and disable
+        # Stop and disable, the template stays loaded so no reload is needed
         try:
-            run_command(["systemctl", "stop", service_name])
-            run_command(["systemctl", "disable", service_name])
+            units.run(units.stop(*_mode_units(port, activation)))
+            if entries := _dedicated_entry_units(port, activation):
+                units.run(units.disable(*entries, reload=False))
         except Exception as e:
             logger.warning(f"Warning while stopping {service_name} (ignored): {e}")
 
         # Delete files
-        Path(service_path).unlink(missing_ok=True)
-        Path(script_path).unlink(missing_ok=True)
-
-        # Reload
-        run_command(["systemctl", "daemon-reload"])
+        _remove_service_files(port)
+        playlist.remove_index(port)
+        epg.remove_guide(port)
 
         logger.info(f"Service {service_name} deleted.")
         context = {"service_name": service_name, "action": "delete", "result": "ok", "port": port}
@@ -404,19 +858,388 @@ def delete_service(port: int) -> ServiceOperationResponse:
 
 
 def restart_iptv_service(port: int) -> ServiceOperationResponse:
-    service_name = f"iptv-proxy-{port}.service"
-    command = ["sudo", "systemctl", "restart", service_name]
-
-    try:
-        run_command(command)
-        logger.info(f"Service {service_name} restarted.")
-        context = {"service_name": service_name, "action": "restart", "result": "ok", "port": port}
-        return ServiceOperationResponse.model_validate(context)
+    """
+    Restarts a proxy. A proxy suspended by the crash-loop detector is enabled again.
+    """
+    activation = _get_activation(port)
+    service_name = _entry_unit(port, activation)
+    script_path = os.path.join(SCRIPT_DIR, f"iptv-proxy-{port}.sh")
+    suspended = bool(_read_script_metadata(script_path).get("suspended"))
 
-    except subprocess.CalledProcessError as e:
-        error_msg = e.stderr.strip() if e.stderr else "Unknown error from systemd"
-        raise RuntimeError(f"Unable to restart service: {error_msg}") from e
+    async def resume_and_restart() -> bool:
+        if suspended:
+            await units.enable(service_name, reload=False)
+        return await _restart_proxy(port, activation)
 
+    try:
+        if suspended:
+            _set_suspended(port, None)
+            logger.info(f"Resuming suspended service {service_name}")
+        restarted = units.run(resume_and_restart())
     except Exception as e:
         logger.error(f"General error in restart_iptv_service logic: {str(e)}")
         raise RuntimeError("An unexpected internal error has occurred.") from e
+
+    if not restarted:
+        raise RuntimeError("Unable to restart service: the systemd job failed")
+
+    logger.info(f"Service {service_name} restarted.")
+    context = {"service_name": service_name, "action": "restart", "result": "ok", "port": port}
+    return ServiceOperationResponse.model_validate(context)
+
+
+def migrate_legacy_units() -> int:
+    """
+    Startup job: converts per-port units (iptv-proxy-<port>.service and, for on-demand proxies, the
+    matching .socket and -activator.service) to instances of the templates. The proxy name moves from
+    the unit description into the script. Enabled and running proxies stay enabled and running.
+    Returns the number of migrated proxies.
+    """
+    ensure_unit_templates()
+
+    legacy_entries = {}  # port -> legacy unit that was enabled and started
+    legacy_units = []
+    for unit_file in sorted(glob.glob(os.path.join(SERVICE_DIR, "iptv-proxy-*.service"))):
+        match = LEGACY_UNIT_PATTERN.match(os.path.basename(unit_file))
+        if not match:
+            continue
+        port = int(match.group(1))
+        service_name = os.path.basename(unit_file)
+        socket_name, activator_name = f"iptv-proxy-{port}.socket", f"iptv-proxy-{port}-activator.service"
+        on_demand = os.path.exists(os.path.join(SERVICE_DIR, socket_name))
+        activation = ActivationMode.ON_DEMAND if on_demand else ActivationMode.ALWAYS
+        legacy_units.extend([socket_name, activator_name, service_name] if on_demand else [service_name])
+
+        script_path = os.path.join(SCRIPT_DIR, f"iptv-proxy-{port}.sh")
+        try:
+            content = Path(script_path).read_text()
+            if not _read_script_metadata(script_path):
+                header = f"# Name: {_get_description_from_unit(unit_file)}\n# Activation: {activation.value}\n"
+                marker = "# Auto-generated by FastAPI Controller\n"
+                content = content.replace(marker, marker + header, 1) if marker in content else content + header
+                Path(script_path).write_text(content)
+        except OSError as e:
+            logger.error(f"Cannot migrate proxy on port {port}, script not usable: {e}")
+            continue
+        legacy_entries[port] = socket_name if on_demand else service_name
+
+    if not legacy_entries:
+        return 0
+    logger.info(f"Migrating {len(legacy_entries)} IPTV proxies to unit templates...")
+
+    async def migrate() -> int:
+        active_states, file_states = await asyncio.gather(
+            units.active_states(*legacy_entries.values()), units.enablement(*legacy_entries.values())
+        )
+        new_entries = {port: _entry_unit(port, _get_activation(port)) for port in legacy_entries}
+        to_enable = [
+            new_entries[port] for port, old in legacy_entries.items() if file_states.get(old) in ENABLED_STATES
+        ]
+        to_start = [new_entries[port] for port, old in legacy_entries.items() if active_states.get(old) == "active"]
+
+        # The old units hold the ports, they have to be gone before the instances start
+        await units.stop(*legacy_units)
+        await units.disable(*legacy_entries.values(), reload=False)
+        for name in legacy_units:
+            Path(os.path.join(SERVICE_DIR, name)).unlink(missing_ok=True)
+        # The only reload of the migration, to forget the removed units
+        await units.daemon_reload()
+        if to_enable:
+            await units.enable(*to_enable, reload=False)
+        if to_start:
+            await units.start(*to_start)
+        return len(to_start)
+
+    started = units.run(migrate())
+    logger.info(f"Migrated {len(legacy_entries)} IPTV proxies, {started} of them restarted as template instances.")
+    return len(legacy_entries)
+
+
+def _get_channel_index(port: int) -> playlist.ChannelIndex:
+    if not os.path.exists(os.path.join(SCRIPT_DIR, f"iptv-proxy-{port}.sh")):
+        raise HTTPException(status_code=404, detail=f"Proxy service on port {port} not found.")
+
+    index = playlist.channel_indexes.get(port)
+    if index is None:
+        raise HTTPException(
+            status_code=503,
+            detail=f"The playlist of the proxy on port {port} is not indexed yet.",
+            headers={"Retry-After": str(playlist.REFRESH_CHECK_INTERVAL)},
+        )
+    return index
+
+
+def get_channels(port: int, prefix: str, group: Optional[str], offset: int, limit: int) -> ChannelPage:
+    """
+    Searches the channel index of a proxy, the playlist itself is never loaded.
+    """
+    index = _get_channel_index(port)
+    total, channels = index.search(prefix, group, offset, limit)
+    items = [
+        Channel(name=channel.name, group=channel.group or None, tvg_id=channel.tvg_id or None) for channel in channels
+    ]
+    return ChannelPage(port=port, total=total, offset=offset, limit=limit, indexed_at=index.fetched_at, items=items)
+
+
+def get_channel_groups(port: int) -> list[ChannelGroup]:
+    return [ChannelGroup(name=name or None, channels=count) for name, count in _get_channel_index(port).groups()]
+
+
+async def refresh_channel_indexes() -> None:
+    """
+    Scheduler job: indexes the playlists of new proxies, and those whose index is older than
+    M3U_CACHE_EXPIRATION or was built from another URL. Playlists are downloaded one after another.
+    """
+    ports = _get_ports()
+    max_age = M3U_CACHE_EXPIRATION * 60 * 60
+
+    for port in sorted(ports):
+        config = await asyncio.to_thread(_parse_script_content, os.path.join(SCRIPT_DIR, f"iptv-proxy-{port}.sh"))
+        url = (config or {}).get("m3u_url")
+        if not url or playlist.index_is_current(port, url, max_age):
+            continue
+        try:
+            await playlist.build_index(port, url)
+        except Exception as e:
+            logger.warning(f"Cannot index the playlist of the proxy on port {port}: {e}")
+
+    # Proxies deleted while the index was being built
+    for path in playlist.INDEX_DIR.glob("channels-*.idx"):
+        port = path.stem.removeprefix("channels-")
+        if port.isdigit() and int(port) not in ports:
+            playlist.remove_index(int(port))
+
+
+def _xtream_guide_url(config: dict) -> Optional[str]:
+    if not (config.get("xtream_base_url") and config.get("xtream_user") and config.get("xtream_password")):
+        return None
+    return (
+        f"{config['xtream_base_url']}/xmltv.php?username={config['xtream_user']}&password={config['xtream_password']}"
+    )
+
+
+def _get_guide_index(port: int) -> epg.GuideIndex:
+    if not os.path.exists(os.path.join(SCRIPT_DIR, f"iptv-proxy-{port}.sh")):
+        raise HTTPException(status_code=404, detail=f"Proxy service on port {port} not found.")
+
+    index = epg.guide_indexes.get(port)
+    if index is None:
+        raise HTTPException(
+            status_code=503,
+            detail=f"The EPG of the proxy on port {port} is not cached yet, only Xtream proxies have one.",
+            headers={"Retry-After": str(playlist.REFRESH_CHECK_INTERVAL)},
+        )
+    return index
+
+
+def get_guide_file(port: int) -> Path:
+    """
+    The gzipped XMLTV guide as downloaded from the provider.
+    """
+    _get_guide_index(port)
+    path = epg.guide_path(port)
+    if not path.exists():
+        raise HTTPException(status_code=404, detail=f"The EPG of the proxy on port {port} exceeds the disk budget.")
+    return path
+
+
+def get_player_guide(port: int, username: str, password: str) -> Tuple[Optional[Path], str]:
+    """
+    The cached guide for IPTV players, checked with the credentials of the proxy like its own xmltv.php.
+    Returns the guide, None if it is not cached (yet), and the URL of the proxy the player reaches.
+    """
+    script_path = os.path.join(SCRIPT_DIR, f"iptv-proxy-{port}.sh")
+    config = _parse_script_content(script_path) if os.path.exists(script_path) else None
+    guide_url = _xtream_guide_url(config or {})
+    if not guide_url:
+        raise HTTPException(status_code=404, detail=f"No Xtream proxy on port {port}.")
+    valid_user = secrets.compare_digest(username.encode(), config.get("user", "").encode())
+    valid_password = secrets.compare_digest(password.encode(), config.get("password", "").encode())
+    if not (valid_user and valid_password):
+        raise HTTPException(status_code=401, detail="Invalid proxy credentials.")
+
+    path = epg.guide_path(port)
+    index = epg.guide_indexes.get(port)
+    # A guide of an earlier provider account is not served
+    if index is None or index.url_checksum != playlist.url_checksum(guide_url) or not path.exists():
+        path = None
+    return path, f"http://{config.get('hostname')}:{port}"
+
+
+def get_epg_channels(port: int) -> list[EPGChannel]:
+    return [
+        EPGChannel(id=channel_id, name=name or None, programmes=count)
+        for channel_id, name, count in _get_guide_index(port).channels()
+    ]
+
+
+def _programme(programme: epg.Programme) -> EPGProgramme:
+    return EPGProgramme(
+        start=programme.start,
+        stop=programme.stop,
+        title=programme.title,
+        description=programme.description or None,
+    )
+
+
+def get_now_next(port: int, channel_id: str, upcoming: int) -> EPGNowNext:
+    """
+    The programme running now and the next ones, looked up in the memory-mapped guide index.
+    """
+    index = _get_guide_index(port)
+    result = index.now_next(channel_id, time.time(), upcoming)
+    if result is None:
+        raise HTTPException(status_code=404, detail=f"Channel '{channel_id}' is not in the EPG of port {port}.")
+
+    name, current, following = result
+    return EPGNowNext(
+        channel_id=channel_id,
+        name=name or None,
+        now=_programme(current) if current else None,
+        next=[_programme(programme) for programme in following],
+        fetched_at=index.fetched_at,
+    )
+
+
+async def refresh_epg_caches() -> None:
+    """
+    Scheduler job: fetches xmltv.php of every Xtream proxy once per EPG_REFRESH_INTERVAL,
+    one after another. The proxies split the disk budget for the full guides.
+    """
+    guides = {}
+    for port in sorted(_get_ports()):
+        config = await asyncio.to_thread(_parse_script_content, os.path.join(SCRIPT_DIR, f"iptv-proxy-{port}.sh"))
+        url = _xtream_guide_url(config or {})
+        if url:
+            guides[port] = url
+
+    budget = epg.guide_budget(len(guides))
+    for port, url in guides.items():
+        if epg.guide_is_current(port, url):
+            continue
+        try:
+            await epg.build_guide(port, url, budget)
+        except Exception as e:
+            logger.warning(f"Cannot cache the EPG of the proxy on port {port}: {e}")
+
+    # Deleted proxies and proxies switched to M3U
+    for path in playlist.INDEX_DIR.glob("epg-*.idx"):
+        port = path.stem.removeprefix("epg-")
+        if port.isdigit() and int(port) not in guides:
+            epg.remove_guide(int(port))
+
+
+def _set_suspended(port: int, reason: Optional[str]) -> None:
+    """
+    Adds or removes the '# Suspended:' header line of a proxy script. Writing the script on update drops it too.
+    """
+    script_path = os.path.join(SCRIPT_DIR, f"iptv-proxy-{port}.sh")
+    with open(script_path, "r", encoding="utf-8") as f:
+        lines = [line for line in f.readlines() if not line.startswith("# Suspended:")]
+    if reason:
+        position = next((i + 1 for i, line in enumerate(lines) if line.startswith("# Activation:")), 1)
+        lines.insert(position, f"# Suspended: {reason}\n")
+
+    tmp_path = f"{script_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.writelines(lines)
+    os.chmod(tmp_path, 0o755)
+    os.replace(tmp_path, script_path)
+
+
+async def _suspend_proxy(port: int, activation: ActivationMode, reason: str) -> None:
+    logger.error(f"IPTV proxy on port {port} is crash-looping ({reason}), stopping and disabling it")
+    await asyncio.to_thread(_set_suspended, port, reason)
+    await units.stop(*_mode_units(port, activation))
+    await units.disable(_entry_unit(port, activation), reload=False)
+
+
+async def detect_crash_loops() -> None:
+    """
+    Scheduler job: samples the restart counter of every proxy unit. A proxy with CRASH_LOOP_RESTARTS
+    automatic restarts within CRASH_LOOP_WINDOW is suspended: stopped, disabled and marked in its script,
+    until it is updated or restarted by hand.
+    """
+    proxies = {}  # proxy unit -> (port, activation)
+    for port in await asyncio.to_thread(_get_ports):
+        activation = await asyncio.to_thread(_get_activation, port)
+        # Suspending the host would take down every shared proxy
+        if activation != ActivationMode.SHARED:
+            proxies[_proxy_unit(port, activation)] = (port, activation)
+    if not proxies:
+        _restart_samples.clear()
+        return
+
+    try:
+        properties = await units.unit_properties(list(proxies), ["NRestarts"])
+    except Exception as e:
+        logger.warning(f"Cannot read the restart counters of the IPTV proxies: {e}")
+        return
+
+    now = time.monotonic()
+    for unit in set(_restart_samples) - set(proxies):
+        del _restart_samples[unit]
+    for unit, (port, activation) in proxies.items():
+        restarts = properties.get(unit, {}).get("NRestarts")
+        if restarts is None:
+            _restart_samples.pop(unit, None)
+            continue
+
+        samples = _restart_samples.setdefault(unit, deque())
+        if samples and restarts < samples[-1][1]:
+            samples.clear()  # a manual start resets the counter
+        samples.append((now, restarts))
+        while now - samples[0][0] > CRASH_LOOP_WINDOW:
+            samples.popleft()
+
+        recent = restarts - samples[0][1]
+        if recent >= CRASH_LOOP_RESTARTS:
+            del _restart_samples[unit]
+            try:
+                await _suspend_proxy(port, activation, f"{recent} restarts within {CRASH_LOOP_WINDOW // 60} minutes")
+            except Exception as e:
+                logger.error(f"Cannot suspend the crash-looping proxy on port {port}: {e}")
+
+
+async def check_proxy_health() -> None:
+    """
+    Scheduler job: requests the playlist of every running proxy, a TCP connect alone does not show
+    a proxy answering with errors. With IPTV_HEALTH_RESTART_AFTER set, a proxy failing that many
+    checks in a row is restarted. Stopped proxies are not checked, on-demand ones are never started.
+    """
+    targets, activations = {}, {}
+    for port in await asyncio.to_thread(_get_ports):
+        activations[port] = await asyncio.to_thread(_get_activation, port)
+    proxy_units = {port: _proxy_unit(port, activation) for port, activation in activations.items()}
+
+    try:
+        active_states = await units.active_states(*set(proxy_units.values())) if proxy_units else {}
+    except Exception as e:
+        logger.warning(f"Cannot read the state of the IPTV proxies: {e}")
+        return
+
+    for port, activation in activations.items():
+        if active_states.get(proxy_units[port]) != "active":
+            continue
+        config = await asyncio.to_thread(_parse_script_content, os.path.join(SCRIPT_DIR, f"iptv-proxy-{port}.sh"))
+        if not config:
+            continue
+        listen_port = port + INTERNAL_PORT_OFFSET if activation == ActivationMode.ON_DEMAND else port
+        query = urlencode({"username": config.get("user", ""), "password": config.get("password", "")})
+        targets[port] = f"http://127.0.0.1:{listen_port}/iptv.m3u?{query}"
+
+    summaries = await health.check_proxies(targets)
+
+    restart_after = settings.IPTV_HEALTH_RESTART_AFTER
+    if restart_after <= 0:
+        return
+    for port, activation in activations.items():
+        failures = summaries.get(port, {}).get("consecutive_failures", 0)
+        if failures < restart_after:
+            continue
+        logger.error(f"IPTV proxy on port {port} failed {failures} health checks in a row, restarting it")
+        health.reset_failures(port)
+        try:
+            await _restart_proxy(port, activation)
+        except Exception as e:
+            logger.error(f"Cannot restart the unhealthy proxy on port {port}: {e}")
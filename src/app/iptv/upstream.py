@@ -0,0 +1,173 @@
+import asyncio
+import hashlib
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from app.core.logger import logger
+from app.core.startup import lazy_import
+from app.iptv.schemas import IPTVProxyCreate
+
+httpx = lazy_import("httpx")  # only needed while validating
+
+VALIDATION_TIMEOUT = 10  # in seconds - per upstream request
+MAX_CONCURRENT_CHECKS = 8  # bulk creation checks this many upstreams at once
+PLAYLIST_PROBE_BYTES = 1024  # a playlist has to start with #EXTM3U within the first bytes
+
+# Results are cached per upstream and credentials, a failed check expires sooner so a fixed
+# account is accepted again quickly. Unreachable upstreams are only cached to absorb retries.
+VALID_TTL = 15 * 60  # in seconds
+INVALID_TTL = 5 * 60  # in seconds
+UNREACHABLE_TTL = 30  # in seconds
+MAX_CACHED_RESULTS = 256
+
+VALID, INVALID, UNREACHABLE = "valid", "invalid", "unreachable"
+
+
+class UpstreamCheck(NamedTuple):
+    status: str  # VALID, INVALID or UNREACHABLE
+    detail: str
+
+    @property
+    def ok(self) -> bool:
+        return self.status == VALID
+
+
+class UpstreamValidationError(ValueError):
+    """
+    The M3U URL or the Xtream account of a proxy does not work.
+    """
+
+
+_TTL = {VALID: VALID_TTL, INVALID: INVALID_TTL, UNREACHABLE: UNREACHABLE_TTL}
+_results: Dict[str, Tuple[float, UpstreamCheck]] = {}
+_results_lock = threading.Lock()
+
+
+def _cache_key(data: IPTVProxyCreate) -> str:
+    """
+    Hash of the upstream and its credentials, so no password is kept in the cache.
+    """
+    if data.xtream_base_url:
+        parts = ("xtream", data.xtream_base_url, data.xtream_user or "", data.xtream_password or "")
+    else:
+        parts = ("m3u", data.m3u_url or "")
+    return hashlib.sha256("\0".join(parts).encode()).hexdigest()
+
+
+def _cached(key: str) -> Optional[UpstreamCheck]:
+    with _results_lock:
+        entry = _results.get(key)
+        if entry is None:
+            return None
+        checked_at, result = entry
+        if time.monotonic() - checked_at >= _TTL[result.status]:
+            del _results[key]
+            return None
+        return result
+
+
+def _store(key: str, result: UpstreamCheck) -> None:
+    with _results_lock:
+        if len(_results) >= MAX_CACHED_RESULTS:
+            # Dicts keep insertion order, the oldest check goes first
+            del _results[next(iter(_results))]
+        _results[key] = (time.monotonic(), result)
+
+
+async def _check_xtream(client, data: IPTVProxyCreate) -> UpstreamCheck:
+    response = await client.get(
+        f"{data.xtream_base_url}/player_api.php",
+        params={"username": data.xtream_user, "password": data.xtream_password},
+    )
+    if response.status_code in (401, 403):
+        return UpstreamCheck(INVALID, f"Xtream login rejected with HTTP {response.status_code}")
+    if response.status_code >= 500:
+        return UpstreamCheck(UNREACHABLE, f"Xtream server answered HTTP {response.status_code}")
+    if response.status_code >= 400:
+        return UpstreamCheck(INVALID, f"player_api.php answered HTTP {response.status_code}")
+
+    try:
+        user_info = response.json().get("user_info") or {}
+    except (ValueError, AttributeError):
+        return UpstreamCheck(INVALID, "player_api.php did not answer with Xtream JSON")
+
+    if str(user_info.get("auth", "0")) != "1":
+        return UpstreamCheck(INVALID, "Xtream credentials are wrong")
+    status = user_info.get("status", "Active")
+    if status != "Active":
+        return UpstreamCheck(INVALID, f"Xtream account is {status.lower()}")
+    exp_date = user_info.get("exp_date")
+    if exp_date and str(exp_date).isdigit() and int(exp_date) < time.time():
+        return UpstreamCheck(INVALID, "Xtream account has expired")
+    return UpstreamCheck(VALID, "Xtream account is active")
+
+
+async def _check_m3u(client, data: IPTVProxyCreate) -> UpstreamCheck:
+    """
+    A range request for the first bytes is enough to tell a playlist from an error page,
+    a HEAD request would not. Servers ignoring the range are cut off after the first chunk.
+    """
+    headers = {"Range": f"bytes=0-{PLAYLIST_PROBE_BYTES - 1}"}
+    async with client.stream("GET", data.m3u_url, headers=headers) as response:
+        if response.status_code >= 500:
+            return UpstreamCheck(UNREACHABLE, f"Playlist server answered HTTP {response.status_code}")
+        if response.status_code >= 400:
+            return UpstreamCheck(INVALID, f"Playlist URL answered HTTP {response.status_code}")
+
+        head = b""
+        async for chunk in response.aiter_bytes():
+            head += chunk
+            if len(head) >= PLAYLIST_PROBE_BYTES:
+                break
+
+    if not head.lstrip(b"\xef\xbb\xbf \t\r\n").startswith(b"#EXTM3U"):
+        return UpstreamCheck(INVALID, "URL does not return an M3U playlist")
+    return UpstreamCheck(VALID, "Playlist is reachable")
+
+
+async def check_upstream(data: IPTVProxyCreate) -> UpstreamCheck:
+    """
+    Checks the upstream of a proxy once per cache period: the Xtream account via player_api.php,
+    or whether the M3U URL returns a playlist.
+    """
+    key = _cache_key(data)
+    result = _cached(key)
+    if result is not None:
+        return result
+
+    try:
+        async with httpx.AsyncClient(timeout=VALIDATION_TIMEOUT, follow_redirects=True) as client:
+            if data.xtream_base_url and data.xtream_user and data.xtream_password:
+                result = await _check_xtream(client, data)
+            else:
+                result = await _check_m3u(client, data)
+    except httpx.TimeoutException:
+        result = UpstreamCheck(UNREACHABLE, f"Upstream did not answer within {VALIDATION_TIMEOUT}s")
+    except httpx.HTTPError as e:
+        result = UpstreamCheck(UNREACHABLE, f"Upstream unreachable: {e.__class__.__name__}")
+
+    if not result.ok:
+        logger.info(f"Upstream check failed: {result.detail}")
+    _store(key, result)
+    return result
+
+
+async def check_upstreams(proxies: List[IPTVProxyCreate]) -> List[UpstreamCheck]:
+    """
+    Checks several proxies concurrently, in the order given.
+    """
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_CHECKS)
+
+    async def check(data: IPTVProxyCreate) -> UpstreamCheck:
+        async with semaphore:
+            return await check_upstream(data)
+
+    return await asyncio.gather(*(check(data) for data in proxies))
+
+
+def validate_upstreams(proxies: List[IPTVProxyCreate]) -> List[UpstreamCheck]:
+    """
+    Blocking bridge for the service layer, which runs in the threadpool.
+    """
+    return asyncio.run(check_upstreams(proxies))
@@ -1,30 +1,62 @@
+import asyncio
 import fcntl
+import random
 from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
 from pathlib import Path
 
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from apscheduler.triggers.cron import CronTrigger
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 
+from app.api import metrics as metrics_router
 from app.api.api_v1 import api_router as api_v1_router
+from app.auth.dependencies import CheckAuth
+from app.auth.sessions import session_registry
+from app.clients.bandwidth import install_ruleset
 from app.core.config import get_settings
-from app.core.logger import setup_logging
+from app.core.health import PROBE_INTERVAL, run_health_probes
+from app.core.logger import RequestLoggingMiddleware, setup_logging
+from app.core.metrics import MetricsMiddleware, start_snapshots, stop_snapshots
+from app.core.profiling import ProfilingMiddleware
+from app.core.request_cache import RequestCacheMiddleware
+from app.core.startup import load_lazy_modules, readiness
+from app.iptv.health import CHECK_INTERVAL as IPTV_HEALTH_CHECK_INTERVAL
+from app.iptv.playlist import REFRESH_CHECK_INTERVAL
+from app.iptv.service import (
+    CRASH_LOOP_CHECK_INTERVAL,
+    check_proxy_health,
+    detect_crash_loops,
+    migrate_legacy_units,
+    refresh_channel_indexes,
+    refresh_epg_caches,
+)
+from app.pihole.history import SAMPLE_INTERVAL, sample_pihole_history
 from app.pihole.service import update_gravity
 from app.vpn.providers.tasks import update_vpn_servers
 
 setup_logging()
 
 settings = get_settings()
-scheduler = AsyncIOScheduler()
+scheduler = None
 
 LOCK_FILE = "/tmp/streamcloak_scheduler.lock"
 
+# The initial VPN list and gravity update wait until the device has settled after boot,
+# the jitter spreads the requests of many boxes rebooting at the same time
+STARTUP_JOB_DELAY = 120  # in seconds
+STARTUP_JOB_JITTER = 180  # in seconds
+CRON_JITTER = 900  # in seconds - weekly downloads do not all start at 03:00 sharp
+
 
 @asynccontextmanager
 async def lifespan(_app: FastAPI):
+    global scheduler
     from app.core.logger import logger
 
+    # Every worker warms up on its own, /health/ready reports when it is done
+    asyncio.create_task(readiness.warm_up([("modules", load_lazy_modules), ("sessions", session_registry.sync)]))
+    start_snapshots()
+
     # Process-wide lock
     lock_file = open(LOCK_FILE, "w")
     try:
@@ -32,23 +64,97 @@ async def lifespan(_app: FastAPI):
         fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
 
         logger.info("🚀  StreamCloak VPN Box API is starting up...")
-        import asyncio
-
-        asyncio.create_task(update_vpn_servers())
-        asyncio.create_task(update_gravity())
-
+        # Imported here, only the worker holding the lock runs the scheduler
+        from apscheduler.schedulers.asyncio import AsyncIOScheduler
+        from apscheduler.triggers.cron import CronTrigger
+        from apscheduler.triggers.date import DateTrigger
+        from apscheduler.triggers.interval import IntervalTrigger
+
+        scheduler = AsyncIOScheduler()
+
+        for job in (update_vpn_servers, update_gravity):
+            delay = STARTUP_JOB_DELAY + random.uniform(0, STARTUP_JOB_JITTER)
+            scheduler.add_job(
+                job,
+                trigger=DateTrigger(run_date=datetime.now() + timedelta(seconds=delay)),
+                id=f"startup_{job.__name__}",
+                replace_existing=True,
+            )
+
+        # The traffic counters of all workers, requests only read them
+        scheduler.add_job(
+            install_ruleset,
+            trigger=DateTrigger(run_date=datetime.now()),
+            id="install_bandwidth_ruleset",
+            replace_existing=True,
+        )
+        # IPTV proxies of older versions have per-port units, they become instances of the templates
+        scheduler.add_job(
+            migrate_legacy_units,
+            trigger=DateTrigger(run_date=datetime.now()),
+            id="migrate_iptv_units",
+            replace_existing=True,
+        )
+        # Download whole playlists and guides, so they wait for the device to settle like the other startup jobs
+        scheduler.add_job(
+            refresh_channel_indexes,
+            trigger=IntervalTrigger(seconds=REFRESH_CHECK_INTERVAL),
+            next_run_time=datetime.now() + timedelta(seconds=STARTUP_JOB_DELAY),
+            id="refresh_channel_indexes",
+            replace_existing=True,
+        )
+        scheduler.add_job(
+            refresh_epg_caches,
+            trigger=IntervalTrigger(seconds=REFRESH_CHECK_INTERVAL),
+            next_run_time=datetime.now() + timedelta(seconds=STARTUP_JOB_DELAY),
+            id="refresh_epg_caches",
+            replace_existing=True,
+        )
+        scheduler.add_job(
+            detect_crash_loops,
+            trigger=IntervalTrigger(seconds=CRASH_LOOP_CHECK_INTERVAL),
+            id="detect_iptv_crash_loops",
+            replace_existing=True,
+        )
+        scheduler.add_job(
+            check_proxy_health,
+            trigger=IntervalTrigger(seconds=IPTV_HEALTH_CHECK_INTERVAL),
+            # Proxies started at boot load their playlist first
+            next_run_time=datetime.now() + timedelta(seconds=STARTUP_JOB_DELAY),
+            id="check_iptv_proxy_health",
+            replace_existing=True,
+        )
         scheduler.add_job(
             update_vpn_servers,
-            trigger=CronTrigger(day_of_week="tue", hour=3, minute=0),
+            trigger=CronTrigger(day_of_week="tue", hour=3, minute=0, jitter=CRON_JITTER),
             id="update_vpn_list",
             replace_existing=True,
         )
         scheduler.add_job(
             update_gravity,
-            trigger=CronTrigger(day_of_week="tue", hour=3, minute=30),
+            trigger=CronTrigger(day_of_week="tue", hour=3, minute=30, jitter=CRON_JITTER),
             id="update_gravity",
             replace_existing=True,
         )
+        scheduler.add_job(
+            session_registry.compact,
+            trigger=CronTrigger(hour=4, minute=0),
+            id="compact_session_registry",
+            replace_existing=True,
+        )
+        scheduler.add_job(
+            run_health_probes,
+            trigger=IntervalTrigger(seconds=PROBE_INTERVAL),
+            next_run_time=datetime.now(),
+            id="run_health_probes",
+            replace_existing=True,
+        )
+        scheduler.add_job(
+            sample_pihole_history,
+            trigger=IntervalTrigger(seconds=SAMPLE_INTERVAL),
+            id="sample_pihole_history",
+            replace_existing=True,
+        )
         scheduler.start()
 
     except BlockingIOError:
@@ -57,8 +163,10 @@ async def lifespan(_app: FastAPI):
     yield
 
     # Cleanup
+    stop_snapshots()
     try:
-        scheduler.shutdown()
+        if scheduler is not None:
+            scheduler.shutdown()
         lock_file.close()
     except:
         pass
@@ -80,4 +188,16 @@ STATIC_DIR = ROOT_DIR / "static"
 # Mounts config/static to /static URL
 app.mount("/static", StaticFiles(directory=str(STATIC_DIR)), name="static")
 
+app.add_middleware(RequestCacheMiddleware)
+app.add_middleware(ProfilingMiddleware)
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(RequestLoggingMiddleware)
+
 app.include_router(api_v1_router, prefix=settings.API_V1_STR)
+# Scraped by Prometheus, without credentials only if METRICS_PUBLIC is set
+app.include_router(
+    metrics_router.router,
+    prefix="/metrics",
+    tags=["Metrics"],
+    dependencies=[] if settings.METRICS_PUBLIC else [CheckAuth],
+)
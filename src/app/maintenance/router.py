@@ -1,6 +1,11 @@
-from fastapi import APIRouter, HTTPException
+from typing import List
 
-from .schemas import RebootScheduleRequest, RebootScheduleResponse
+from fastapi import APIRouter, HTTPException, status
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+from app.core.profiling import profile_store, to_collapsed, to_speedscope
+
+from .schemas import ProfileFormat, ProfileSummary, RebootScheduleRequest, RebootScheduleResponse
 from .service import MaintenanceService
 
 router = APIRouter()
@@ -24,3 +29,38 @@ async def set_reboot_schedule(schedule: RebootScheduleRequest):
         return {"message": "Reboot schedule updated successfully."}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e)) from e
+
+
+@router.get("/profiles", response_model=List[ProfileSummary])
+async def list_profiles():
+    """
+    Lists the captured request profiles, newest first.
+    """
+    return profile_store.list()
+
+
+@router.get("/profiles/{profile_id}")
+async def download_profile(profile_id: str, format: ProfileFormat = ProfileFormat.SPEEDSCOPE):
+    """
+    Downloads a profile as speedscope JSON or as collapsed stacks for flamegraph.pl.
+    """
+    profile = profile_store.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Profile not found")
+
+    filename = f"profile-{profile_id}"
+    if format == ProfileFormat.COLLAPSED:
+        return PlainTextResponse(
+            to_collapsed(profile), headers={"Content-Disposition": f'attachment; filename="{filename}.txt"'}
+        )
+    return JSONResponse(
+        to_speedscope(profile), headers={"Content-Disposition": f'attachment; filename="{filename}.speedscope.json"'}
+    )
+
+
+@router.delete("/profiles", status_code=status.HTTP_204_NO_CONTENT)
+async def clear_profiles():
+    """
+    Drops all captured profiles.
+    """
+    profile_store.clear()
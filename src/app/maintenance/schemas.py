@@ -42,3 +42,19 @@ class RebootScheduleRequest(BaseModel):
 class RebootScheduleResponse(RebootScheduleRequest):
     # Inherits structure and validation from Request
     pass
+
+
+class ProfileFormat(str, Enum):
+    COLLAPSED = "collapsed"
+    SPEEDSCOPE = "speedscope"
+
+
+class ProfileSummary(BaseModel):
+    id: str
+    method: str
+    path: str
+    started_at: float  # unix timestamp
+    duration_ms: float
+    samples: int
+    interval_ms: int
+    concurrent_requests: int  # most profiled requests in flight at once, above 1 the stacks include theirs
@@ -0,0 +1,160 @@
+import heapq
+import json
+import time
+from typing import Dict, Hashable, Iterator, List, Tuple
+
+from app.core.cache import TTLCache
+from app.pihole.client import PiholeClient
+from app.pihole.schemas import QueryWindow
+
+# FTL status values of queries that were answered with a block
+BLOCKED_STATUSES = {
+    "GRAVITY",
+    "REGEX",
+    "DENYLIST",
+    "GRAVITY_CNAME",
+    "REGEX_CNAME",
+    "DENYLIST_CNAME",
+    "EXTERNAL_BLOCKED_IP",
+    "EXTERNAL_BLOCKED_NULL",
+    "EXTERNAL_BLOCKED_NXRA",
+    "EXTERNAL_BLOCKED_EDE15",
+    "SPECIAL_DOMAIN",
+}
+
+WINDOW_SECONDS = {
+    QueryWindow.MINUTES_15: 15 * 60,
+    QueryWindow.HOUR: 60 * 60,
+    QueryWindow.DAY: 24 * 60 * 60,
+}
+TOP_CAPACITY = 512  # tracked keys per aggregate, bounds memory regardless of the number of distinct domains
+
+aggregate_cache = TTLCache("pihole-queries")
+
+
+class TopCounter:
+    """
+    Space-Saving heavy-hitter counter with a fixed number of slots.
+
+    When all slots are taken, the key with the smallest count is replaced and the new key inherits
+    that count as its error bound. Counts of the returned top keys are exact whenever their error is 0.
+    """
+
+    def __init__(self, capacity: int = TOP_CAPACITY):
+        self.capacity = capacity
+        self._counts: Dict[Hashable, Tuple[int, int]] = {}  # key -> (count, error)
+        self._heap: List[Tuple[int, Hashable]] = []  # lazy min-heap, may contain outdated counts
+
+    def add(self, key: Hashable) -> None:
+        if key in self._counts:
+            count, error = self._counts[key]
+            self._counts[key] = (count + 1, error)
+            self._push(count + 1, key)
+            return
+
+        if len(self._counts) < self.capacity:
+            self._counts[key] = (1, 0)
+            self._push(1, key)
+            return
+
+        min_count, min_key = self._pop_min()
+        del self._counts[min_key]
+        self._counts[key] = (min_count + 1, min_count)
+        self._push(min_count + 1, key)
+
+    def top(self, n: int) -> List[dict]:
+        best = heapq.nlargest(n, self._counts.items(), key=lambda item: item[1][0])
+        return [{"name": str(key), "count": count, "error": error} for key, (count, error) in best]
+
+    def _push(self, count: int, key: Hashable) -> None:
+        heapq.heappush(self._heap, (count, key))
+        # Drop outdated entries once the heap grows too far beyond the live keys
+        if len(self._heap) > 4 * self.capacity:
+            self._heap = [(count, key) for key, (count, _) in self._counts.items()]
+            heapq.heapify(self._heap)
+
+    def _pop_min(self) -> Tuple[int, Hashable]:
+        while True:
+            count, key = heapq.heappop(self._heap)
+            current = self._counts.get(key)
+            if current is not None and current[0] == count:
+                return count, key
+
+
+def is_blocked(query: Dict) -> bool:
+    return query.get("status") in BLOCKED_STATUSES
+
+
+def to_log_entry(query: Dict) -> Dict:
+    """
+    Projects a raw FTL query onto the QueryLogEntry fields.
+    """
+    client = query.get("client") or {}
+    return {
+        "time": query.get("time"),
+        "domain": query.get("domain"),
+        "type": query.get("type"),
+        "status": query.get("status"),
+        "blocked": is_blocked(query),
+        "client_ip": client.get("ip"),
+        "client_name": client.get("name"),
+    }
+
+
+def stream_queries_ndjson(service: PiholeClient, from_ts: float, until_ts: float) -> Iterator[str]:
+    """
+    Yields one JSON document per line, page by page as they arrive from FTL.
+    """
+    for query in service.iter_queries(from_ts, until_ts):
+        yield json.dumps(to_log_entry(query), separators=(",", ":")) + "\n"
+
+
+def _compute_aggregates(service: PiholeClient, window: QueryWindow) -> dict:
+    until_ts = time.time()
+    from_ts = until_ts - WINDOW_SECONDS[window]
+
+    clients = TopCounter()
+    domains = TopCounter()
+    blocked_domains = TopCounter()
+    total = 0
+    blocked = 0
+
+    for query in service.iter_queries(from_ts, until_ts):
+        total += 1
+        client = query.get("client") or {}
+        clients.add(client.get("ip") or "unknown")
+        domain = query.get("domain") or ""
+        domains.add(domain)
+        if is_blocked(query):
+            blocked += 1
+            blocked_domains.add(domain)
+
+    return {
+        "window": window,
+        "from_ts": from_ts,
+        "until_ts": until_ts,
+        "total_queries": total,
+        "blocked_queries": blocked,
+        "clients": clients,
+        "domains": domains,
+        "blocked_domains": blocked_domains,
+    }
+
+
+def get_query_aggregates(service: PiholeClient, window: QueryWindow, count: int) -> dict:
+    """
+    Top clients and domains for a time window.
+    Each window is cached for a twelfth of its length, so a day is recomputed at most every two hours.
+    """
+    ttl = WINDOW_SECONDS[window] / 12
+    data = aggregate_cache.get(window, lambda: _compute_aggregates(service, window), ttl=ttl, stale_ttl=ttl)
+    return {
+        "window": data["window"],
+        "from_ts": data["from_ts"],
+        "until_ts": data["until_ts"],
+        "total_queries": data["total_queries"],
+        "blocked_queries": data["blocked_queries"],
+        "top_clients": data["clients"].top(count),
+        "top_domains": data["domains"].top(count),
+        "top_blocked_domains": data["blocked_domains"].top(count),
+    }
@@ -0,0 +1,51 @@
+from typing import Dict, List
+
+from app.core.cache import TTLCache
+from app.pihole.client import PiholeClient
+
+# TTLs in seconds. FTL counters barely change second to second, so several apps polling share one request.
+SUMMARY_TTL = 5.0
+SUMMARY_STALE_TTL = 30.0
+STATUS_TTL = 2.0
+STATUS_STALE_TTL = 10.0
+
+
+class CachedPiholeClient(PiholeClient):
+    """
+    PiholeClient with a short-lived response cache for the read-heavy endpoints.
+    Every write invalidates the affected entries explicitly.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.cache = TTLCache("pihole")
+
+    def get_summary(self) -> Dict:
+        # A copy, the cached dict is shared by every caller. The summary is flat, a shallow one is enough
+        summary = self.cache.get("summary", super().get_summary, ttl=SUMMARY_TTL, stale_ttl=SUMMARY_STALE_TTL)
+        return dict(summary)
+
+    def get_status(self) -> bool:
+        return self.cache.get("status", super().get_status, ttl=STATUS_TTL, stale_ttl=STATUS_STALE_TTL)
+
+    def set_status(self, enabled: bool) -> bool:
+        try:
+            return super().set_status(enabled)
+        finally:
+            self.cache.invalidate("status", "summary")
+
+    def update_whitelist(self, domain: str, enabled: bool) -> None:
+        try:
+            super().update_whitelist(domain, enabled)
+        finally:
+            self.cache.invalidate()
+
+    def delete_whitelist(self, domain: str) -> None:
+        try:
+            super().delete_whitelist(domain)
+        finally:
+            self.cache.invalidate()
+
+    def get_whitelist(self) -> List[Dict]:
+        # Not cached, the app edits the list right after reading it
+        return super().get_whitelist()
@@ -1,21 +1,26 @@
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Iterator, List, Optional
 
-import requests
-import urllib3
 from fastapi import HTTPException, status
-from urllib3.exceptions import InsecureRequestWarning
 
 from app.core.config import get_settings
+from app.core.metrics import PIHOLE_API_REQUESTS
+from app.core.startup import lazy_import
+
+# requests and urllib3 take a noticeable part of the startup, they are loaded with the first client
+requests = lazy_import("requests")
+urllib3 = lazy_import("urllib3")
 
 settings = get_settings()
 
-# In a secure environment, we should trust the CA,
-# but for local Pi-hole self-signed certs, we suppress warnings.
-urllib3.disable_warnings(InsecureRequestWarning)
+QUERY_PAGE_SIZE = 1000  # query log entries per API call, bounds the memory of one page
 
 
 class PiholeClient:
     def __init__(self):
+        # In a secure environment, we should trust the CA,
+        # but for local Pi-hole self-signed certs, we suppress warnings.
+        urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
         self.base_url = settings.PIHOLE_API_URL
         self.password = settings.PIHOLE_PASSWORD
         self.sid: Optional[str] = None
@@ -44,7 +49,9 @@ class PiholeClient:
                 status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=f"Connection failure: {str(e)}"
             ) from e
 
-    def _request(self, method: str, endpoint: str, json: Optional[Dict] = None, retry: bool = True) -> Any:
+    def _request(
+        self, method: str, endpoint: str, json: Optional[Dict] = None, params: Optional[Dict] = None, retry: bool = True
+    ) -> Any:
         """
         Internal wrapper to handle SID injection and auto-re-login on 401.
         """
@@ -53,17 +60,20 @@ class PiholeClient:
 
         headers = {"sid": self.sid}
         url = f"{self.base_url}{endpoint}"
+        # First path segment only, e.g. '/domains/allow/exact/x.com' -> '/domains'
+        endpoint_label = "/" + endpoint.lstrip("/").split("/", 1)[0]
 
         try:
-            response = self.session.request(method, url, headers=headers, json=json)
+            response = self.session.request(method, url, headers=headers, json=json, params=params)
 
             # If unauthorized, try to re-auth once
             if response.status_code == 401 and retry:
                 self._authenticate()
                 # Update header with new SID
                 headers["sid"] = self.sid
-                response = self.session.request(method, url, headers=headers, json=json)
+                response = self.session.request(method, url, headers=headers, json=json, params=params)
 
+            PIHOLE_API_REQUESTS.labels(method, endpoint_label, str(response.status_code)).inc()
             if not response.ok:
                 # Attempt to extract error message from Pi-hole
                 try:
@@ -79,6 +89,7 @@ class PiholeClient:
             return response.json()
 
         except requests.RequestException as e:
+            PIHOLE_API_REQUESTS.labels(method, endpoint_label, "error").inc()
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Network Error: {str(e)}"
             ) from e
@@ -161,3 +172,30 @@ class PiholeClient:
 
     def delete_whitelist(self, domain: str) -> None:
         self._request("DELETE", f"/domains/allow/exact/{domain}")
+
+    def get_lists(self) -> List[Dict]:
+        """Returns all configured adlists (block and allow)."""
+        data = self._request("GET", "/lists")
+        return data.get("lists", [])
+
+    def get_domains(self) -> List[Dict]:
+        """Returns all exact and regex domain rules."""
+        data = self._request("GET", "/domains")
+        return data.get("domains", [])
+
+    def iter_queries(self, from_ts: float, until_ts: float, page_size: int = QUERY_PAGE_SIZE) -> Iterator[Dict]:
+        """
+        Yields FTL query log entries between two timestamps, newest first.
+        Pages are pinned to the cursor of the first page so new queries do not shift the offsets.
+        """
+        params = {"from": int(from_ts), "until": int(until_ts), "length": page_size, "start": 0}
+
+        while True:
+            data = self._request("GET", "/queries", params=params)
+            queries = data.get("queries", [])
+            yield from queries
+
+            if len(queries) < page_size or data.get("cursor") is None:
+                return
+            params.setdefault("cursor", data["cursor"])
+            params["start"] += page_size
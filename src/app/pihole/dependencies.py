@@ -1,3 +1,4 @@
+from .cache import CachedPiholeClient
 from .client import PiholeClient
 
 # Create a singleton instance
@@ -7,9 +8,9 @@ _pihole_client_instance = None
 def get_pihole_service() -> PiholeClient:
     """
     Dependency injection for PiholeClient.
-    Ensures we reuse the authenticated session.
+    Ensures we reuse the authenticated session and the response cache.
     """
     global _pihole_client_instance
     if _pihole_client_instance is None:
-        _pihole_client_instance = PiholeClient()
+        _pihole_client_instance = CachedPiholeClient()
     return _pihole_client_instance
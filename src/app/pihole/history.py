@@ -0,0 +1,167 @@
+import asyncio
+import mmap
+import os
+import struct
+import threading
+import time
+from pathlib import Path
+from typing import List, NamedTuple, Optional
+
+from app.core.logger import logger
+from app.pihole.dependencies import get_pihole_service
+from app.pihole.schemas import HistoryResolution
+
+HISTORY_FILE = Path("/opt/streamcloak/data/pihole_history.bin")
+SAMPLE_INTERVAL = 60  # in seconds
+MAX_SAMPLE_GAP = 5 * SAMPLE_INTERVAL  # in seconds - queries of a longer gap cannot be put in a bucket and are left out
+
+MAGIC = b"SCH2"
+# magic, reserved, time of the last sample, its dns_queries_today and ads_blocked_today
+HEADER = struct.Struct("<4sIQQQ")
+# bucket start, sample count, queries in the bucket, blocked in the bucket, active clients sum, active clients max
+SLOT = struct.Struct("<IIQQII")
+
+
+class Tier(NamedTuple):
+    resolution: int  # bucket width in seconds
+    slots: int  # buckets kept, the oldest is overwritten
+
+
+TIERS = {
+    HistoryResolution.MINUTE: Tier(60, 24 * 60),  # 1 day
+    HistoryResolution.HOUR: Tier(60 * 60, 30 * 24),  # 30 days
+    HistoryResolution.DAY: Tier(24 * 60 * 60, 365),  # 1 year
+}
+
+
+def _counter_delta(value: int, last: int, gap: float) -> int:
+    """
+    Increase of a daily counter of FTL since the last sample. The counters start from zero every day.
+    """
+    if gap > MAX_SAMPLE_GAP:
+        return 0
+    return value - last if value >= last else value
+
+
+class PiholeHistory:
+    """
+    Fixed-size round-robin time series of Pi-hole summary counters, memory-mapped from one file.
+
+    Every tier is a ring of slots indexed by bucket start, so a write touches exactly one slot per tier
+    and stale slots are recognized by their stored bucket start. The file never grows (~80 KB).
+    """
+
+    def __init__(self, path: Path = HISTORY_FILE):
+        self.path = path
+        self._mm: Optional[mmap.mmap] = None
+        self._offsets = {}
+        self._lock = threading.Lock()
+
+        offset = HEADER.size
+        for resolution, tier in TIERS.items():
+            self._offsets[resolution] = offset
+            offset += tier.slots * SLOT.size
+        self._size = offset
+
+    def _map(self) -> mmap.mmap:
+        if self._mm is not None:
+            return self._mm
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size != self._size:
+                # New file or different layout, start from an empty series
+                os.ftruncate(fd, 0)
+                os.ftruncate(fd, self._size)
+            mm = mmap.mmap(fd, self._size)
+        finally:
+            os.close(fd)
+
+        if HEADER.unpack_from(mm, 0)[0] != MAGIC:
+            mm[:] = bytes(self._size)
+            HEADER.pack_into(mm, 0, MAGIC, 0, 0, 0, 0)
+        self._mm = mm
+        return mm
+
+    def _slot_position(self, resolution: HistoryResolution, bucket_start: int) -> int:
+        tier = TIERS[resolution]
+        return self._offsets[resolution] + (bucket_start // tier.resolution % tier.slots) * SLOT.size
+
+    def record(self, ts: float, queries: int, blocked: int, active_clients: int) -> None:
+        """
+        Takes the cumulative counters of today, the buckets store how much they increased since the last sample.
+        """
+        with self._lock:
+            mm = self._map()
+            _, _, last_ts, last_queries, last_blocked = HEADER.unpack_from(mm, 0)
+            HEADER.pack_into(mm, 0, MAGIC, 0, int(ts), queries, blocked)
+            queries = _counter_delta(queries, last_queries, ts - last_ts)
+            blocked = _counter_delta(blocked, last_blocked, ts - last_ts)
+
+            for resolution, tier in TIERS.items():
+                bucket_start = int(ts) - int(ts) % tier.resolution
+                position = self._slot_position(resolution, bucket_start)
+                start, samples, q_sum, b_sum, c_sum, c_max = SLOT.unpack_from(mm, position)
+
+                if start != bucket_start:
+                    samples = q_sum = b_sum = c_sum = c_max = 0
+                SLOT.pack_into(
+                    mm,
+                    position,
+                    bucket_start,
+                    samples + 1,
+                    q_sum + queries,
+                    b_sum + blocked,
+                    c_sum + active_clients,
+                    max(c_max, active_clients),
+                )
+
+    def read(self, resolution: HistoryResolution, from_ts: float, until_ts: float) -> List[dict]:
+        """
+        Returns the buckets of one tier between two timestamps, oldest first: queries and blocked queries
+        within the bucket, active clients averaged. Buckets without samples are left out.
+        """
+        tier = TIERS[resolution]
+        from_ts = max(int(from_ts), int(until_ts) - tier.resolution * (tier.slots - 1))
+        bucket_start = from_ts - from_ts % tier.resolution
+
+        points = []
+        with self._lock:
+            mm = self._map()
+            while bucket_start <= until_ts:
+                start, samples, q_sum, b_sum, c_sum, c_max = SLOT.unpack_from(
+                    mm, self._slot_position(resolution, bucket_start)
+                )
+                if start == bucket_start and samples:
+                    points.append(
+                        {
+                            "ts": start,
+                            "dns_queries": q_sum,
+                            "ads_blocked": b_sum,
+                            "active_clients": round(c_sum / samples, 1),
+                            "active_clients_max": c_max,
+                        }
+                    )
+                bucket_start += tier.resolution
+        return points
+
+
+pihole_history = PiholeHistory()
+
+
+async def sample_pihole_history() -> None:
+    """
+    Scheduler job: stores one summary sample in every history tier.
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        summary = await loop.run_in_executor(None, get_pihole_service().get_summary)
+        pihole_history.record(
+            time.time(),
+            summary["dns_queries_today"],
+            summary["ads_blocked_today"],
+            summary["clients"]["active"],
+        )
+    except Exception as e:
+        logger.warning(f"Cannot sample Pi-hole history: {e}")
@@ -1,17 +1,28 @@
-from typing import List
+import time
+from typing import List, Optional
 
-from fastapi import APIRouter, BackgroundTasks, Depends, Path, status
+from fastapi import APIRouter, BackgroundTasks, Depends, Path, Query, status
+from fastapi.responses import StreamingResponse
 
+from app.pihole.analytics import get_query_aggregates, stream_queries_ndjson
 from app.pihole.client import PiholeClient
 from app.pihole.dependencies import get_pihole_service
+from app.pihole.history import pihole_history
 from app.pihole.schemas import (
+    CacheStatsResponse,
     DomainItem,
+    GravityStatusResponse,
+    HistoryResolution,
+    HistoryResponse,
     PiholeStatusResponse,
     PiholeStatusUpdate,
+    QueryAggregatesResponse,
+    QueryLogEntry,
+    QueryWindow,
     SummaryResponse,
     WhitelistUpdateRequest,
 )
-from app.pihole.service import update_gravity
+from app.pihole.service import get_gravity_status, stream_gravity_progress, update_gravity
 
 router = APIRouter()
 
@@ -36,6 +47,56 @@ def set_status(status_update: PiholeStatusUpdate, service: PiholeClient = Depend
     return {"blocking": new_state}
 
 
+@router.get("/cache", response_model=CacheStatsResponse)
+def get_cache_stats(service: PiholeClient = Depends(get_pihole_service)):  # noqa: B008
+    """Hit/miss counters of the Pi-hole response cache."""
+    return service.cache.stats()
+
+
+@router.get("/history", response_model=HistoryResponse)
+def get_history(
+    resolution: HistoryResolution = HistoryResolution.MINUTE,
+    from_ts: Optional[float] = Query(None, description="Unix timestamp, defaults to the full retention of the tier"),
+    until_ts: Optional[float] = Query(None, description="Unix timestamp, defaults to now"),
+):
+    """
+    Summary counters over time, served from the on-disk history without calling FTL.
+    Retention: 1 day at 1m, 30 days at 1h, 1 year at 1d.
+    """
+    until_ts = until_ts or time.time()
+    points = pihole_history.read(resolution, from_ts or 0, until_ts)
+    return {"resolution": resolution, "points": points}
+
+
+@router.get(
+    "/queries",
+    response_class=StreamingResponse,
+    responses={200: {"content": {"application/x-ndjson": {}}, "model": QueryLogEntry}},
+)
+def get_queries(
+    from_ts: Optional[float] = Query(None, description="Unix timestamp, defaults to one hour ago"),
+    until_ts: Optional[float] = Query(None, description="Unix timestamp, defaults to now"),
+    service: PiholeClient = Depends(get_pihole_service),  # noqa: B008
+):
+    """
+    Stream the FTL query log as NDJSON, one QueryLogEntry per line, newest first.
+    Pages are fetched from FTL while the response is sent, so a full day never sits in memory.
+    """
+    until_ts = until_ts or time.time()
+    from_ts = from_ts or until_ts - 3600
+    return StreamingResponse(stream_queries_ndjson(service, from_ts, until_ts), media_type="application/x-ndjson")
+
+
+@router.get("/queries/top", response_model=QueryAggregatesResponse)
+def get_queries_top(
+    window: QueryWindow = QueryWindow.HOUR,
+    count: int = Query(10, ge=1, le=100, description="Number of entries per top list"),
+    service: PiholeClient = Depends(get_pihole_service),  # noqa: B008
+):
+    """Top clients, domains and blocked domains of a time window."""
+    return get_query_aggregates(service, window, count)
+
+
 @router.get("/whitelist", response_model=List[DomainItem])
 def get_whitelist(service: PiholeClient = Depends(get_pihole_service)):  # noqa: B008
     """Get all domains in the allow-list."""
@@ -66,3 +127,28 @@ def remove_whitelist_entry(
     """Remove a domain from the whitelist."""
     service.delete_whitelist(domain)
     background_tasks.add_task(update_gravity)
+
+
+@router.get("/gravity", response_model=GravityStatusResponse)
+def get_gravity():
+    """Get the state and outcome of the last gravity update."""
+    return get_gravity_status()
+
+
+@router.post("/gravity", response_model=GravityStatusResponse, status_code=status.HTTP_202_ACCEPTED)
+def trigger_gravity(
+    background_tasks: BackgroundTasks,
+    force: bool = Query(False, description="Run even if the adlists did not change since the last success"),
+):
+    """
+    Request a gravity update.
+    Merged with a run that is already queued, follow the output via /gravity/progress.
+    """
+    background_tasks.add_task(update_gravity, force)
+    return get_gravity_status()
+
+
+@router.get("/gravity/progress")
+async def get_gravity_progress():
+    """Stream the output of the current gravity run line by line."""
+    return StreamingResponse(stream_gravity_progress(), media_type="text/plain")
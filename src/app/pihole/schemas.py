@@ -1,3 +1,4 @@
+from enum import Enum
 from typing import List, Optional
 
 from pydantic import BaseModel, Field
@@ -38,3 +39,84 @@ class SummaryResponse(BaseModel):
     ads_blocked_today: int
     ads_percentage_today: int
     clients: SummaryClients
+
+
+# --- Gravity Schemas ---
+class GravityRun(BaseModel):
+    started_at: float = Field(..., description="Unix timestamp when the run was requested/started")
+    finished_at: Optional[float] = None
+    duration_seconds: Optional[float] = None
+    return_code: Optional[int] = None
+    success: bool
+    skipped: bool = Field(False, description="True if the run was skipped because the adlists did not change")
+    reason: Optional[str] = None
+
+
+class GravityStatusResponse(BaseModel):
+    running: bool = Field(..., description="True if 'pihole -g' is currently running in any worker")
+    last_run: Optional[GravityRun] = None
+    last_success_at: Optional[float] = None
+
+
+# --- Cache Schemas ---
+class CacheStatsResponse(BaseModel):
+    name: str
+    entries: int
+    hits: int
+    stale_hits: int = Field(..., description="Stale values served while a background refresh was running")
+    misses: int
+    refresh_errors: int
+
+
+# --- Query Log Schemas ---
+class QueryWindow(str, Enum):
+    MINUTES_15 = "15m"
+    HOUR = "1h"
+    DAY = "24h"
+
+
+class QueryLogEntry(BaseModel):
+    time: float
+    domain: Optional[str] = None
+    type: Optional[str] = None
+    status: Optional[str] = None
+    blocked: bool
+    client_ip: Optional[str] = None
+    client_name: Optional[str] = None
+
+
+class TopItem(BaseModel):
+    name: str
+    count: int
+    error: int = Field(0, description="Upper bound of the overcount, 0 means the count is exact")
+
+
+class QueryAggregatesResponse(BaseModel):
+    window: QueryWindow
+    from_ts: float
+    until_ts: float
+    total_queries: int
+    blocked_queries: int
+    top_clients: List[TopItem]
+    top_domains: List[TopItem]
+    top_blocked_domains: List[TopItem]
+
+
+# --- History Schemas ---
+class HistoryResolution(str, Enum):
+    MINUTE = "1m"
+    HOUR = "1h"
+    DAY = "1d"
+
+
+class HistoryPoint(BaseModel):
+    ts: int = Field(..., description="Unix timestamp of the bucket start")
+    dns_queries: int = Field(..., description="DNS queries within the bucket")
+    ads_blocked: int = Field(..., description="Blocked queries within the bucket")
+    active_clients: float
+    active_clients_max: int
+
+
+class HistoryResponse(BaseModel):
+    resolution: HistoryResolution
+    points: List[HistoryPoint]
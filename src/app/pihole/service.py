@@ -1,35 +1,246 @@
 import asyncio
+import fcntl
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from typing import AsyncIterator, Optional
+
+from fastapi import HTTPException
 
 from app.core.config import get_settings
 from app.core.logger import logger
-from app.core.utils import run_command
+from app.pihole.dependencies import get_pihole_service
 
 settings = get_settings()
 
+GRAVITY_CMD = ["sudo", "pihole", "-g"]
+GRAVITY_LOCK_FILE = "/tmp/streamcloak_gravity.lock"
+GRAVITY_LOG_FILE = Path("/tmp/streamcloak_gravity.log")
+GRAVITY_STATE_FILE = Path("/opt/streamcloak/config/gravity_state.json")
+GRAVITY_MAX_AGE = 24 * 60 * 60  # in seconds - unchanged adlists are only skipped while the last success is younger
+PROGRESS_POLL_INTERVAL = 0.5  # in seconds
+
 
-async def update_gravity() -> dict:
+def _read_state() -> dict:
     """
-    Executes 'pihole -g' to update adlists.
-    Runs in a separate thread to avoid blocking the asyncio event loop.
+    Reads the persisted gravity state (last run, last success, adlist fingerprint).
     """
-
-    if settings.ENVIRONMENT == "dev":
-        logger.debug("Do not update gravity in dev mode...")
+    try:
+        with open(GRAVITY_STATE_FILE, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
         return {}
+    except Exception as e:
+        logger.warning(f"Cannot read gravity state: {e}")
+        return {}
+
+
+def _write_state(state: dict) -> None:
+    """
+    Writes the gravity state atomically so other workers never read a partial file.
+    """
+    try:
+        GRAVITY_STATE_FILE.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = GRAVITY_STATE_FILE.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, GRAVITY_STATE_FILE)
+    except OSError as e:
+        logger.error(f"Cannot write gravity state: {e}")
 
-    loop = asyncio.get_running_loop()
 
-    # Since pihole -g is IO/CPU heavy and long-running, we offload it.
+def _adlist_fingerprint() -> Optional[str]:
+    """
+    Hashes the configured adlists and domain rules.
+    Returns None if Pi-hole cannot be reached, which disables the skip policy.
+    """
+    client = get_pihole_service()
     try:
-        # Running 'pihole -g'
-        output = await loop.run_in_executor(None, run_command, ["sudo", "pihole", "-g"])
+        lists = client.get_lists()
+        domains = client.get_domains()
+    except HTTPException as e:
+        logger.warning(f"Cannot fingerprint adlists: {e.detail}")
+        return None
 
-        logger.info("Pi-hole gravity updated successfully via CLI.")
+    entries = [
+        json.dumps([item.get(key) for key in ("address", "type", "enabled", "groups", "date_modified")], default=str)
+        for item in lists
+    ]
+    entries += [
+        json.dumps([item.get(key) for key in ("domain", "type", "kind", "enabled", "groups")], default=str)
+        for item in domains
+    ]
+    return hashlib.sha256("\n".join(sorted(entries)).encode()).hexdigest()
 
-        return {
-            "success": True,
-            "output": output,  # Contains the log output from the command
-        }
-    except Exception as e:
-        logger.error(f"Failed to update gravity: {str(e)}")
-        return {"success": False, "error": str(e)}
+
+def is_gravity_running() -> bool:
+    """
+    Checks the cross-process gravity lock without taking it.
+    """
+    try:
+        with open(GRAVITY_LOCK_FILE, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+        return False
+    except BlockingIOError:
+        return True
+    except OSError as e:
+        logger.warning(f"Cannot check gravity lock: {e}")
+        return False
+
+
+def get_gravity_status() -> dict:
+    state = _read_state()
+    return {
+        "running": is_gravity_running(),
+        "last_run": state.get("last_run"),
+        "last_success_at": state.get("last_success_at"),
+    }
+
+
+def _read_progress(offset: int) -> tuple[str, int]:
+    """
+    Returns all complete lines of the progress log written after the given offset.
+    """
+    try:
+        with open(GRAVITY_LOG_FILE, "rb") as f:
+            f.seek(offset)
+            chunk = f.read()
+    except FileNotFoundError:
+        return "", 0
+
+    end = chunk.rfind(b"\n") + 1
+    return chunk[:end].decode("utf-8", errors="replace"), offset + end
+
+
+async def stream_gravity_progress() -> AsyncIterator[str]:
+    """
+    Yields the 'pihole -g' output line by line until the current run has finished.
+    Works across workers because the output is tailed from the shared progress log.
+    """
+    offset = 0
+    while True:
+        running = is_gravity_running()
+        chunk, offset = _read_progress(offset)
+        if chunk:
+            yield chunk
+        if not running:
+            break
+        await asyncio.sleep(PROGRESS_POLL_INTERVAL)
+
+
+class GravityManager:
+    """
+    Single-flight runner for 'pihole -g'.
+    Requests arriving while a run is active are merged into one follow-up run,
+    a file lock keeps other workers from running gravity at the same time.
+    """
+
+    def __init__(self):
+        self._lock = asyncio.Lock()
+        self._queued: Optional[asyncio.Task] = None
+        self._queued_force = False
+
+    async def request(self, force: bool = False) -> dict:
+        self._queued_force = self._queued_force or force
+        if self._queued is None:
+            self._queued = asyncio.create_task(self._run_when_free())
+        # Shield the shared run, a cancelled caller must not cancel it for everybody else
+        return await asyncio.shield(self._queued)
+
+    async def _run_when_free(self) -> dict:
+        async with self._lock:
+            self._queued = None
+            force, self._queued_force = self._queued_force, False
+            try:
+                return await self._run(force)
+            except Exception as e:
+                logger.error(f"Failed to update gravity: {str(e)}")
+                return {"success": False, "error": str(e)}
+
+    async def _run(self, force: bool) -> dict:
+        if settings.ENVIRONMENT == "dev":
+            logger.debug("Do not update gravity in dev mode...")
+            return {}
+
+        loop = asyncio.get_running_loop()
+        with open(GRAVITY_LOCK_FILE, "a") as lock_file:
+            # Blocks until a run in another worker has finished, closing the file releases the lock
+            await loop.run_in_executor(None, fcntl.flock, lock_file, fcntl.LOCK_EX)
+
+            fingerprint = await loop.run_in_executor(None, _adlist_fingerprint)
+            state = _read_state()
+
+            if not force and self._can_skip(state, fingerprint):
+                logger.info("Adlists unchanged since last successful gravity run, skipping.")
+                record = {"started_at": time.time(), "skipped": True, "success": True, "reason": "unchanged"}
+                state["last_run"] = record
+                _write_state(state)
+                return record
+
+            record = await self._execute()
+
+            state["last_run"] = record
+            if record["success"]:
+                state["last_success_at"] = record["finished_at"]
+                state["fingerprint"] = fingerprint
+                # Blocked domain count and last update changed
+                get_pihole_service().cache.invalidate("summary")
+            _write_state(state)
+            return record
+
+    @staticmethod
+    def _can_skip(state: dict, fingerprint: Optional[str]) -> bool:
+        last_success = state.get("last_success_at")
+        if not fingerprint or not last_success:
+            return False
+        return state.get("fingerprint") == fingerprint and time.time() - last_success < GRAVITY_MAX_AGE
+
+    @staticmethod
+    async def _execute() -> dict:
+        """
+        Runs 'pihole -g' and mirrors its output into the progress log while it runs.
+        """
+        started_at = time.monotonic()
+        record = {"started_at": time.time(), "skipped": False, "reason": None}
+        logger.info("Starting Pi-hole gravity update...")
+
+        with open(GRAVITY_LOG_FILE, "w", encoding="utf-8") as log:
+            try:
+                process = await asyncio.create_subprocess_exec(
+                    *GRAVITY_CMD, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT
+                )
+                async for raw_line in process.stdout:
+                    # pihole -g redraws its spinner with carriage returns
+                    for line in raw_line.decode("utf-8", errors="replace").replace("\r", "\n").splitlines():
+                        if line.strip():
+                            log.write(line + "\n")
+                    log.flush()
+                return_code = await process.wait()
+            except FileNotFoundError:
+                log.write(f"Command not found: {GRAVITY_CMD[0]}\n")
+                return_code = 127
+
+        record["finished_at"] = time.time()
+        record["duration_seconds"] = round(time.monotonic() - started_at, 2)
+        record["return_code"] = return_code
+        record["success"] = return_code == 0
+
+        if record["success"]:
+            logger.info(f"Pi-hole gravity updated successfully in {record['duration_seconds']}s.")
+        else:
+            logger.error(f"Pi-hole gravity update failed ({return_code}) after {record['duration_seconds']}s.")
+        return record
+
+
+gravity_manager = GravityManager()
+
+
+async def update_gravity(force: bool = False) -> dict:
+    """
+    Requests a 'pihole -g' run to update adlists.
+    Concurrent requests share a single run, see GravityManager.
+    """
+    return await gravity_manager.request(force=force)
@@ -1,6 +1,7 @@
 from fastapi import APIRouter, HTTPException, Path, status
 
 from app.core.logger import logger
+from app.core.rate_limit import RateLimiter, rate_limited
 from app.vpn.exceptions.schemas import DomainExceptionEntry, DomainExceptionResponse
 from app.vpn.exceptions.service import (
     delete_domain_exception,
@@ -12,6 +13,9 @@ from app.vpn.exceptions.service import (
 
 router = APIRouter()
 
+# A sync restarts OpenVPN and the firewall, allow two in a row and then one per minute
+sync_limiter = RateLimiter("domain_sync", rate=1 / 60, burst=2)
+
 
 @router.get(
     "/domains",
@@ -105,6 +109,7 @@ async def delete_domain_exception_route(
     status_code=status.HTTP_200_OK,
     summary="Sync Domain Exceptions",
     description="Applies changes to the system (Firewall/OpenVPN) if the sync flag is set.",
+    dependencies=[rate_limited(sync_limiter)],
 )
 async def sync_domain_exceptions_route():
     """
@@ -6,6 +6,7 @@ from fastapi import HTTPException, status
 
 from app.core.config import get_settings
 from app.core.logger import logger
+from app.core.systemd import units
 from app.core.utils import run_command
 from app.vpn.exceptions.schemas import DomainExceptionEntry
 from app.vpn.openvpn.service import OpenVPNService
@@ -15,6 +16,7 @@ settings = get_settings()
 # Constants
 SYNC_FLAG_PATH = Path("/tmp/domain_exceptions_needs_update.flag")
 IPTABLES_SCRIPT = "/etc/openvpn/fetch_exception_ips.sh"
+IPTABLES_UNIT = "iptables.service"
 
 
 def get_domain_exceptions() -> Dict[str, bool]:
@@ -88,7 +90,7 @@ def remove_domain_exceptions_sync_flag() -> None:
 def sync_domain_exceptions() -> bool:
     """
     Synchronizes the domain exceptions by running system scripts.
-    Relies on 'systemctl restart iptables' to atomically reload rules.
+    Relies on restarting iptables.service to atomically reload rules.
     """
     logger.info("Starting domain exception sync...")
     openvpn_service = OpenVPNService()
@@ -109,10 +111,8 @@ def sync_domain_exceptions() -> bool:
         # 3. Reload Firewall Rules
         # Instead of Flushing (-F) and leaving system naked, we restart the service.
         # This assumes iptables.service loads rules from /etc/iptables/rules.v4 or similar.
-        code_fw, _, err_fw = run_command(["/usr/bin/systemctl", "restart", "iptables.service"])
-
-        if code_fw != 0:
-            logger.error(f"Failed to restart iptables: {err_fw}")
+        if not units.run(units.restart(IPTABLES_UNIT)):
+            logger.error("Failed to restart iptables")
             raise Exception("Firewall restart failed. System might be in inconsistent state.")
 
     except Exception as e:
@@ -3,14 +3,22 @@ import time
 from typing import Tuple
 
 from app.core.logger import logger
+from app.core.request_cache import invalidate, request_cached
+from app.core.systemd import UnitError, units
 from app.core.utils import run_command
 
+# Request cache namespaces, invalidated by every write to the config or the service
+CONFIG_CACHE = "openvpn.config"
+STATE_CACHE = "openvpn.state"
+
+OPENVPN_UNIT = "openvpn@client.service"
+
 
 class OpenVPNService:
     def __init__(self):
         # Configuration paths defined here or loaded from env
         self.conf_path = "/etc/openvpn/client.conf"
-        self.service_name = "openvpn@client"
+        self.service_name = OPENVPN_UNIT
 
     def get_status_info(self) -> dict:
         """
@@ -22,6 +30,7 @@ class OpenVPNService:
             "current_remote": self.get_remote_address(),
         }
 
+    @request_cached(CONFIG_CACHE, key=lambda self: self.conf_path)
     def get_remote_address(self) -> str:
         """
         Reads the remote address from the OpenVPN configuration file.
@@ -57,6 +66,7 @@ class OpenVPNService:
         max_retries = 15
         for _ in range(max_retries):
             time.sleep(1)
+            invalidate(STATE_CACHE)
             if self._check_service_active() and self._check_tun_interface():
                 logger.info("VPN connection successfully established.")
                 return True, "VPN connected successfully."
@@ -70,38 +80,39 @@ class OpenVPNService:
         return False, "Connection timed out. Reverted to previous server."
 
     def restart(self) -> bool:
-        return self._run_systemctl("restart")
+        return self._control_unit(units.restart(self.service_name))
 
     def stop(self) -> bool:
-        return self._run_systemctl("stop")
+        return self._control_unit(units.stop(self.service_name))
 
     def start(self) -> bool:
-        return self._run_systemctl("start")
+        return self._control_unit(units.start(self.service_name))
 
     def enable(self) -> bool:
-        success_enable = self._run_systemctl("enable")
-        success_start = self._run_systemctl("start")
-        return success_enable and success_start
-
-    def _run_systemctl(self, action: str) -> bool:
-        """Helper für Systemd Calls"""
-        valid_actions = ["start", "stop", "restart", "enable"]
-        if action not in valid_actions:
-            logger.error(f"Invalid OpenVPN action: {action}")
-            return False
+        async def enable_and_start() -> bool:
+            await units.enable(self.service_name)
+            return await units.start(self.service_name)
 
-        cmd = ["sudo", "/usr/bin/systemctl", action, self.service_name]
-        code, _, err = run_command(cmd)
-        if code != 0:
-            logger.error(f"Failed to {action} OpenVPN: {err}")
-            return False
-        return True
+        return self._control_unit(enable_and_start())
 
+    def _control_unit(self, job) -> bool:
+        """
+        Runs a unit manager call and waits until systemd finished the job.
+        """
+        try:
+            success = units.run(job)
+        except UnitError as e:
+            logger.error(f"Failed to control OpenVPN: {e}")
+            success = False
+        invalidate(STATE_CACHE)
+        return success
+
+    @request_cached(STATE_CACHE, key=lambda self: self.service_name)
     def _check_service_active(self) -> bool:
-        code, _, _ = run_command(["/usr/bin/systemctl", "is-active", "--quiet", self.service_name])
-        return code == 0
+        return units.run(units.is_active(self.service_name))
 
     @staticmethod
+    @request_cached(STATE_CACHE)
     def _check_tun_interface() -> bool:
         # Crucial for Killswitch verification
         code, _, _ = run_command(["ip", "link", "show", "tun0"])
@@ -116,6 +127,7 @@ class OpenVPNService:
 
         cmd = ["sudo", "sed", "-i", f"s/^remote .*/remote {new_server} 443/", self.conf_path]
         code, _, err = run_command(cmd, check=False)
+        invalidate(CONFIG_CACHE)
 
         if code != 0:
             logger.error(f"Failed to update VPN config with sed: {err}")
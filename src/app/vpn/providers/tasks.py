@@ -1,11 +1,12 @@
 import json
 from pathlib import Path
 
-import httpx
-
 from app.core.config import get_settings
 from app.core.constants import VPN_PROVIDERS
 from app.core.logger import logger
+from app.core.startup import lazy_import
+
+httpx = lazy_import("httpx")  # only needed by the weekly download
 
 settings = get_settings()
 
@@ -1,9 +1,11 @@
 import os
 
-from app.core.utils import run_command
+from app.core.logger import logger
+from app.core.systemd import UnitError, units
 
 # Constants
 HOSTAPD_CONF = "/etc/hostapd/hostapd.conf"
+HOSTAPD_UNIT = "hostapd.service"
 WIFI_ENABLE_FILE = "/etc/wifi_enable"
 
 
@@ -42,24 +44,39 @@ def get_wifi_status_file() -> bool:
         return False
 
 
+async def _start_hostapd() -> bool:
+    # Enable ensures persistence after reboot, unmask is a safety net. Both share one daemon-reload and,
+    # like before, a failure of either does not keep hostapd from being restarted.
+    try:
+        await units.unmask(HOSTAPD_UNIT, reload=False)
+        await units.enable(HOSTAPD_UNIT)
+    except UnitError as e:
+        logger.warning(f"Cannot enable {HOSTAPD_UNIT} (ignored): {e}")
+    return await units.restart(HOSTAPD_UNIT)
+
+
+async def _stop_hostapd() -> bool:
+    try:
+        await units.disable(HOSTAPD_UNIT)
+    except UnitError as e:
+        logger.warning(f"Cannot disable {HOSTAPD_UNIT} (ignored): {e}")
+    return await units.stop(HOSTAPD_UNIT)
+
+
 def control_hostapd(action: str) -> bool:
     """
-    Controls the hostapd service via systemctl.
+    Controls the hostapd service via the systemd unit manager.
     Action: 'start' or 'stop'.
     """
-    if action == "start":
-        # Enable ensures persistence after reboot
-        run_command(["/usr/bin/systemctl", "unmask", "hostapd"])  # Safety net
-        run_command(["/usr/bin/systemctl", "enable", "hostapd"])
-        code, _, _ = run_command(["/usr/bin/systemctl", "restart", "hostapd"])
-        return code == 0
-
-    elif action == "stop":
-        run_command(["/usr/bin/systemctl", "disable", "hostapd"])
-        code, _, _ = run_command(["/usr/bin/systemctl", "stop", "hostapd"])
-        return code == 0
-
-    return False
+    jobs = {"start": _start_hostapd, "stop": _stop_hostapd}
+    if action not in jobs:
+        return False
+
+    try:
+        return units.run(jobs[action]())
+    except UnitError as e:
+        logger.error(f"Failed to {action} hostapd: {e}")
+        return False
 
 
 def set_wifi_state(enabled: bool) -> bool:
@@ -0,0 +1,9 @@
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# The app is not installed as a package, it runs from src/ like in the systemd units.
+# The fake backends and the provider stand-in of the benchmarks are shared with the tests.
+sys.path.insert(0, str(ROOT / "src"))
+sys.path.insert(0, str(ROOT / "benchmarks"))
@@ -0,0 +1,79 @@
+import hashlib
+import time
+from unittest import mock
+
+import jwt
+import pytest
+
+from app.auth import service
+from app.auth.sessions import SessionRegistry
+
+
+def _legacy_token(issued_at: float) -> str:
+    # Issued by a release without 'auth_time', 'sid' and 'jti', near its expiry
+    expires_at = issued_at + service.settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60
+    return jwt.encode(
+        {"sub": "admin", "exp": int(expires_at)}, service._SIGNING_KEY, algorithm=service.settings.ALGORITHM
+    )
+
+
+def test_legacy_token_is_refreshed_within_its_session():
+    issued_at = time.time() - service.settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60 + 30
+    refreshed = service.check_refresh_eligibility(_legacy_token(issued_at))
+
+    assert refreshed is not None
+    claims = service.decode_token(refreshed)
+    # The session counts from when the legacy token was issued, not from the refresh
+    assert abs(claims["auth_time"] - issued_at) <= 1
+
+
+def test_refresh_ends_with_the_session():
+    session_start = time.time() - service.settings.SESSION_MAX_AGE_DAYS * 86400 - 60
+    claims = {"sub": "admin", "iat": session_start}
+    token = service.create_access_token({"sub": "admin"}, session=claims)
+    # Expiring soon, but the login is older than the session limit
+    payload = jwt.decode(token, service._SIGNING_KEY, algorithms=service._ALGORITHMS)
+    assert payload["auth_time"] == int(session_start)
+    payload["exp"] = int(time.time()) + 30
+    expiring = jwt.encode(payload, service._SIGNING_KEY, algorithm=service.settings.ALGORITHM)
+    assert service.check_refresh_eligibility(expiring) is None
+
+
+def test_token_cache_evicts_the_least_recently_used():
+    cache = service._VerifiedTokenCache(maxsize=2)
+    expires_at = time.time() + 60
+    for digest in (b"a", b"b"):
+        cache.put(digest, {"sub": "admin", "exp": expires_at})
+    assert cache.get(b"a") is not None
+    cache.put(b"c", {"sub": "admin", "exp": expires_at})
+
+    assert cache.get(b"b") is None
+    assert cache.get(b"a") is not None and cache.get(b"c") is not None
+
+
+def test_token_cache_drops_expired_claims():
+    cache = service._VerifiedTokenCache()
+    cache.put(b"a", {"sub": "admin", "exp": time.time() - 1})
+    assert cache.get(b"a") is None
+    assert b"a" not in cache._entries
+
+
+def test_cached_token_is_still_checked_for_revocation(tmp_path):
+    registry = SessionRegistry(tmp_path / "revoked_tokens.log")
+    with mock.patch.object(service, "session_registry", registry):
+        token = service.create_access_token({"sub": "admin"})
+        claims = service.decode_token(token)
+        assert service.token_cache.get(hashlib.sha256(token.encode()).digest()) is not None
+
+        registry.revoke(claims)
+        with pytest.raises(jwt.InvalidTokenError):
+            service.decode_token(token)
+
+
+def test_token_cache_returns_copies():
+    cache = service._VerifiedTokenCache()
+    claims = {"sub": "admin", "exp": time.time() + 60}
+    cache.put(b"a", claims)
+    claims["sub"] = "changed"
+    cache.get(b"a")["sub"] = "changed"
+    assert cache.get(b"a")["sub"] == "admin"
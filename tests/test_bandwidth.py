@@ -0,0 +1,80 @@
+import json
+from unittest import mock
+
+from app.clients import bandwidth
+
+# Shortened 'nft -j list table inet streamcloak_acct' output with one client that sent and received traffic
+# and one that only received
+NFT_OUTPUT = {
+    "nftables": [
+        {"metainfo": {"version": "1.0.6", "release_name": "Lester Gooch #5", "json_schema_version": 1}},
+        {"table": {"family": "inet", "name": "streamcloak_acct", "handle": 7}},
+        {
+            "set": {
+                "family": "inet",
+                "name": "tx",
+                "table": "streamcloak_acct",
+                "type": "ipv4_addr",
+                "handle": 1,
+                "size": 4096,
+                "flags": ["timeout", "dynamic"],
+                "timeout": 86400,
+                "elem": [
+                    {
+                        "elem": {
+                            "val": "192.168.4.10",
+                            "timeout": 86400,
+                            "expires": 86312,
+                            "counter": {"packets": 120, "bytes": 15360},
+                        }
+                    }
+                ],
+            }
+        },
+        {
+            "set": {
+                "family": "inet",
+                "name": "rx",
+                "table": "streamcloak_acct",
+                "type": "ipv4_addr",
+                "handle": 2,
+                "size": 4096,
+                "flags": ["timeout", "dynamic"],
+                "timeout": 86400,
+                "elem": [
+                    {"elem": {"val": "192.168.4.10", "counter": {"packets": 900, "bytes": 1048576}}},
+                    {"elem": {"val": "192.168.4.11", "counter": {"packets": 3, "bytes": 180}}},
+                ],
+            }
+        },
+        {"chain": {"family": "inet", "table": "streamcloak_acct", "name": "forward", "handle": 3}},
+    ]
+}
+
+
+def test_parse_nft_counters():
+    assert bandwidth.parse_nft_counters(json.dumps(NFT_OUTPUT)) == {
+        "192.168.4.10": {"rx": 1048576, "tx": 15360},
+        "192.168.4.11": {"rx": 180, "tx": 0},
+    }
+
+
+def test_parse_empty_table():
+    empty = {"nftables": [{"table": {"family": "inet", "name": "streamcloak_acct", "handle": 7}}]}
+    assert bandwidth.parse_nft_counters(json.dumps(empty)) == {}
+
+
+def test_failed_read_waits_for_the_interval():
+    monitor = bandwidth.BandwidthMonitor()
+    with mock.patch.object(bandwidth, "run_command", return_value=(1, "", "no such table")) as run_command:
+        assert monitor.get_usage() is None
+        assert monitor.get_usage() is None
+    # Only read, a missing table is not installed from a request
+    assert run_command.call_args_list == [mock.call(["sudo", "nft", "-j", "list", "table", "inet", "streamcloak_acct"])]
+
+
+def test_install_ruleset_keeps_an_existing_table():
+    with mock.patch.object(bandwidth, "run_command", return_value=(0, "", "")) as run_command:
+        with mock.patch.object(bandwidth.settings, "ENVIRONMENT", "prod"):
+            bandwidth.install_ruleset()
+    assert run_command.call_count == 1
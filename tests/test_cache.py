@@ -0,0 +1,87 @@
+import threading
+import time
+from contextlib import ExitStack
+
+import harness
+
+from app.core.cache import TTLCache
+from app.pihole.cache import CachedPiholeClient
+
+
+def _wait_for_refresh(cache: TTLCache, key) -> None:
+    deadline = time.monotonic() + 2
+    while cache._entries[key].refreshing and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_stale_value_is_refreshed_in_the_background():
+    cache = TTLCache("test")
+    cache.get("a", lambda: 1, ttl=0, stale_ttl=60)
+    assert cache.get("a", lambda: 2, ttl=0, stale_ttl=60) == 1
+    _wait_for_refresh(cache, "a")
+    assert cache.get("a", lambda: 3, ttl=60) == 2
+
+
+def _slow_refresh(cache: TTLCache, key, value):
+    """
+    Starts a background refresh of the stale key and returns the event that lets it finish.
+    """
+    loading, release = threading.Event(), threading.Event()
+
+    def slow_loader():
+        loading.set()
+        release.wait(2)
+        return value
+
+    cache.get(key, slow_loader, ttl=0, stale_ttl=60)
+    loading.wait(2)
+    return release
+
+
+def test_invalidating_another_key_keeps_the_refresh():
+    cache = TTLCache("test")
+    cache.get("a", lambda: 1, ttl=0, stale_ttl=60)
+    release = _slow_refresh(cache, "a", 2)
+    cache.invalidate("b")
+    release.set()
+    _wait_for_refresh(cache, "a")
+    assert cache.get("a", lambda: 3, ttl=60) == 2
+
+
+def test_refresh_of_an_invalidated_key_is_discarded():
+    cache = TTLCache("test")
+    cache.get("a", lambda: 1, ttl=0, stale_ttl=60)
+    entry = cache._entries["a"]
+    release = _slow_refresh(cache, "a", 2)
+    cache.invalidate("a")
+    release.set()
+    deadline = time.monotonic() + 2
+    while entry.refreshing and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert "a" not in cache._entries
+    assert cache.get("a", lambda: 3, ttl=60) == 3
+
+
+def test_invalidating_everything_discards_every_refresh():
+    cache = TTLCache("test")
+    cache.get("a", lambda: 1, ttl=0, stale_ttl=60)
+    release = _slow_refresh(cache, "a", 2)
+    cache.invalidate()
+    cache.get("a", lambda: 3, ttl=0, stale_ttl=60)
+    release.set()
+    time.sleep(0.1)
+    assert cache.get("a", lambda: 4, ttl=60) == 3
+
+
+def test_cached_pihole_summary_is_a_copy():
+    with ExitStack() as stack:
+        api = harness.FakePiholeApi()
+        api.install(stack)
+        client = CachedPiholeClient()
+        summary = client.get_summary()
+        expected = dict(summary)
+        summary["dns_queries_today"] = -1
+
+        assert client.get_summary() == expected
+    assert api.calls["GET /stats/summary"] == 1
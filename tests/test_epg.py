@@ -0,0 +1,100 @@
+import asyncio
+import gzip
+import time
+from unittest import mock
+
+import harness
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.iptv import epg, playlist, service
+from app.iptv.router import player_router
+
+PORT = 9001
+
+
+@pytest.fixture
+def index_dir(tmp_path):
+    with mock.patch.object(playlist, "INDEX_DIR", tmp_path), mock.patch.object(epg, "INDEX_DIR", tmp_path):
+        yield tmp_path
+
+
+@pytest.fixture
+def provider():
+    with harness.PlaylistServer(channels=10, guide_channels=3) as server:
+        yield server.url.rsplit("/", 1)[0]
+
+
+def _guide_url(provider: str) -> str:
+    return f"{provider}/xmltv.php?username=xuser&password=xpass"
+
+
+def test_build_guide_keeps_the_time_window(index_dir, provider):
+    count = asyncio.run(epg.build_guide(PORT, _guide_url(provider), epg.guide_budget(1)))
+
+    # 48 hourly programmes per channel from 24 hours ago, those that ended before PAST_WINDOW are evicted
+    assert 0 < count < 3 * 48
+    index = epg.guide_indexes.get(PORT)
+    assert [(channel_id, name) for channel_id, name, _ in index.channels()] == [
+        ("ch0.example", "Channel 0"),
+        ("ch1.example", "Channel 1"),
+        ("ch2.example", "Channel 2"),
+    ]
+    assert epg.guide_is_current(PORT, _guide_url(provider))
+    assert not epg.guide_is_current(PORT, f"{provider}/xmltv.php?username=other&password=xpass")
+    with gzip.open(epg.guide_path(PORT)) as f:
+        assert f.read().count(b"<programme ") == 3 * 48
+
+
+def test_now_next(index_dir, provider):
+    asyncio.run(epg.build_guide(PORT, _guide_url(provider), epg.guide_budget(1)))
+    now = time.time()
+
+    name, current, following = epg.guide_indexes.get(PORT).now_next("ch1.example", now, upcoming=2)
+    assert name == "Channel 1"
+    assert current.start <= now < current.stop
+    assert current.title == f"Show {24 + int(now - current.start) // 3600} & more"
+    assert [programme.start for programme in following] == [current.stop, current.stop + 3600]
+    assert epg.guide_indexes.get(PORT).now_next("unknown.example", now) is None
+
+
+def test_guide_over_budget_keeps_the_index(index_dir, provider):
+    count = asyncio.run(epg.build_guide(PORT, _guide_url(provider), budget=100))
+    assert count > 0
+    assert epg.guide_indexes.get(PORT) is not None
+    assert not epg.guide_path(PORT).exists()
+
+
+def _write_proxy(script_dir, provider: str) -> None:
+    (script_dir / f"iptv-proxy-{PORT}.sh").write_text(
+        "#!/bin/bash\n\n# Name: Test\n"
+        f"/usr/local/bin/iptv-proxy --port {PORT} --hostname box.local --user user --password secret "
+        f"--xtream-base-url {provider} --xtream-user xuser --xtream-password xpass\n"
+    )
+
+
+def test_players_get_the_cached_guide(index_dir, provider, tmp_path):
+    script_dir = tmp_path / "bin"
+    script_dir.mkdir()
+    _write_proxy(script_dir, provider)
+    app = FastAPI()
+    app.include_router(player_router, prefix="/iptv")
+    client = TestClient(app)
+
+    with mock.patch.object(service, "SCRIPT_DIR", str(script_dir)):
+        url = f"/iptv/{PORT}/xmltv.php?username=user&password=secret"
+        # Not cached yet: the player is sent to the proxy, which asks the provider
+        response = client.get(url, follow_redirects=False)
+        assert response.status_code == 307
+        assert response.headers["location"] == f"http://box.local:{PORT}/xmltv.php?username=user&password=secret"
+
+        asyncio.run(epg.build_guide(PORT, _guide_url(provider), epg.guide_budget(1)))
+        response = client.get(url, headers={"Accept-Encoding": "gzip"})
+        assert response.status_code == 200
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.content.count(b"<programme ") == 3 * 48
+        assert client.get(url, headers={"Accept-Encoding": "identity"}).content == response.content
+
+        assert client.get(f"/iptv/{PORT}/xmltv.php?username=user&password=wrong").status_code == 401
+        assert client.get("/iptv/9002/xmltv.php?username=user&password=secret").status_code == 404
@@ -0,0 +1,72 @@
+import asyncio
+import time
+from unittest import mock
+
+import pytest
+
+from app.pihole import service
+from app.pihole.service import GravityManager
+
+
+@pytest.fixture
+def gravity(tmp_path):
+    """
+    A manager whose 'pihole -g' runs are recorded instead of executed, with the files in tmp_path.
+    """
+    manager = GravityManager()
+    manager.runs = 0
+    manager.fingerprint = "adlists-1"
+
+    async def execute():
+        manager.runs += 1
+        await asyncio.sleep(0.05)
+        return {"started_at": time.time(), "finished_at": time.time(), "skipped": False, "success": True}
+
+    with (
+        mock.patch.object(service, "GRAVITY_LOCK_FILE", str(tmp_path / "gravity.lock")),
+        mock.patch.object(service, "GRAVITY_STATE_FILE", tmp_path / "gravity_state.json"),
+        mock.patch.object(service.settings, "ENVIRONMENT", "prod"),
+        mock.patch.object(service, "_adlist_fingerprint", lambda: manager.fingerprint),
+        mock.patch.object(service, "get_pihole_service"),
+        mock.patch.object(manager, "_execute", execute),
+    ):
+        yield manager
+
+
+def test_requests_during_a_run_share_one_follow_up(gravity):
+    async def requests():
+        first = asyncio.create_task(gravity.request(force=True))
+        await asyncio.sleep(0.01)
+        # Arrive while the first run is active
+        return first, await asyncio.gather(*(gravity.request(force=True) for _ in range(3)))
+
+    first, following = asyncio.run(requests())
+    assert gravity.runs == 2
+    assert following[0] is following[1] is following[2]
+    assert first.result() is not following[0]
+
+
+def test_unchanged_adlists_are_skipped(gravity):
+    assert not asyncio.run(gravity.request())["skipped"]
+    assert asyncio.run(gravity.request())["skipped"]
+    assert gravity.runs == 1
+
+    # Forced, or the adlists changed
+    assert not asyncio.run(gravity.request(force=True))["skipped"]
+    gravity.fingerprint = "adlists-2"
+    assert not asyncio.run(gravity.request())["skipped"]
+    assert gravity.runs == 3
+
+
+def test_never_skipped_without_a_fingerprint(gravity):
+    gravity.fingerprint = None
+    asyncio.run(gravity.request())
+    asyncio.run(gravity.request())
+    assert gravity.runs == 2
+
+
+def test_old_success_is_not_skipped(gravity):
+    asyncio.run(gravity.request())
+    with mock.patch.object(service.time, "time", return_value=time.time() + service.GRAVITY_MAX_AGE + 1):
+        assert not asyncio.run(gravity.request())["skipped"]
+    assert gravity.runs == 2
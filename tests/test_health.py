@@ -0,0 +1,29 @@
+from unittest import mock
+
+from app.core import health
+
+
+def _probe_tun0(active_state: str, enabled: bool, flags: str = "0x1003"):
+    async def active_states(unit):
+        return {unit: active_state}
+
+    async def is_enabled(_unit):
+        return enabled
+
+    with (
+        mock.patch.object(health.units, "active_states", active_states),
+        mock.patch.object(health.units, "is_enabled", is_enabled),
+        mock.patch.object(health.Path, "read_text", return_value=flags),
+    ):
+        return health.probe_tun0()
+
+
+def test_tun0_of_a_disabled_vpn():
+    assert _probe_tun0("inactive", enabled=False)[0] == health.DISABLED
+
+
+def test_tun0_of_an_enabled_vpn():
+    assert _probe_tun0("active", enabled=True)[0] == health.OK
+    assert _probe_tun0("active", enabled=True, flags="0x1002")[0] == health.DOWN
+    # Enabled but failed, the tunnel should be up
+    assert _probe_tun0("failed", enabled=True, flags="0x1002")[0] == health.DOWN
@@ -0,0 +1,250 @@
+import asyncio
+import gzip
+import socket
+import struct
+import threading
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import pytest
+
+from app.iptv.host import PlaylistCache, ProxyHost, Tenant
+
+GUIDE = b'<?xml version="1.0"?><tv><channel id="one"/></tv>'
+
+STREAM = b"\x47" * 188 * 10  # ten MPEG-TS packets
+
+
+class Upstream:
+    """
+    Local stand-in for an IPTV provider, records the path and headers of every request.
+    """
+
+    def __init__(self):
+        self.requests = []
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    def close(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handler(self):
+        upstream = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                upstream.requests.append((self.path, self.headers))
+                headers = {"Content-Type": "video/mp2t"}
+                if self.path.startswith("/playlist.m3u"):
+                    body = f"#EXTM3U\n#EXTINF:-1,One\n{upstream.url}/streams/one.ts?token=1\n".encode()
+                    headers["Content-Type"] = "audio/x-mpegurl"
+                elif self.path.startswith("/xmltv.php"):
+                    body = b"<tv/>"
+                    headers["Content-Type"] = "application/xml"
+                elif self.path == "/streams/one.ts?token=1" or self.path.startswith("/live/"):
+                    body = STREAM
+                    # Some providers compress no matter what the client accepts
+                    if "gzip" in self.path:
+                        body = gzip.compress(body)
+                        headers["Content-Encoding"] = "gzip"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                for name, value in {**headers, "Content-Length": str(len(body))}.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def upstream():
+    server = Upstream()
+    yield server
+    server.close()
+
+
+def _tenant(upstream: Upstream, port: int, password: str = "secret", xtream: bool = True) -> Tenant:
+    return Tenant(
+        port=port,
+        advertised_port=port,
+        hostname="proxy.local",
+        user="user",
+        password=password,
+        m3u_url=f"{upstream.url}/playlist.m3u",
+        xtream_base_url=upstream.url if xtream else None,
+        xtream_user="xuser",
+        xtream_password="xpass",
+        cache_hours=1,
+    )
+
+
+def _serve(tenant: Tenant, tmp_path, *requests) -> list:
+    """
+    Runs a host with the one tenant and returns the response to every request, a path to GET or a
+    (method, path, headers) tuple.
+    """
+
+    async def run():
+        host = ProxyHost(str(tmp_path), tmp_path, guide_dir=tmp_path)
+        async with httpx.AsyncClient() as host.client:
+            host.playlists = PlaylistCache(host.client, tmp_path)
+            await host.apply({tenant.port: tenant})
+            try:
+                async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{tenant.port}") as player:
+                    responses = []
+                    for request in requests:
+                        method, path, headers = ("GET", request, {}) if isinstance(request, str) else request
+                        responses.append(await player.request(method, path, headers=headers))
+                    return responses
+            finally:
+                for server in host.servers.values():
+                    server.close()
+
+    return asyncio.run(run())
+
+
+def test_playlist_points_to_the_proxy(upstream, tmp_path):
+    tenant = _tenant(upstream, _free_port())
+    (response,) = _serve(tenant, tmp_path, "/get.php?username=user&password=secret")
+    assert response.status_code == 200
+    assert response.text.splitlines() == [
+        "#EXTM3U",
+        "#EXTINF:-1,One",
+        f"http://proxy.local:{tenant.port}/user/secret/0/one.ts",
+    ]
+
+
+def test_wrong_credentials_are_rejected(upstream, tmp_path):
+    tenant = _tenant(upstream, _free_port())
+    responses = _serve(
+        tenant,
+        tmp_path,
+        "/iptv.m3u?username=user&password=wrong",
+        "/user/wrong/0/one.ts",
+        "/live/user/wrong/42.ts",
+        "/player_api.php?username=other&password=secret",
+    )
+    assert [response.status_code for response in responses] == [401, 401, 401, 401]
+    assert upstream.requests == []
+
+
+def test_playlist_stream_is_relayed(upstream, tmp_path):
+    tenant = _tenant(upstream, _free_port())
+    (response,) = _serve(tenant, tmp_path, "/user/secret/0/one.ts")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "video/mp2t"
+    assert response.content == STREAM
+    assert [path for path, _headers in upstream.requests] == ["/playlist.m3u", "/streams/one.ts?token=1"]
+
+
+def test_unknown_stream_index(upstream, tmp_path):
+    tenant = _tenant(upstream, _free_port(), xtream=False)
+    (response,) = _serve(tenant, tmp_path, "/user/secret/5/one.ts")
+    assert response.status_code == 404
+
+
+def test_xtream_stream_with_numeric_password(upstream, tmp_path):
+    tenant = _tenant(upstream, _free_port(), password="1234")
+    (response,) = _serve(tenant, tmp_path, "/live/user/1234/42.ts")
+    assert response.status_code == 200
+    assert response.content == STREAM
+    # The provider credentials replace those of the proxy
+    assert [path for path, _headers in upstream.requests] == ["/live/xuser/xpass/42.ts"]
+
+
+def test_relay_keeps_the_upstream_encoding(upstream, tmp_path):
+    tenant = _tenant(upstream, _free_port())
+    (response,) = _serve(tenant, tmp_path, "/live/user/secret/gzip.ts")
+    # Uncompressed is requested upstream, a compressed body is relayed together with its encoding
+    assert upstream.requests[0][1]["Accept-Encoding"] == "identity"
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.content == STREAM
+
+
+def _cache_guide(tenant: Tenant, tmp_path, guide_url: str) -> None:
+    # The files written by epg.build_guide(), only the start of the index header is read by the host
+    (tmp_path / f"epg-{tenant.port}.xml.gz").write_bytes(gzip.compress(GUIDE))
+    header = struct.pack("<4sIdII", b"SCE1", zlib.crc32(guide_url.encode()), 0.0, 1, 0)
+    (tmp_path / f"epg-{tenant.port}.idx").write_bytes(header)
+
+
+def test_cached_guide_is_served(upstream, tmp_path):
+    tenant = _tenant(upstream, _free_port())
+    _cache_guide(tenant, tmp_path, f"{upstream.url}/xmltv.php?username=xuser&password=xpass")
+    path = "/xmltv.php?username=user&password=secret"
+    compressed, identity, head = _serve(
+        tenant,
+        tmp_path,
+        ("GET", path, {"Accept-Encoding": "gzip"}),
+        ("GET", path, {"Accept-Encoding": "identity"}),
+        ("HEAD", path, {"Accept-Encoding": "gzip"}),
+    )
+    assert compressed.headers["content-encoding"] == "gzip"
+    assert compressed.content == GUIDE
+    assert "content-encoding" not in identity.headers
+    assert identity.content == GUIDE
+    assert head.status_code == 200
+    assert head.content == b""
+    assert upstream.requests == []
+
+
+def test_guide_of_another_account_is_relayed(upstream, tmp_path):
+    tenant = _tenant(upstream, _free_port())
+    _cache_guide(tenant, tmp_path, f"{upstream.url}/xmltv.php?username=old&password=xpass")
+    (response,) = _serve(tenant, tmp_path, "/xmltv.php?username=user&password=secret")
+    assert response.content == b"<tv/>"
+    assert [path for path, _headers in upstream.requests] == ["/xmltv.php?username=xuser&password=xpass"]
+
+
+def test_head_of_the_playlist(upstream, tmp_path):
+    tenant = _tenant(upstream, _free_port())
+    (response,) = _serve(tenant, tmp_path, ("HEAD", "/iptv.m3u?username=user&password=secret", {}))
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "audio/x-mpegurl"
+    assert response.content == b""
+
+
+def test_unavailable_playlist(upstream, tmp_path):
+    tenant = _tenant(upstream, _free_port())._replace(m3u_url=f"http://127.0.0.1:{_free_port()}/playlist.m3u")
+    (response,) = _serve(tenant, tmp_path, "/user/secret/0/one.ts")
+    assert response.status_code == 502
+
+
+def test_restart_drops_only_the_playlist_of_the_proxy(upstream, tmp_path):
+    first, second = _tenant(upstream, _free_port()), _tenant(upstream, _free_port())
+    second = second._replace(m3u_url=f"{upstream.url}/playlist.m3u?second")
+
+    async def run():
+        host = ProxyHost(str(tmp_path), tmp_path)
+        async with httpx.AsyncClient() as host.client:
+            host.playlists = PlaylistCache(host.client, tmp_path)
+            await host.apply({first.port: first, second.port: second})
+            try:
+                await host.playlists.get(first.m3u_url, 3600)
+                await host.playlists.get(second.m3u_url, 3600)
+                # The API touched the script of the first proxy
+                await host.apply({first.port: first._replace(version=1), second.port: second})
+                return set(host.playlists._playlists)
+            finally:
+                for server in host.servers.values():
+                    server.close()
+
+    assert asyncio.run(run()) == {second.m3u_url}
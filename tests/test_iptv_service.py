@@ -0,0 +1,113 @@
+import asyncio
+from unittest import mock
+
+import harness
+import pytest
+
+from app.core.systemd import UnitManager
+from app.iptv import service
+from app.iptv.schemas import ActivationMode, IPTVProxyCreate
+
+
+@pytest.fixture
+def bus(tmp_path):
+    """
+    The systemd manager of the proxies, with the scripts and units in tmp_path.
+    """
+    bus = harness.FakeSystemdBus()
+    manager = UnitManager([lambda: bus])
+    (tmp_path / "systemd").mkdir()
+    (tmp_path / "bin").mkdir()
+    with (
+        mock.patch.object(service, "units", manager),
+        mock.patch.object(service, "SERVICE_DIR", str(tmp_path / "systemd")),
+        mock.patch.object(service, "SCRIPT_DIR", str(tmp_path / "bin")),
+        mock.patch.object(service, "_templates_checked", False),
+    ):
+        yield bus
+    if manager._loop is not None:
+        manager._loop.call_soon_threadsafe(manager._loop.stop)
+
+
+def _proxy(name: str, activation: ActivationMode = ActivationMode.ALWAYS) -> IPTVProxyCreate:
+    return IPTVProxyCreate(
+        name=name,
+        user="user",
+        password="secret",
+        hostname="proxy.local",
+        m3u_url="http://provider.example/playlist.m3u",
+        activation=activation,
+        memory_max=None if activation == ActivationMode.SHARED else 64,
+    )
+
+
+def test_bulk_creation(bus):
+    result = service.create_services([_proxy("One"), _proxy("Two", ActivationMode.ON_DEMAND)], validate=False)
+
+    assert result.result == "ok"
+    assert [item.service_name for item in result.items] == ["iptv-proxy@9000.service", "iptv-proxy@9001.socket"]
+    assert sorted(service._get_ports()) == [9000, 9001]
+    assert bus.unit_files["iptv-proxy@9001.socket"] == "enabled"
+    assert bus.active["iptv-proxy@9000.service"] == "active"
+
+
+def test_failed_start_rolls_back_the_batch(bus):
+    bus.failing.add("iptv-proxy@9001.socket")
+    result = service.create_services(
+        [_proxy("One"), _proxy("Two", ActivationMode.ON_DEMAND), _proxy("Three", ActivationMode.SHARED)],
+        validate=False,
+    )
+
+    assert result.result == "rolled_back"
+    assert [item.result for item in result.items] == ["rolled_back", "failed", "rolled_back"]
+    assert service._get_ports() == []
+    # Every unit of the batch is stopped and disabled again, the host of the shared proxies keeps running
+    assert bus.active["iptv-proxy@9000.service"] == "inactive"
+    assert bus.unit_files["iptv-proxy@9000.service"] == "disabled"
+    assert bus.unit_files["iptv-proxy@9001.socket"] == "disabled"
+    assert bus.active.get(service.HOST_UNIT) == "active"
+    assert bus.calls["dbus StopUnit"] == 4
+
+
+def test_rejected_upstream_creates_nothing(bus):
+    check = mock.Mock(ok=False, detail="Upstream answered 403")
+    with mock.patch.object(service.upstream, "validate_upstreams", return_value=[check]):
+        result = service.create_services([_proxy("One")])
+
+    assert result.result == "rejected"
+    assert service._get_ports() == []
+    assert sum(bus.calls.values()) == 0
+
+
+def _detect_crash_loops_at(now: float) -> None:
+    with mock.patch.object(service.time, "monotonic", return_value=now):
+        asyncio.run(service.detect_crash_loops())
+
+
+def test_crash_loop_within_the_window_suspends_the_proxy(bus, tmp_path):
+    service.create_services([_proxy("One")], validate=False)
+    unit = "iptv-proxy@9000.service"
+    service._restart_samples.clear()
+
+    # Restarts spread over more than the window are no crash loop
+    for now, restarts in ((0, 0), (600, 9), (1000, 12)):
+        bus.properties[unit] = {"NRestarts": restarts}
+        _detect_crash_loops_at(now)
+    assert bus.active[unit] == "active"
+
+    bus.properties[unit] = {"NRestarts": 19}
+    _detect_crash_loops_at(1100)
+    assert bus.active[unit] == "inactive"
+    assert bus.unit_files[unit] == "disabled"
+    assert "# Suspended: 10 restarts within 15 minutes\n" in (tmp_path / "bin" / "iptv-proxy-9000.sh").read_text()
+
+
+def test_manual_start_resets_the_crash_loop_window(bus):
+    service.create_services([_proxy("One")], validate=False)
+    unit = "iptv-proxy@9000.service"
+    service._restart_samples.clear()
+
+    for now, restarts in ((0, 8), (60, 0), (120, 9)):
+        bus.properties[unit] = {"NRestarts": restarts}
+        _detect_crash_loops_at(now)
+    assert bus.active[unit] == "active"
@@ -0,0 +1,59 @@
+import asyncio
+from unittest import mock
+
+import harness
+import pytest
+
+from app.iptv import upstream
+from app.iptv.schemas import IPTVProxyCreate
+from app.iptv.upstream import INVALID, UNREACHABLE, VALID, UpstreamCheck
+
+
+@pytest.fixture(autouse=True)
+def results():
+    upstream._results.clear()
+    yield upstream._results
+    upstream._results.clear()
+
+
+def _proxy(m3u_url: str) -> IPTVProxyCreate:
+    return IPTVProxyCreate(name="One", user="user", password="secret", hostname="proxy.local", m3u_url=m3u_url)
+
+
+def _checks_at(now: float, data: IPTVProxyCreate, result: UpstreamCheck) -> int:
+    """
+    Checks the upstream at the given time, returns whether it was requested or served from the cache.
+    """
+    check = mock.AsyncMock(return_value=result)
+    with (
+        mock.patch.object(upstream, "_check_m3u", check),
+        mock.patch.object(upstream.time, "monotonic", return_value=now),
+    ):
+        assert asyncio.run(upstream.check_upstream(data)) == result
+    return check.await_count
+
+
+@pytest.mark.parametrize(
+    "status, ttl",
+    [(VALID, upstream.VALID_TTL), (INVALID, upstream.INVALID_TTL), (UNREACHABLE, upstream.UNREACHABLE_TTL)],
+)
+def test_results_are_cached_for_their_ttl(status, ttl):
+    data = _proxy("http://provider.example/playlist.m3u")
+    result = UpstreamCheck(status, "checked")
+    assert _checks_at(1000, data, result) == 1
+    assert _checks_at(1000 + ttl - 1, data, result) == 0
+    assert _checks_at(1000 + ttl, data, result) == 1
+
+
+def test_other_credentials_are_checked_again():
+    result = UpstreamCheck(VALID, "checked")
+    assert _checks_at(1000, _proxy("http://provider.example/get.php?username=a"), result) == 1
+    assert _checks_at(1000, _proxy("http://provider.example/get.php?username=b"), result) == 1
+
+
+def test_playlist_check_against_the_provider():
+    with harness.PlaylistServer(channels=10) as provider:
+        base_url = provider.url.rsplit("/", 1)[0]
+        valid, missing = upstream.validate_upstreams([_proxy(provider.url), _proxy(f"{base_url}/missing.m3u")])
+    assert valid.status == VALID
+    assert (missing.status, missing.detail) == (INVALID, "Playlist URL answered HTTP 404")
@@ -0,0 +1,30 @@
+import logging
+
+from app.core.logger import RateLimitFilter, _is_health_check
+
+
+def _record(message: str, level: int = logging.WARNING) -> logging.LogRecord:
+    return logging.LogRecord("app", level, "/src/app/iptv/health.py", 105, message, None, None)
+
+
+def test_repeated_messages_of_one_call_are_limited():
+    rate_limit = RateLimitFilter(window=60, burst=2)
+    records = [_record("Proxy on port 9000 failed") for _ in range(4)]
+    assert [rate_limit.filter(record) for record in records] == [True, True, False, False]
+
+    # The same call logging another proxy, and another call site, have their own budget
+    assert rate_limit.filter(_record("Proxy on port 9001 failed"))
+    other = logging.LogRecord("app", logging.WARNING, "/src/app/wifi/service.py", 42, "Cannot enable", None, None)
+    assert rate_limit.filter(other)
+
+
+def test_errors_always_pass():
+    rate_limit = RateLimitFilter(window=60, burst=1)
+    assert all(rate_limit.filter(_record("Proxy on port 9000 failed", logging.ERROR)) for _ in range(3))
+
+
+def test_health_checks_below_the_prefix():
+    assert _is_health_check("/api/v1/health")
+    assert _is_health_check("/api/v1/health/ready")
+    assert not _is_health_check("/api/v1/iptv/health")
+    assert not _is_health_check("/api/v1/healthy")
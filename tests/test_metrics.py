@@ -0,0 +1,63 @@
+import json
+import os
+import threading
+import time
+from unittest import mock
+
+import pytest
+
+from app.core import metrics
+
+
+def test_metric_base_is_abstract():
+    with pytest.raises(TypeError):
+        metrics._Metric("streamcloak_test", "Not a concrete metric.")
+
+
+def test_render_adds_up_the_workers(tmp_path):
+    requests = metrics.Counter("streamcloak_test_requests_total", "Test requests.", ["route"])
+    requests.labels("/a").inc(2)
+    other_worker = [
+        [
+            "streamcloak_test_requests_total",
+            "counter",
+            "Test requests.",
+            [
+                ["streamcloak_test_requests_total", {"route": "/a"}, 3],
+                ["streamcloak_test_requests_total", {"route": "/b"}, 1],
+            ],
+        ]
+    ]
+    # The parent process stands in for a running worker, a pid above the kernel limit for one that died
+    (tmp_path / f"{os.getppid()}.json").write_text(json.dumps(other_worker))
+    dead_worker = tmp_path / "4194304.json"
+    dead_worker.write_text(json.dumps(other_worker))
+
+    try:
+        with mock.patch.object(metrics, "_snapshot_path", tmp_path / f"{os.getpid()}.json"):
+            lines = metrics.render().splitlines()
+    finally:
+        metrics._metrics.remove(requests)
+
+    assert 'streamcloak_test_requests_total{route="/a"} 5' in lines
+    assert 'streamcloak_test_requests_total{route="/b"} 1' in lines
+    assert lines.count("# TYPE streamcloak_test_requests_total counter") == 1
+    assert not dead_worker.exists()
+
+
+def test_idle_worker_keeps_its_snapshot(tmp_path):
+    path = tmp_path / f"{os.getpid()}.json"
+    with (
+        mock.patch.object(metrics, "SNAPSHOT_INTERVAL", 0.01),
+        mock.patch.object(metrics, "_families", return_value=[]),
+        mock.patch.object(metrics.os, "replace", wraps=os.replace) as replace,
+    ):
+        thread = threading.Thread(target=metrics._publish_snapshots, args=(path,))
+        thread.start()
+        time.sleep(0.2)
+        metrics._snapshot_stop.set()
+        thread.join()
+    metrics._snapshot_stop.clear()
+
+    assert replace.call_count == 1
+    assert json.loads(path.read_text()) == []
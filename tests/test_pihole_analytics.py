@@ -0,0 +1,73 @@
+import random
+from collections import Counter
+from unittest import mock
+
+from app.pihole import analytics
+from app.pihole.analytics import TopCounter
+from app.pihole.client import PiholeClient
+from app.pihole.schemas import QueryWindow
+
+
+def _domains(count: int) -> list:
+    # Long tail like real DNS traffic: a few domains make up most queries
+    rng = random.Random(42)
+    return [f"domain{int(rng.paretovariate(1.2))}.example" for _ in range(count)]
+
+
+def test_top_counter_error_bounds():
+    stream = _domains(20_000)
+    exact = Counter(stream)
+    top = TopCounter(capacity=32)
+    for domain in stream:
+        top.add(domain)
+
+    entries = top.top(32)
+    assert len(entries) == 32 < len(exact)
+    for entry in entries:
+        # Overestimated by at most its error, which is at most the stream length over the slots
+        assert exact[entry["name"]] <= entry["count"] <= exact[entry["name"]] + entry["error"]
+        assert entry["error"] <= len(stream) / 32
+    # Every key more frequent than that bound is tracked
+    tracked = {entry["name"] for entry in entries}
+    assert {domain for domain, count in exact.items() if count > len(stream) / 32} <= tracked
+    assert entries[0] == {"name": exact.most_common(1)[0][0], "count": exact.most_common(1)[0][1], "error": 0}
+
+
+def test_top_counter_is_exact_below_its_capacity():
+    top = TopCounter(capacity=8)
+    for domain in ["a", "b", "a", "c", "a", "b"]:
+        top.add(domain)
+    assert top.top(2) == [{"name": "a", "count": 3, "error": 0}, {"name": "b", "count": 2, "error": 0}]
+
+
+def test_iter_queries_pins_the_cursor():
+    pages = [
+        {"queries": [{"id": 5}, {"id": 4}], "cursor": 5},
+        {"queries": [{"id": 3}, {"id": 2}], "cursor": 9},
+        {"queries": [{"id": 1}], "cursor": 9},
+    ]
+    requests = []
+
+    def request(method, endpoint, params=None):
+        requests.append(dict(params))
+        return pages[len(requests) - 1]
+
+    client = PiholeClient()
+    with mock.patch.object(client, "_request", request):
+        assert [query["id"] for query in client.iter_queries(100, 200, page_size=2)] == [5, 4, 3, 2, 1]
+    assert [(params["start"], params.get("cursor")) for params in requests] == [(0, None), (2, 5), (4, 5)]
+
+
+def test_aggregates_of_a_window():
+    queries = [
+        {"domain": "ads.example", "status": "GRAVITY", "client": {"ip": "192.168.1.10"}},
+        {"domain": "ads.example", "status": "GRAVITY", "client": {"ip": "192.168.1.11"}},
+        {"domain": "news.example", "status": "FORWARDED", "client": {"ip": "192.168.1.10"}},
+    ]
+    client = mock.Mock(iter_queries=mock.Mock(return_value=iter(queries)))
+    analytics.aggregate_cache.invalidate(QueryWindow.HOUR)
+
+    data = analytics.get_query_aggregates(client, QueryWindow.HOUR, 1)
+    assert (data["total_queries"], data["blocked_queries"]) == (3, 2)
+    assert data["top_clients"] == [{"name": "192.168.1.10", "count": 2, "error": 0}]
+    assert data["top_blocked_domains"] == [{"name": "ads.example", "count": 2, "error": 0}]
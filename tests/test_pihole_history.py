@@ -0,0 +1,29 @@
+from app.pihole.history import PiholeHistory
+from app.pihole.schemas import HistoryResolution
+
+DAY = 24 * 60 * 60
+
+
+def test_buckets_hold_the_increase_of_the_daily_counters(tmp_path):
+    history = PiholeHistory(tmp_path / "history.bin")
+    midnight = 100 * DAY
+    # queries and blocked of today, FTL starts again from zero at midnight
+    history.record(midnight - 120, 1000, 100, 2)
+    history.record(midnight - 60, 1300, 130, 4)
+    history.record(midnight, 50, 5, 3)
+    history.record(midnight + 60, 80, 7, 3)
+
+    points = history.read(HistoryResolution.DAY, midnight - DAY, midnight + 60)
+    assert [(point["dns_queries"], point["ads_blocked"]) for point in points] == [(300, 30), (80, 7)]
+    assert points[0]["active_clients"] == 3.0
+    assert points[0]["active_clients_max"] == 4
+
+
+def test_queries_of_a_gap_are_left_out(tmp_path):
+    history = PiholeHistory(tmp_path / "history.bin")
+    history.record(DAY, 1000, 100, 1)
+    history.record(DAY + 3600, 5000, 400, 1)
+    history.record(DAY + 3660, 5100, 410, 1)
+
+    points = history.read(HistoryResolution.MINUTE, DAY, DAY + 3660)
+    assert [(point["dns_queries"], point["ads_blocked"]) for point in points] == [(0, 0), (0, 0), (100, 10)]
@@ -0,0 +1,82 @@
+import asyncio
+from unittest import mock
+
+import harness
+import pytest
+
+from app.iptv import playlist, service
+
+PORT = 9001
+CHANNELS = 40
+
+
+@pytest.fixture
+def index_dir(tmp_path):
+    with mock.patch.object(playlist, "INDEX_DIR", tmp_path):
+        yield tmp_path
+
+
+@pytest.fixture
+def provider():
+    with harness.PlaylistServer(channels=CHANNELS) as server:
+        yield server
+
+
+def test_parser_handles_entries_split_across_chunks():
+    parser = playlist.M3UParser()
+    channels = []
+    for chunk in harness.m3u_playlist(CHANNELS):
+        # Chunks of a download end anywhere, also within a line
+        for start in range(0, len(chunk), 7):
+            channels.extend(parser.feed(chunk[start : start + 7]))
+    channels.extend(parser.close())
+
+    assert parser.count == len(channels) == CHANNELS
+    # #EXTGRP and no tvg-id
+    assert channels[0] == (b"News Channel 0 HD", b"News", b"")
+    assert channels[10] == (b"Movies Channel 10 HD", b"Movies", b"ch10.example")
+    assert channels[14] == (b"DE Channel 14 HD", b"DE | Regional", b"")
+    assert channels[15] == (b"UK Channel 15 HD", b"UK | Entertainment", b"ch15.example")
+
+
+def test_search_by_prefix_and_group(index_dir, provider):
+    assert asyncio.run(playlist.build_index(PORT, provider.url)) == CHANNELS
+    index = playlist.channel_indexes.get(PORT)
+
+    assert index.groups() == [(group, CHANNELS // len(harness.M3U_GROUPS)) for group in sorted(harness.M3U_GROUPS)]
+
+    total, channels = index.search("news channel 1")
+    assert (total, channels) == (1, [playlist.Channel("News Channel 16 HD", "News", "ch16.example")])
+
+    total, channels = index.search(group="News", offset=1, limit=2)
+    assert total == 5
+    assert [channel.name for channel in channels] == ["News Channel 16 HD", "News Channel 24 HD"]
+
+    total, channels = index.search("uk", group="UK | Entertainment")
+    assert total == 5
+    assert all(channel.group == "UK | Entertainment" for channel in channels)
+    assert index.search("news", group="Sports") == (0, [])
+    assert index.search(group="Unknown") == (0, [])
+
+
+def test_index_is_rebuilt_when_the_url_changes(index_dir, provider):
+    url = provider.url
+
+    def script(_path):
+        return {"m3u_url": url}
+
+    with (
+        mock.patch.object(service, "_get_ports", return_value={PORT}),
+        mock.patch.object(service, "_parse_script_content", script),
+    ):
+        asyncio.run(service.refresh_channel_indexes())
+        asyncio.run(service.refresh_channel_indexes())
+        assert provider.requests == 1
+
+        with harness.PlaylistServer(channels=CHANNELS // 2) as other_provider:
+            url = other_provider.url
+            assert not playlist.index_is_current(PORT, url, 3600)
+            asyncio.run(service.refresh_channel_indexes())
+
+    assert playlist.index_is_current(PORT, url, 3600)
+    assert playlist.channel_indexes.get(PORT).channel_count == CHANNELS // 2
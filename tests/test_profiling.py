@@ -0,0 +1,30 @@
+from app.core.profiling import ProfileStore
+
+
+def _profile(profile_id: str) -> dict:
+    return {"id": profile_id, "method": "GET", "path": "/api/v1/clients", "stacks": {"main;handler": 3}}
+
+
+def test_profiles_are_shared_by_the_workers(tmp_path):
+    # One store per worker on the same directory
+    first, second = ProfileStore(tmp_path, maxlen=2), ProfileStore(tmp_path, maxlen=2)
+    first.add(_profile("a1"))
+    assert second.get("a1")["stacks"] == {"main;handler": 3}
+    assert [profile["id"] for profile in second.list()] == ["a1"]
+    assert "stacks" not in second.list()[0]
+
+    second.clear()
+    assert first.get("a1") is None
+
+
+def test_oldest_profiles_are_dropped(tmp_path):
+    store = ProfileStore(tmp_path, maxlen=2)
+    for profile_id in ("a1", "a2", "a3"):
+        store.add(_profile(profile_id))
+    assert {profile["id"] for profile in store.list()} == {"a2", "a3"}
+
+
+def test_ids_never_leave_the_directory(tmp_path):
+    store = ProfileStore(tmp_path / "profiles", maxlen=2)
+    (tmp_path / "secret.json").write_text("{}")
+    assert store.get("../secret") is None
@@ -0,0 +1,43 @@
+from unittest import mock
+
+from app.core import rate_limit
+from app.core.rate_limit import RateLimiter
+
+
+def _hits(limiter: RateLimiter, times) -> list:
+    results = []
+    for now in times:
+        with mock.patch.object(rate_limit.time, "time", return_value=now):
+            results.append(limiter.hit("192.168.1.10"))
+    return results
+
+
+def test_burst_is_rejected_until_refilled(tmp_path):
+    limiter = RateLimiter("login", rate=0.5, burst=2, path=tmp_path / "login.json")
+    assert _hits(limiter, [100, 100, 100]) == [0, 0, 2.0]
+    # One token after two seconds, not two
+    assert _hits(limiter, [102, 102]) == [0, 2.0]
+
+
+def test_workers_share_the_buckets(tmp_path):
+    # One limiter per worker on the same file
+    first = RateLimiter("login", rate=0.5, burst=2, path=tmp_path / "login.json")
+    second = RateLimiter("login", rate=0.5, burst=2, path=tmp_path / "login.json")
+    assert _hits(first, [100, 100]) == [0, 0]
+    assert _hits(second, [100]) == [2.0]
+
+
+def test_window_cap(tmp_path):
+    limiter = RateLimiter("login", rate=10, burst=10, window=60, window_limit=3, path=tmp_path / "login.json")
+    assert _hits(limiter, [100, 101, 102, 103]) == [0, 0, 0, 57]
+    # Half of the previous window still counts
+    assert _hits(limiter, [190, 191, 192]) == [0, 0, 28]
+
+
+def test_least_recently_used_key_is_evicted(tmp_path):
+    limiter = RateLimiter("login", rate=0.1, burst=1, max_keys=2, path=tmp_path / "login.json")
+    with mock.patch.object(rate_limit.time, "time", return_value=100):
+        assert [limiter.hit(key) for key in ("a", "b", "c")] == [0, 0, 0]
+        # 'a' was evicted and starts with a full bucket again, 'c' has none left
+        assert limiter.hit("a") == 0
+        assert limiter.hit("c") == 10
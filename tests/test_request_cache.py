@@ -0,0 +1,62 @@
+import asyncio
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.core.request_cache import RequestCacheMiddleware, invalidate, request_cached, request_scope
+
+calls = []
+
+
+@request_cached("test.state", key=lambda unit: unit)
+def read_state(unit: str) -> str:
+    calls.append(unit)
+    return f"{unit} #{len(calls)}"
+
+
+@request_cached("test.config")
+def read_config() -> str:
+    calls.append("config")
+    return f"config #{len(calls)}"
+
+
+def setup_function():
+    calls.clear()
+
+
+def test_calls_outside_a_request_go_through():
+    assert read_state("a") != read_state("a")
+
+
+def test_invalidation_drops_only_its_namespace():
+    with request_scope():
+        assert read_state("a") == read_state("a") == "a #1"
+        read_config()
+        invalidate("test.state")
+        assert read_state("a") == "a #3"
+        assert read_config() == "config #2"
+
+        invalidate()
+        assert read_config() == "config #4"
+
+
+def test_requests_do_not_share_results():
+    app = FastAPI()
+    app.add_middleware(RequestCacheMiddleware)
+
+    @app.get("/state")
+    def state():
+        # Sync endpoint, runs in the threadpool with the store of its request
+        first = read_state("a")
+        invalidate("test.state")
+        return [first, read_state("a"), read_state("a")]
+
+    @app.get("/async-state")
+    async def async_state():
+        first = read_state("a")
+        return [first, await asyncio.to_thread(read_state, "a")]
+
+    with TestClient(app) as client:
+        assert client.get("/state").json() == ["a #1", "a #2", "a #2"]
+        assert client.get("/state").json() == ["a #3", "a #4", "a #4"]
+        assert client.get("/async-state").json() == ["a #5", "a #5"]
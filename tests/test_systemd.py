@@ -0,0 +1,103 @@
+import asyncio
+import time
+
+import harness
+import pytest
+
+from app.core.systemd import UnitError, UnitManager
+
+
+class UnavailableBus:
+    """
+    A bus whose connection fails, like D-Bus without dbus-fast or the socket.
+    """
+
+    on_job_removed = None
+
+    async def connect(self) -> None:
+        raise OSError("no such file or directory: /run/dbus/system_bus_socket")
+
+
+class EarlySignalBus(harness.FakeSystemdBus):
+    """
+    Sends JobRemoved before the reply with the job path, as it happens for jobs that finish at once.
+    """
+
+    async def call(self, member: str, signature: str = "", *args) -> list:
+        reply = await super().call(member, signature, *args)
+        if member == "StartUnit":
+            job = reply[0]
+            self.on_job_removed(int(job.rsplit("/", 1)[1]), job, args[0], "done")
+        return reply
+
+
+@pytest.fixture
+def manager_for():
+    managers = []
+
+    def create(*buses) -> UnitManager:
+        manager = UnitManager([lambda bus=bus: bus for bus in buses])
+        managers.append(manager)
+        return manager
+
+    yield create
+    for manager in managers:
+        if manager._loop is not None:
+            manager._loop.call_soon_threadsafe(manager._loop.stop)
+
+
+def test_concurrent_reloads_are_coalesced(manager_for):
+    bus = harness.FakeSystemdBus(latency=0.01)
+    manager = manager_for(bus)
+
+    async def enable_all():
+        await asyncio.gather(*(manager.enable(f"iptv-proxy-{port}.service") for port in range(9000, 9005)))
+
+    asyncio.run(enable_all())
+    # The first reload runs alone, the four requests that arrived meanwhile share the next one
+    assert bus.reloads == 2
+    assert bus.calls["dbus EnableUnitFiles"] == 5
+
+    manager.run(manager.disable("iptv-proxy-9000.service", reload=False))
+    assert bus.reloads == 2
+    assert bus.unit_files["iptv-proxy-9000.service"] == "disabled"
+
+
+def test_jobs_wait_for_job_removed(manager_for):
+    bus = harness.FakeSystemdBus(job_latency=0.1)
+    bus.failing.add("failing.service")
+    bus.missing.add("missing.service")
+    manager = manager_for(bus)
+
+    started_at = time.monotonic()
+    assert manager.run(manager.start("hostapd.service"))
+    assert time.monotonic() - started_at >= 0.1
+    assert bus.active["hostapd.service"] == "active"
+
+    assert manager.run(manager.start_each("hostapd.service", "failing.service", "missing.service")) == {
+        "hostapd.service": "done",
+        "failing.service": "failed",
+        "missing.service": "error",
+    }
+    assert not manager.run(manager.restart("hostapd.service", timeout=0.01))
+    assert manager._jobs == {}
+
+
+def test_job_removed_before_the_reply(manager_for):
+    manager = manager_for(EarlySignalBus(job_latency=5))
+    started_at = time.monotonic()
+    assert manager.run(manager.start("hostapd.service"))
+    assert time.monotonic() - started_at < 1
+    assert manager._finished == {}
+
+
+def test_falls_back_to_the_next_bus(manager_for):
+    bus = harness.FakeSystemdBus()
+    bus.add_unit("hostapd.service", active="inactive")
+    manager = manager_for(UnavailableBus(), bus)
+    assert manager.run(manager.active_states("hostapd.service")) == {"hostapd.service": "inactive"}
+    assert manager._bus is bus
+
+    with pytest.raises(UnitError):
+        unavailable = manager_for(UnavailableBus())
+        unavailable.run(unavailable.active_states("hostapd.service"))